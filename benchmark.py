@@ -0,0 +1,21 @@
+from __future__ import division #makes it so that / is always floating point ("normal") division, and // is integer division
+import sys
+from mathspring import benchmark #Makes up studies of different sizes (see mathspring/synthetic.py) and times each stage on them
+
+###############################################################################
+###                            Configuration Area                           ###
+###############################################################################
+
+folder = "benchmark" #Where the made-up studies, their output and the results go
+sizes = (100, 1000, 10000) #How many students to make up for each run; each has about 200 event log rows
+processes = 1 #How many processes the stages can use
+permutations = 1000 #How many shuffles to do for the pedagogy permutation test
+output_format = "csv" #What to write the workbook as ("xlsx" takes most of the time at the bigger sizes)
+
+###############################################################################
+###                          End Configuration Area                         ###
+###############################################################################
+
+#Run with --help to see the options, e.g. "python benchmark.py --sizes 100 1000 --baseline benchmark/benchmark-abc1234.json"
+if __name__ == "__main__":
+	sys.exit(benchmark.main(sys.argv[1:], folder, sizes, processes=processes, permutations=permutations, output_format=output_format))
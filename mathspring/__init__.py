@@ -0,0 +1 @@
+#Shared pieces of the Mathspring data processing scripts
@@ -0,0 +1,218 @@
+#Running many studies at once over one shared data pull
+#Each study is defined by a JSON file with the settings that make it its own study, e.g.
+#	{"time_ranges": [["2016-12-01", "2016-12-02"]], "classes": [1284, 1285], "exclude_student_ids": [36787],
+#	 "prepost_corrections_file": "corrections.tsv", "prepost_categories_inv": {"Interest": [176]},
+#	 "category_order": ["Interest", "Score"], "learning_estimation": {"36751": 38.9}, "output_file": "study.xlsx"}
+#Any other setting from the script's Configuration Area can be given too; the rest come from the script,
+# and relative file names are relative to the study file
+#The event log for every study's classes and days is pulled and processed once, then each study picks out its own rows:
+# a student whose rows all fall inside the study's days gets a copy of the shared processing, and only the students
+# that lose some of their rows to the study's days are processed again
+#The rest of the stages are then run for each study in parallel, in separate processes
+from __future__ import division
+from datetime import date
+import copy, cPickle, json, os, sys, multiprocessing
+from mathspring import eventlog, pipeline
+
+def parseDate(text):
+	year, month, day = (int(part) for part in text.split("-"))
+	return date(year, month, day)
+
+#Reads a study file into a copy of base_config
+def loadStudy(path, base_config):
+	with open(path) as f:
+		settings = json.load(f)
+	folder = os.path.dirname(os.path.abspath(path))
+	config = copy.copy(base_config)
+	config.output_file = os.path.splitext(path)[0] + ".xlsx"
+	for name, value in settings.items():
+		name = str(name)
+		if not hasattr(config, name):
+			raise TypeError("Unknown setting in %s: %s" % (path, name))
+		if name == "time_ranges":
+			value = tuple((parseDate(start), parseDate(end)) for start, end in value)
+		elif name == "learning_estimation":
+			value = {int(student): estimate for student, estimate in value.items()}
+		elif name == "prepost_categories_inv":
+			value = {str(category): tuple(problems) for category, problems in value.items()}
+		elif name in ("output_file", "prepost_corrections_file", "data_folder") and value is not None:
+			value = os.path.join(folder, value)
+		elif isinstance(value, list): #the settings that get put into queries have to be tuples
+			value = tuple(str(item) if isinstance(item, unicode) else item for item in value)
+		elif isinstance(value, unicode):
+			value = str(value)
+		setattr(config, name, value)
+	config.study_file = path
+	return config
+
+#The settings for pulling every study's data at once: all of their classes and days,
+# leaving out only the students that every study leaves out
+def unionConfig(base_config, study_configs):
+	config = copy.copy(base_config)
+	config.classes = tuple(sorted(set(c for study in study_configs for c in study.classes)))
+	if all(len(study.time_ranges) > 0 for study in study_configs):
+		config.time_ranges = tuple(sorted(set(r for study in study_configs for r in study.time_ranges)))
+	else: #a study without time ranges wants all of the time there is
+		config.time_ranges = ()
+	excluded = set(study_configs[0].exclude_student_ids)
+	for study in study_configs[1:]:
+		excluded &= set(study.exclude_student_ids)
+	config.exclude_student_ids = tuple(sorted(excluded))
+	#these need the rows to be processed again in the same order, and kept around
+	config.stream_eventlog = False
+	config.incremental_eventlog = False
+	return config
+
+def inRanges(day, time_ranges):
+	if len(time_ranges) == 0:
+		return True
+	return any(start <= day <= end for start, end in time_ranges)
+
+#A copy of a student's processing state that the study can change without touching the shared one
+def copyState(state):
+	return cPickle.loads(cPickle.dumps(state, cPickle.HIGHEST_PROTOCOL))
+
+#Processes the whole shared event log once
+#Returns studId -> state, and each row's event type and UniqueEndProb (counted from 0 for each student)
+def processShared(shared):
+	processor = eventlog.EventlogProcessor(shared.eventlog_h, shared.problem_difficulty)
+	states = {}
+	event_types = [None] * len(shared.eventlog)
+	unique_end_probs = [0] * len(shared.eventlog)
+	def addStudent(state):
+		states[state.studId] = state
+	def storeGenerated(i, row, event_type, unique_end_prob, unique_end_prob_offset):
+		event_types[i] = event_type
+		unique_end_probs[i] = unique_end_prob
+	eventlog.processEventlog(processor, shared.eventlog, states, addStudent, storeGenerated, shared.config.processes)
+	return processor, states, event_types, unique_end_probs
+
+#Sets up a study's pipeline as if it had run its own load and enrich stages, and pulls what its other stages will query
+#That all goes in the study's instrumentation as one "load (shared)" stage
+def prepareStudy(study_config, shared, processor, states, event_types, unique_end_probs, slices, stages):
+	study = pipeline.Pipeline(study_config, shared.db)
+	study.instrumentation.startStage("load (shared)")
+	h = shared.eventlog_h
+	study.student_data = shared.db.query("student_ids", pipeline.studentQuery(study_config))
+	study.student_ids = tuple(i[0] for i in study.student_data)
+	study.problem_difficulty = shared.problem_difficulty
+	study.eventlog_headers = shared.eventlog_headers
+	study.eventlog_h = h
+	study.eventlog_store = None
+	study.student_states = {}
+	study.student_metrics = {}
+	study.student_timeseries_answer_metrics = {}
+	study.student_timeseries_emotion_metrics = {}
+	study.eventlog = []
+	generated = []
+	days = set()
+	num_reprocessed = 0
+	for studId in sorted(set(study.student_ids) & set(slices)):
+		start, end = slices[studId]
+		kept = [i for i in range(start, end) if inRanges(shared.eventlog[i][h["time"]].date(), study_config.time_ranges)]
+		if len(kept) == 0:
+			continue
+		if len(kept) == end - start:
+			state = copyState(states[studId])
+			generated.extend((event_types[i], unique_end_probs[i]) for i in kept)
+		else:
+			num_reprocessed += 1
+			state = eventlog.StudentState(studId)
+			for i in kept:
+				processor.processRow(state, shared.eventlog[i])
+				generated.append((state.event_type, state.unique_end_prob))
+		study.eventlog.extend(shared.eventlog[i] for i in kept)
+		days.update(shared.eventlog[i][h["time"]].date() for i in kept)
+		study.student_states[studId] = state
+		study.student_metrics[studId] = state.metrics
+		study.student_timeseries_answer_metrics[studId] = state.answer_metrics
+		study.student_timeseries_emotion_metrics[studId] = state.emotion_metrics
+
+	#The new columns, with the UniqueEndProb numbered across the study's students
+	study.derived_columns = eventlog.DerivedColumns(len(study.eventlog))
+	study.num_eventlog_rows = len(study.eventlog)
+	unique_end_prob_offset = 0
+	last_studId = None
+	for i,(row, (event_type, unique_end_prob)) in enumerate(zip(study.eventlog, generated)):
+		studId = row[h["studId"]]
+		if last_studId is not None and studId != last_studId:
+			unique_end_prob_offset += study.student_states[last_studId].unique_end_prob
+		last_studId = studId
+		study.derived_columns.store(i, event_type, unique_end_prob_offset + unique_end_prob)
+
+	#The last student in the event log is left as-is, the same as in the enrich stage
+	for studId in sorted(study.student_states)[:-1]:
+		processor.finishStudent(study.student_states[studId])
+
+	print "%s: %d event log rows covering %d classes, %d students (%d processed again for the study's days), on %d separate days." % \
+		(study_config.study_file, len(study.eventlog), len(study_config.classes), len(study.student_metrics), num_reprocessed, len(days))
+
+	#do all of the study's querying here, so the study processes don't all use the query cache at once
+	if "prepost" in stages:
+		study.pull("preposttestdata_headers", study.prepostTestHeaders)
+		study.pull("preposttestdata", study.prepostTestData)
+	if "workbook" in stages:
+		study.pull("preposttestproblem", study.prepostProblems)
+	study.instrumentation.finishStage(len(study.eventlog), len(study.student_metrics))
+	return study
+
+#What the study processes work from; they're forked, so they see this as it was when they were started
+#This is (the prepared study pipelines, the stages to run)
+batch_context = None
+
+#Runs the rest of a study's stages, with its output going into a log file next to its output if there's more than one running
+def runStudy(index, log=False):
+	studies, stages = batch_context
+	study = studies[index]
+	if log:
+		sys.stdout = open(os.path.splitext(study.config.output_file)[0] + ".log", "w", 0)
+	study.runStages(stages)
+	print
+	print study.instrumentation.summary()
+	print "Done."
+	if log:
+		sys.stdout.close()
+		sys.stdout = sys.__stdout__ #multiprocessing flushes it on the way out
+
+#Runs the given stages for every study file, with the shared pull and processing done once
+def runBatch(base_config, study_files, stages=pipeline.stage_order):
+	global batch_context
+	study_configs = [loadStudy(path, base_config) for path in study_files]
+	union_config = unionConfig(base_config, study_configs)
+	print "Pulling the data for %d studies (%d classes, %d time ranges) at once..." % \
+		(len(study_configs), len(union_config.classes), len(union_config.time_ranges))
+	shared = pipeline.Pipeline(union_config)
+	shared.runStages(["load"])
+	print "Processing the shared event log..."
+	processor, states, event_types, unique_end_probs = processShared(shared)
+	slices = {studId: (start, end) for studId, start, end in eventlog.studentSlices(shared.eventlog, shared.eventlog_h["studId"])}
+
+	stages = [stage for stage in pipeline.resolveStages(stages) if stage not in ("load", "enrich")]
+	studies = []
+	for study_config in study_configs:
+		studies.append(prepareStudy(study_config, shared, processor, states, event_types, unique_end_probs, slices, stages))
+
+	batch_context = (studies, stages)
+	num_processes = min(base_config.processes, len(studies))
+	if num_processes > 1 and hasattr(os, "fork"):
+		#Each study gets its own (non-daemon) process, so its stages can still start pools of their own
+		print "Running %d studies across %d processes (each one's output goes in a .log next to its output file)..." % \
+			(len(studies), num_processes)
+		running = []
+		for i in range(len(studies)):
+			if len(running) == num_processes:
+				running.pop(0).join()
+			process = multiprocessing.Process(target=runStudy, args=(i, True))
+			process.start()
+			running.append(process)
+		for process in running:
+			process.join()
+	else:
+		for i in range(len(studies)):
+			print "\n==========\n%s\n" % studies[i].config.study_file
+			runStudy(i)
+	batch_context = None
+	print "\n----------\n"
+	print shared.db.query_cache.report()
+	print "Done."
+	return studies
@@ -0,0 +1,147 @@
+#Timing the stages on made-up studies of different sizes (see synthetic.py), and checking for slowdowns between versions
+#Each size is run in its own process, so the peak memory of one doesn't carry over into the next
+#For each stage, this records the wall clock time, the CPU time (including any worker processes), the peak memory so far,
+# how much the stage added to it and the rows in and out (see instrument.py); the results are saved as JSON,
+# and compared with an earlier run's if given one
+from __future__ import division
+import json, os, subprocess, sys, multiprocessing, Queue
+from mathspring import pipeline, synthetic
+
+#Runs the stages, and returns stage -> what the pipeline's instrumentation measured (see instrument.py)
+def measureStages(config, stages):
+	study = pipeline.Pipeline(config)
+	study.runStages(stages)
+	results = {}
+	for record in study.instrumentation.stages:
+		results[record["stage"]] = {name: value for name, value in record.items() if name not in ("stage", "cache")}
+	return study, results
+
+#What the benchmark processes work from; they're forked, so they see this as it was when they were started
+#This is (the base settings, the stages to run, a queue for the results)
+benchmark_context = None
+
+#Runs one size in this (separate) process, and puts its results on the queue
+#Its output goes into a log next to the study's database
+def benchmarkSize(path, num_students):
+	config, stages, results = benchmark_context
+	log_file = os.path.splitext(path)[0] + ".log"
+	sys.stdout = open(log_file, "w", 0)
+	try:
+		config = synthetic.studyConfig(path, **config)
+		study, stage_results = measureStages(config, stages)
+		results.put(dict(students=num_students, eventlog_rows=len(study.eventlog), stages=stage_results, log=log_file))
+	except BaseException as e:
+		results.put(dict(students=num_students, error="%s: %s" % (type(e).__name__, e), log=log_file))
+		raise
+	finally:
+		sys.stdout.close()
+		sys.stdout = sys.__stdout__ #multiprocessing flushes it on the way out
+
+#The current git commit, if we're in a checkout
+def versionLabel():
+	try:
+		return subprocess.check_output(["git", "describe", "--always", "--dirty"], stderr=open(os.devnull, "w"),
+			cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+	except (OSError, subprocess.CalledProcessError):
+		return "unknown"
+
+#Makes up a study for each size (or reuses the one made last time), runs the stages on it, and returns the report
+#settings are passed on to the StudyConfig for each study (e.g. processes, permutations)
+def runBenchmark(folder, sizes, stages=pipeline.stage_order, seed=1, label=None, **settings):
+	global benchmark_context
+	if not os.path.exists(folder):
+		os.makedirs(folder)
+	stages = pipeline.resolveStages(stages)
+	config = dict(settings, reload_data=True, checkpoints=False) #so the queries and stages are timed too, instead of coming from saved results
+	report = dict(version=label or versionLabel(), python=sys.version.split()[0], seed=seed, stages=stages, sizes=[])
+	for num_students in sizes:
+		path = os.path.join(folder, "synthetic-%d-%d.sqlite" % (num_students, seed))
+		if not os.path.exists(path):
+			synthetic.generate(path, num_students, seed)
+		print "Running %d students..." % num_students
+		results = multiprocessing.Queue()
+		benchmark_context = (config, stages, results)
+		process = multiprocessing.Process(target=benchmarkSize, args=(path, num_students))
+		process.start()
+		while True:
+			try:
+				result = results.get(timeout=1)
+				break
+			except Queue.Empty:
+				if not process.is_alive(): #it died without reporting back (e.g. it ran out of memory)
+					result = dict(students=num_students, error="exit code %s" % process.exitcode, log=os.path.splitext(path)[0] + ".log")
+					break
+		process.join()
+		benchmark_context = None
+		if "error" in result:
+			print "The run for %d students failed with %s (see %s)" % (num_students, result["error"], result["log"])
+		report["sizes"].append(result)
+	return report
+
+def printReport(report):
+	print "%-16s %10s %14s %10s %10s %12s %12s" % ("Stage", "Students", "Event rows", "Wall (s)", "CPU (s)", "Peak (MB)", "Added (MB)")
+	for result in report["sizes"]:
+		for stage in report["stages"]:
+			if stage in result.get("stages", {}):
+				m = result["stages"][stage]
+				print "%-16s %10d %14d %10.2f %10.2f %12.1f %12.1f" % (stage, result["students"], result["eventlog_rows"],
+					m["wall_seconds"], m["cpu_seconds"], m["peak_memory_mb"], m["memory_growth_mb"])
+
+#Lists the stages that got slower or bigger than in the baseline report, for the sizes both have
+#A stage has regressed if it takes more than threshold (e.g. 0.2 for 20%) more time or peak memory,
+# and the difference is more than min_seconds/min_mb, so tiny stages' noise doesn't count
+def compareReports(baseline, report, threshold=0.2, min_seconds=0.1, min_mb=5):
+	regressions = []
+	baseline_sizes = {result["students"]: result for result in baseline["sizes"] if "stages" in result}
+	for result in report["sizes"]:
+		old = baseline_sizes.get(result["students"])
+		if old is None or "stages" not in result:
+			continue
+		for stage, m in sorted(result["stages"].items()):
+			if stage not in old["stages"]:
+				continue
+			old_m = old["stages"][stage]
+			for measure, minimum in (("wall_seconds", min_seconds), ("peak_memory_mb", min_mb)):
+				if m[measure] > old_m[measure] * (1 + threshold) and m[measure] - old_m[measure] > minimum:
+					regressions.append("%s with %d students: %s went from %.2f to %.2f (%+.0f%%)" % (stage, result["students"], measure,
+						old_m[measure], m[measure], 100 * (m[measure] / old_m[measure] - 1) if old_m[measure] else float("inf")))
+	return regressions
+
+#Runs the benchmark from the command line; returns 1 if anything regressed against the baseline, so it can fail a build
+def main(argv=None, folder="benchmark", sizes=(100, 1000), **settings):
+	import argparse
+	parser = argparse.ArgumentParser(description="Time the processing stages on made-up studies of different sizes.")
+	parser.add_argument("--sizes", type=int, nargs="+", default=list(sizes), help="how many students to make up for each run")
+	parser.add_argument("--stages", nargs="+", default=list(pipeline.stage_order), metavar="STAGE",
+		help="which stages to time (plus the ones they need)")
+	parser.add_argument("--seed", type=int, default=1, help="the random seed for making up the studies")
+	parser.add_argument("--folder", default=folder, help="where to keep the made-up studies, and their output and logs")
+	parser.add_argument("--output", help="the JSON file to save the results in (by default, one named after the version in the folder)")
+	parser.add_argument("--baseline", help="an earlier run's JSON results to check for regressions against")
+	parser.add_argument("--threshold", type=float, default=0.2, help="how much slower/bigger (as a fraction) counts as a regression")
+	parser.add_argument("--label", help="what to call this version in the results (the git commit by default)")
+	parser.add_argument("--processes", type=int, help="how many processes the stages can use")
+	parser.add_argument("--profile", action="store_true", help="sample what each stage spends its time on (it goes in the JSON)")
+	args = parser.parse_args(argv)
+	if args.profile:
+		settings["profile_stages"] = True
+	if args.processes is not None:
+		settings["processes"] = args.processes
+	report = runBenchmark(args.folder, args.sizes, args.stages, args.seed, args.label, **settings)
+	print
+	printReport(report)
+	output = args.output or os.path.join(args.folder, "benchmark-%s.json" % report["version"])
+	with open(output, "w") as f:
+		json.dump(report, f, indent=1, sort_keys=True)
+	print "\nSaved the results in %s" % output
+	if args.baseline is not None:
+		with open(args.baseline) as f:
+			baseline = json.load(f)
+		regressions = compareReports(baseline, report, args.threshold)
+		print "\nCompared with %s (%s):" % (args.baseline, baseline["version"])
+		for regression in regressions:
+			print regression
+		if len(regressions) == 0:
+			print "No regressions."
+		return 1 if regressions else 0
+	return 0
@@ -0,0 +1,131 @@
+#Saving what each stage works out, so a rerun only redoes the stages whose inputs have changed
+#Each stage's checkpoint is keyed by a fingerprint of:
+#	the fingerprints of the stages it needs (load's comes from the cached query results it read)
+#	the settings that change what it works out
+#	the source code that does its work
+#so e.g. changing smoothing only reruns the Markov stages, and changing prepost_categories_inv or windows.py reruns
+# prepost and everything after it, while the event log doesn't get processed again
+#The load stage always runs, since its results are already cached (see querycache.py); what the other stages printed
+# is saved too, and printed again when their checkpoint is used
+import cPickle, hashlib, json, os
+
+#The settings each stage's results depend on, on top of the stages it needs
+#(markov-pedagogy's permutation test gives the same result however many processes it's split across)
+stage_settings = {
+	"load": ("classes", "time_ranges", "exclude_student_ids", "project_eventlog", "eventlog_dump_file"),
+	"enrich": (),
+	"prepost": ("prepost_corrections_file", "prepost_categories_inv", "learning_estimation", "answer_windows"),
+	"workbook": ("output_file", "output_format", "streaming_export", "category_order"),
+	"markov-pedagogy": ("smoothing", "permutations", "permutation_seed"),
+	"markov-messages": ("smoothing",),
+	"markov-models": ("markov_levels", "markov_order", "smoothing"),
+	"partial-correlations": ("prepost_categories_inv", "category_order", "partial_correlations_file"),
+}
+#The modules (in the mathspring folder) that do each stage's work, on top of pipeline.py
+stage_modules = {
+	"load": ("database", "extraction", "projection", "columnar", "externalsort"),
+	"enrich": ("eventlog", "events", "records"),
+	"prepost": ("prepost", "windows", "records"),
+	"workbook": ("workbook", "export", "records"),
+	"markov-pedagogy": ("markov",),
+	"markov-messages": ("markov",),
+	"markov-models": ("transitionmodels",),
+	"partial-correlations": ("partialcorr",),
+}
+#The Pipeline attributes each stage sets, which are what gets saved
+stage_state = {
+	"enrich": ("student_states", "student_metrics", "student_timeseries_answer_metrics", "student_timeseries_emotion_metrics",
+		"derived_columns", "num_eventlog_rows"),
+	"prepost": ("preposttest_headers", "preposttestdata", "students_prepost", "prepost_by_group", "student_metrics",
+		"student_timeseries_answer_metrics", "student_timeseries_emotion_metrics", "answer_window_columns"),
+	"workbook": (),
+	"markov-pedagogy": ("pedagogy_p", "pedagogy_permutation_p"),
+	"markov-messages": ("message_p",),
+	"markov-models": ("transition_models", "transition_model_p"),
+	"partial-correlations": ("partial_correlations",),
+}
+#The queries the stages read their results from: load's event log and students, and the pre/post tests the later ones
+# pull for themselves, so a refreshed pull of those reruns the stages that use them
+stage_results = {
+	"prepost": ("preposttestdata_headers", "preposttestdata"),
+	"workbook": ("preposttestproblem",),
+}
+load_results = ("student_ids", "eventlog", "eventlog_projected", "eventlog_dump", "problem_difficulties", "eventlog_headers")
+
+source_folder = os.path.dirname(os.path.abspath(__file__))
+
+#Settings are put into the fingerprint as JSON; anything that isn't plain data (like a Window) goes in as its attributes,
+# and the corrections file goes in as its contents
+def settingValue(config, name):
+	value = getattr(config, name)
+	if name == "prepost_corrections_file" and value is not None:
+		with open(value, 'rb') as f:
+			return hashlib.sha1(f.read()).hexdigest()
+	return value
+
+def jsonValue(value):
+	return vars(value) if hasattr(value, "__dict__") else str(value)
+
+def sourceHash(module):
+	with open(os.path.join(source_folder, module + ".py"), 'rb') as f:
+		return hashlib.sha1(f.read()).hexdigest()
+
+#requirements are the fingerprints of the stages this one needs, and results are the (cache file, modified time) of
+# the query results it read (see load_results and stage_results)
+def fingerprint(stage, config, requirements, results=()):
+	return hashlib.sha1(json.dumps([stage, list(requirements), sorted(results),
+		[[name, settingValue(config, name)] for name in stage_settings[stage]],
+		[sourceHash(module) for module in ("pipeline",) + stage_modules[stage]]], sort_keys=True, default=jsonValue)).hexdigest()
+
+#Copies what's printed into a list as well as wherever it was going
+class OutputRecorder(object):
+	def __init__(self, stream):
+		self.stream = stream
+		self.parts = []
+
+	def write(self, text):
+		self.stream.write(text)
+		self.parts.append(text)
+
+	def __getattr__(self, name):
+		return getattr(self.stream, name)
+
+	def output(self):
+		return "".join(self.parts)
+
+#The saved stages in a folder: stage.json has the fingerprint, what the stage printed and its rows in/out,
+# and stage.pickle has the Pipeline attributes it set
+class Checkpoints(object):
+	def __init__(self, folder):
+		self.folder = folder
+
+	def infoPath(self, stage):
+		return os.path.join(self.folder, stage + ".json")
+
+	def statePath(self, stage):
+		return os.path.join(self.folder, stage + ".pickle")
+
+	#Returns what was saved about the stage (without its attributes), or None if it doesn't match the fingerprint
+	def find(self, stage, stage_fingerprint):
+		if not os.path.exists(self.infoPath(stage)) or not os.path.exists(self.statePath(stage)):
+			return None
+		with open(self.infoPath(stage)) as f:
+			info = json.load(f)
+		return info if info["fingerprint"] == stage_fingerprint else None
+
+	#Sets the attributes the stage saved on pipeline
+	def restore(self, stage, pipeline):
+		with open(self.statePath(stage), 'rb') as f:
+			for name, value in cPickle.load(f).items():
+				setattr(pipeline, name, value)
+
+	def save(self, stage, stage_fingerprint, pipeline, output, rows):
+		if not os.path.exists(self.folder):
+			os.makedirs(self.folder)
+		#The old info goes first and the new info last, so a save that gets interrupted never leaves a mismatched pair
+		if os.path.exists(self.infoPath(stage)):
+			os.remove(self.infoPath(stage))
+		with open(self.statePath(stage), 'wb') as f:
+			cPickle.dump({name: getattr(pipeline, name) for name in stage_state[stage]}, f, cPickle.HIGHEST_PROTOCOL)
+		with open(self.infoPath(stage), 'w') as f:
+			json.dump(dict(fingerprint=stage_fingerprint, output=output, rows=list(rows)), f)
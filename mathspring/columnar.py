@@ -0,0 +1,300 @@
+#A column-oriented on-disk format for cached query results
+#Each column is stored as a flat binary array that gets memory-mapped when it's first used,
+# so opening a cached table is nearly instant and only the columns that are actually read get paged in
+#Numbers and dates are stored as typed arrays, and everything else (mostly strings) is dictionary-encoded:
+# each distinct value is stored once, and the column holds an integer code per row
+from __future__ import division
+from datetime import datetime, date, timedelta
+import numpy as np
+import json, os, pickle, shutil
+
+#How each kind of column is laid out on disk
+column_dtypes = {
+	"int": np.int64,
+	"float": np.float64,
+	"datetime": np.int64, #microseconds since the epoch
+	"date": np.int32, #proleptic Gregorian ordinal
+	"object": np.int32, #code into the column's dictionary
+}
+
+epoch = datetime(1970, 1, 1)
+
+#Figures out the kind of each column from the values in it, for results that are already in memory
+def inferKinds(rows, num_columns):
+	kinds = [None] * num_columns
+	for row in rows:
+		for c in range(num_columns):
+			value = row[c]
+			if value is None or kinds[c] == "object":
+				continue
+			kind = valueKind(value)
+			if kinds[c] is None:
+				kinds[c] = kind
+			elif kinds[c] != kind:
+				#ints mixed with floats can still be stored as floats, anything else gets dictionary-encoded
+				kinds[c] = "float" if set((kinds[c], kind)) == set(("int", "float")) else "object"
+	return [kind or "object" for kind in kinds]
+
+def valueKind(value):
+	if isinstance(value, bool):
+		return "object"
+	if isinstance(value, (int, long)):
+		return "int" if -2**63 <= value < 2**63 else "object"
+	if isinstance(value, float):
+		return "float"
+	if isinstance(value, datetime): #this has to come before date, since datetime is a subclass of it
+		return "datetime" if value.tzinfo is None else "object"
+	if isinstance(value, date):
+		return "date"
+	return "object"
+
+#Figures out the kind of each column from a DB-API cursor description, for results that are streamed
+# and so can't be scanned ahead of time
+def descriptionKinds(description):
+	from pymysql.constants import FIELD_TYPE
+	kind_map = {}
+	for kind, type_names in (("int", ("TINY", "SHORT", "LONG", "LONGLONG", "INT24", "YEAR")),
+							 ("float", ("FLOAT", "DOUBLE")),
+							 ("datetime", ("DATETIME", "TIMESTAMP")),
+							 ("date", ("DATE", "NEWDATE"))):
+		for type_name in type_names:
+			if hasattr(FIELD_TYPE, type_name):
+				kind_map[getattr(FIELD_TYPE, type_name)] = kind
+	return [kind_map.get(column[1], "object") for column in description]
+
+def encodeValue(kind, value):
+	if kind == "datetime":
+		delta = value - epoch
+		return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+	if kind == "date":
+		return value.toordinal()
+	return value
+
+def decodeValue(kind, value):
+	if kind == "int":
+		return int(value)
+	if kind == "float":
+		return float(value)
+	if kind == "datetime":
+		return epoch + timedelta(microseconds=int(value))
+	if kind == "date":
+		return date.fromordinal(int(value))
+	return value
+
+#Writes rows into a columnar table one at a time, so it can be used while streaming a query
+#Nothing is visible at path until close() is called, so an interrupted write doesn't leave a broken table behind
+#If append is set, the rows are added onto the end of the existing table at path instead
+class ColumnarWriter(object):
+	def __init__(self, path, kinds, names=None, append=False, chunk_size=65536):
+		self.path = path
+		self.partial_path = path + ".partial"
+		self.chunk_size = chunk_size
+		if os.path.exists(self.partial_path):
+			shutil.rmtree(self.partial_path)
+		if append and os.path.exists(path):
+			shutil.copytree(path, self.partial_path)
+			manifest = readManifest(self.partial_path)
+			self.kinds = [column["kind"] for column in manifest["columns"]]
+			self.names = [column["name"] for column in manifest["columns"]]
+			self.num_rows = manifest["num_rows"]
+			self.has_nulls = [column["has_nulls"] for column in manifest["columns"]]
+			self.dictionaries = []
+			for c,kind in enumerate(self.kinds):
+				values = readDictionary(self.partial_path, c) if kind == "object" else []
+				self.dictionaries.append({value: code for code,value in enumerate(values)})
+			#the null masks are only kept for columns that have nulls, so fill in the rest
+			for c in range(len(self.kinds)):
+				mask_filename = os.path.join(self.partial_path, "%d.mask.bin" % c)
+				if not os.path.exists(mask_filename):
+					with open(mask_filename, 'wb') as f:
+						f.write(np.zeros(self.num_rows, dtype=np.uint8).tostring())
+		else:
+			os.mkdir(self.partial_path)
+			self.kinds = list(kinds)
+			self.names = list(names) if names is not None else [None] * len(self.kinds)
+			self.num_rows = 0
+			self.has_nulls = [False] * len(self.kinds)
+			self.dictionaries = [{} for kind in self.kinds]
+		self.data_files = [open(os.path.join(self.partial_path, "%d.bin" % c), 'ab') for c in range(len(self.kinds))]
+		self.mask_files = [open(os.path.join(self.partial_path, "%d.mask.bin" % c), 'ab') for c in range(len(self.kinds))]
+		self.chunk = []
+
+	def append(self, row):
+		self.chunk.append(row)
+		if len(self.chunk) >= self.chunk_size:
+			self.flush()
+
+	def extend(self, rows):
+		for row in rows:
+			self.append(row)
+
+	def flush(self):
+		if not self.chunk:
+			return
+		for c,kind in enumerate(self.kinds):
+			values = [row[c] for row in self.chunk]
+			mask = np.array([value is None for value in values], dtype=np.uint8)
+			if kind == "object":
+				dictionary = self.dictionaries[c]
+				encoded = []
+				for value in values:
+					code = dictionary.get(value)
+					if code is None:
+						code = dictionary[value] = len(dictionary)
+					encoded.append(code)
+				mask[:] = 0 #None is just another dictionary entry for these
+			else:
+				encoded = [0 if value is None else encodeValue(kind, value) for value in values]
+			self.has_nulls[c] = self.has_nulls[c] or bool(mask.any())
+			self.data_files[c].write(np.array(encoded, dtype=column_dtypes[kind]).tostring())
+			self.mask_files[c].write(mask.tostring())
+		self.num_rows += len(self.chunk)
+		self.chunk = []
+
+	def close(self):
+		self.flush()
+		for f in self.data_files + self.mask_files:
+			f.close()
+		columns = []
+		for c,kind in enumerate(self.kinds):
+			if kind == "object":
+				values = [None] * len(self.dictionaries[c])
+				for value,code in self.dictionaries[c].items():
+					values[code] = value
+				with open(os.path.join(self.partial_path, "%d.dict.pickle" % c), 'wb') as f:
+					pickle.dump(values, f, pickle.HIGHEST_PROTOCOL)
+			if not self.has_nulls[c]:
+				os.remove(os.path.join(self.partial_path, "%d.mask.bin" % c))
+			columns.append(dict(name=self.names[c], kind=kind, has_nulls=self.has_nulls[c]))
+		with open(os.path.join(self.partial_path, "manifest.json"), 'w') as f:
+			json.dump(dict(num_rows=self.num_rows, columns=columns), f, indent=1)
+		if os.path.exists(self.path):
+			shutil.rmtree(self.path)
+		os.rename(self.partial_path, self.path)
+
+#Writes a whole in-memory result (a list of row lists) as a columnar table
+def writeColumnar(path, rows, names=None):
+	num_columns = len(names) if names is not None else (len(rows[0]) if len(rows) > 0 else 0)
+	writer = ColumnarWriter(path, inferKinds(rows, num_columns), names)
+	writer.extend(rows)
+	writer.close()
+
+def readManifest(path):
+	with open(os.path.join(path, "manifest.json")) as f:
+		return json.load(f)
+
+def readDictionary(path, c):
+	with open(os.path.join(path, "%d.dict.pickle" % c), 'rb') as f:
+		return pickle.load(f)
+
+#A read-only view of a columnar table that acts enough like a list of row lists for the scripts to use it directly
+#Columns are only loaded when a row actually asks for them
+#Assigning to a row (or a whole row) keeps the new value in memory, so code that patches rows still works
+class ColumnarTable(object):
+	def __init__(self, path):
+		self.path = path
+		manifest = readManifest(path)
+		self.num_rows = manifest["num_rows"]
+		self.kinds = [column["kind"] for column in manifest["columns"]]
+		self.names = [column["name"] for column in manifest["columns"]]
+		self.has_nulls = [column["has_nulls"] for column in manifest["columns"]]
+		self.arrays = [None] * len(self.kinds)
+		self.masks = [None] * len(self.kinds)
+		self.dictionaries = [None] * len(self.kinds)
+		self.replaced_rows = {}
+		self.replaced_values = {}
+
+	def __len__(self):
+		return self.num_rows
+
+	def __getitem__(self, i):
+		if i < 0:
+			i += self.num_rows
+		if not 0 <= i < self.num_rows:
+			raise IndexError("row index out of range")
+		if i in self.replaced_rows:
+			return self.replaced_rows[i]
+		return ColumnarRow(self, i)
+
+	def __setitem__(self, i, row):
+		if i < 0:
+			i += self.num_rows
+		self.replaced_rows[i] = row
+
+	def __iter__(self):
+		for i in range(self.num_rows):
+			yield self[i]
+
+	#The raw array for column c; for dictionary-encoded columns this is the codes
+	def column(self, c):
+		if self.arrays[c] is None:
+			dtype = column_dtypes[self.kinds[c]]
+			self.arrays[c] = mapArray(os.path.join(self.path, "%d.bin" % c), dtype, self.num_rows)
+			if self.has_nulls[c]:
+				self.masks[c] = mapArray(os.path.join(self.path, "%d.mask.bin" % c), np.uint8, self.num_rows)
+			if self.kinds[c] == "object":
+				self.dictionaries[c] = readDictionary(self.path, c)
+		return self.arrays[c]
+
+	#The dictionary for a dictionary-encoded column
+	def dictionary(self, c):
+		self.column(c)
+		return self.dictionaries[c]
+
+	def value(self, i, c):
+		if (i, c) in self.replaced_values:
+			return self.replaced_values[(i, c)]
+		raw = self.column(c)[i]
+		kind = self.kinds[c]
+		if kind == "object":
+			return self.dictionaries[c][raw]
+		if self.masks[c] is not None and self.masks[c][i]:
+			return None
+		return decodeValue(kind, raw)
+
+def mapArray(filename, dtype, num_rows):
+	if num_rows == 0: #numpy can't memory-map an empty file
+		return np.zeros(0, dtype=dtype)
+	return np.memmap(filename, dtype=dtype, mode='r', shape=(num_rows,))
+
+#One row of a ColumnarTable, which reads its values out of the columns on demand
+class ColumnarRow(object):
+	__slots__ = ("table", "i")
+
+	def __init__(self, table, i):
+		self.table = table
+		self.i = i
+
+	def __getitem__(self, c):
+		if isinstance(c, slice):
+			return [self.table.value(self.i, k) for k in range(*c.indices(len(self)))]
+		if c < 0:
+			c += len(self)
+		return self.table.value(self.i, c)
+
+	def __setitem__(self, c, value):
+		if c < 0:
+			c += len(self)
+		self.table.replaced_values[(self.i, c)] = value
+
+	def __len__(self):
+		return len(self.table.kinds)
+
+	def __iter__(self):
+		for c in range(len(self)):
+			yield self.table.value(self.i, c)
+
+	def __add__(self, other):
+		return list(self) + list(other)
+
+	def __radd__(self, other):
+		return list(other) + list(self)
+
+	def __eq__(self, other):
+		return list(self) == list(other)
+
+	def __ne__(self, other):
+		return not self == other
+
+	def __repr__(self):
+		return repr(list(self))
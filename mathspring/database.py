@@ -0,0 +1,229 @@
+#Getting data out of the Mathspring database, and caching the results so we don't have to query every time
+#pymysql (and numpy, for the columnar cache) are only imported once they're actually needed
+import os, sys, pickle, threading
+from mathspring import querycache, querypool
+
+class Database(object):
+	def __init__(self, config):
+		self.config = config
+		self.data_folder = config.data_folder
+		if not os.path.exists(self.data_folder):
+			os.makedirs(self.data_folder)
+		self.pool = None #the connections, once we've connected
+		self.cache_lock = threading.RLock() #queries can be run from more than one thread at once (see querypool.py)
+		self.query_locks = {} #so two threads asking for the same result don't both write it into the cache
+		self.result_stamps = {} #name -> [(cache file, modified time)] of the results returned, for fingerprinting (see checkpoint.py)
+		#Results are cached under a hash of the query text, so changing the configuration never picks up stale results
+		self.query_cache = querycache.QueryCache(os.path.join(self.data_folder, "query-cache"),
+			config.cache_max_megabytes * 2**20 if config.cache_max_megabytes is not None else None,
+			(config.db_hostname, config.db_dbname) if config.db_sqlite_file is None else ("sqlite", os.path.abspath(config.db_sqlite_file)))
+
+	#Connect to the database, if we have a login; otherwise we'll only use cached data
+	#A local SQLite copy of the tables (db_sqlite_file) can stand in for the database
+	#Up to db_connections connections are opened, as they're needed, so that many queries can run at once
+	def connect(self):
+		config = self.config
+		if config.db_sqlite_file is not None:
+			print "Connecting to %s..." % config.db_sqlite_file
+		elif config.db_username is not None and config.db_password is not None:
+			print "Connecting to the database..."
+		else:
+			print "Using cached data in the %s folder..." % self.data_folder
+			return
+		self.pool = querypool.ConnectionPool(self.openConnection, config.db_connections)
+		self.pool.release(self.pool.acquire()) #make sure we can connect before going any further
+		if config.db_sqlite_file is None:
+			print "Connected, building queries..."
+
+	def openConnection(self):
+		config = self.config
+		if config.db_sqlite_file is not None:
+			import sqlite3
+			#each connection is only used by one thread at a time, but not always the one that opened it
+			return sqlite3.connect(config.db_sqlite_file, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+		import pymysql #The main package we use to pull data from the database
+		return pymysql.connect(host=config.db_hostname, user=config.db_username,
+							   passwd=config.db_password, db=config.db_dbname, charset="latin1")
+
+	#Reads back a cache file written by queryStream() one row at a time
+	def readStream(self, filename):
+		with open(filename, 'rb') as f:
+			unpickler = pickle.Unpickler(f)
+			while True:
+				try:
+					yield unpickler.load()
+				except EOFError:
+					break
+
+	#Loads a cached result; columnar results come back as a memory-mapped ColumnarTable,
+	# which can be used like the list but only loads the columns that get read
+	def loadCached(self, path, kind):
+		if kind == "columns":
+			from mathspring import columnar
+			return columnar.ColumnarTable(path)
+		elif kind == "stream.pickle":
+			return list(self.readStream(path))
+		with open(path, 'rb') as f:
+			return pickle.load(f)
+
+	#Old caches were just named after the query, so we only use them if there's no other way to get the data
+	def findLegacyCache(self, name):
+		for kind in ("columns", "stream.pickle", "pickle"):
+			path = os.path.join(self.data_folder, name + "." + kind)
+			if os.path.exists(path):
+				with self.cache_lock:
+					self.query_cache.noteLegacy(name)
+				return path, kind
+		return None
+
+	#Runs a query on the database and returns the result as a list of row lists, without any caching
+	def runQuery(self, q):
+		return self.execute(q)[0]
+
+	#Like runQuery(), but returns the names of the result's columns too
+	def execute(self, q):
+		result = []
+		connection = self.pool.acquire()
+		try:
+			cursor = connection.cursor()
+			cursor.execute(q)
+			#Each distinct string is only kept once, so the columns with a handful of values (like the event log's
+			# action, activityName and emotion) cost a reference per row instead of a string
+			strings = {}
+			def share(elt):
+				if hasattr(elt, "strip"):
+					elt = elt.strip()
+					return strings.setdefault(elt, elt)
+				return elt
+			for row in cursor.fetchall():
+				result.append([share(elt) for elt in row])
+			names = [column[0] for column in cursor.description]
+			cursor.close()
+		finally:
+			self.pool.release(connection)
+		return result, names
+
+	#The query cache is shared by every thread that's running queries
+	def queryLock(self, q):
+		with self.cache_lock:
+			return self.query_locks.setdefault(q, threading.Lock())
+
+	def findCached(self, name, q):
+		with self.cache_lock:
+			return self.query_cache.find(name, q)
+
+	def addCached(self, name, q, kind):
+		with self.cache_lock:
+			self.query_cache.add(name, q, kind, refreshed=self.config.reload_data)
+		self.noteResult(name, self.query_cache.entryPath(q, kind))
+
+	#Remembers which cache file a result came from, and when it was written
+	def noteResult(self, name, path):
+		with self.cache_lock:
+			self.result_stamps.setdefault(name, []).append((os.path.basename(path), os.path.getmtime(path)))
+
+	#Just runs a query and dumps it into a Python list of row-tuples
+	#The result is cached, and the cached copy is used instead of the database unless reload_data is set
+	#If run is given, it's called instead of running q, and returns (rows, column names); q is then just what the result is cached under
+	def query(self, name, q, run=None):
+		with self.queryLock(q):
+			return self.queryUnlocked(name, q, run)
+
+	def queryUnlocked(self, name, q, run=None):
+		config = self.config
+		cached = self.findCached(name, q) if self.pool is None or not config.reload_data else None
+		if self.pool is not None and cached is None:
+			result, names = run() if run is not None else self.execute(q)
+			if config.columnar_cache:
+				from mathspring import columnar
+				columnar.writeColumnar(self.query_cache.entryPath(q, "columns"), result, names)
+			else:
+				with open(self.query_cache.entryPath(q, "pickle"), 'wb') as f:
+					pickle.dump(result, f)
+			self.addCached(name, q, "columns" if config.columnar_cache else "pickle")
+			return result
+		cached = cached or self.findLegacyCache(name)
+		if cached is not None:
+			result = self.loadCached(*cached)
+			if config.columnar_cache and cached[1] != "columns": #convert an old cache so that it loads quickly next time
+				from mathspring import columnar
+				columnar.writeColumnar(os.path.join(self.data_folder, name + ".columns"), result)
+				cached = (os.path.join(self.data_folder, name + ".columns"), "columns") #which is what the next run reads
+			self.noteResult(name, cached[0])
+			return result
+		print "Error: You must have either a database login or a cached result for the %s query in %s" % (name, self.data_folder)
+		sys.exit(0)
+
+	#Like query(), but yields the rows one at a time instead of returning them all at once
+	#When querying, this uses an unbuffered (server-side) cursor so the full result never has to fit in memory,
+	# and the rows are cached as they arrive, either as a columnar table or as a stream of individually pickled rows
+	#The stream has a connection to itself until the generator has been used up
+	def queryStream(self, name, q, batch_size=10000):
+		config = self.config
+		if config.db_sqlite_file is not None: #a SQLite copy is small enough to just query all at once
+			for row in self.query(name, q):
+				yield row
+			return
+		cached = self.findCached(name, q) if self.pool is None or not config.reload_data else None
+		if self.pool is not None and cached is None:
+			import pymysql
+			connection = self.pool.acquire()
+			stream_cursor = connection.cursor(pymysql.cursors.SSCursor)
+			stream_cursor.execute(q)
+			#the cache entry only shows up once it's complete, so an interrupted pull doesn't leave a truncated cache behind
+			if config.columnar_cache:
+				from mathspring import columnar
+				writer = columnar.ColumnarWriter(self.query_cache.entryPath(q, "columns"),
+												 columnar.descriptionKinds(stream_cursor.description),
+												 [column[0] for column in stream_cursor.description])
+				cache_row = writer.append
+			else:
+				stream_filename = self.query_cache.entryPath(q, "stream.pickle")
+				partial_filename = stream_filename + ".partial"
+				f = open(partial_filename, 'wb')
+				pickler = pickle.Pickler(f, pickle.HIGHEST_PROTOCOL)
+				def cache_row(row):
+					pickler.dump(row)
+					pickler.clear_memo() #otherwise the pickler keeps a reference to every row it has written
+			while True:
+				rows = stream_cursor.fetchmany(batch_size)
+				if not rows:
+					break
+				for row in rows:
+					row = [elt.strip() if hasattr(elt, "strip") else elt for elt in row]
+					cache_row(row)
+					yield row
+			stream_cursor.close()
+			self.pool.release(connection)
+			if config.columnar_cache:
+				writer.close()
+			else:
+				f.close()
+				if os.path.exists(stream_filename):
+					os.remove(stream_filename)
+				os.rename(partial_filename, stream_filename)
+			self.addCached(name, q, "columns" if config.columnar_cache else "stream.pickle")
+			return
+		path, kind = cached or self.findLegacyCache(name) or (None, None)
+		if path is not None:
+			self.noteResult(name, path)
+		if kind == "columns":
+			rows = self.loadCached(path, kind)
+		elif kind == "stream.pickle":
+			rows = self.readStream(path)
+		elif kind == "pickle": #this kind of cache has to be loaded whole
+			rows = self.loadCached(path, kind)
+		else:
+			print "Error: You must have either a database login or a cached result for the %s query in %s" % (name, self.data_folder)
+			sys.exit(0)
+		for row in rows:
+			yield row
+
+	def getHeaders(self, table_name):
+		if self.config.db_sqlite_file is not None: #SQLite doesn't have INFORMATION_SCHEMA
+			headers = self.query(table_name + "_headers", "SELECT name FROM pragma_table_info('%s') ORDER BY cid" % table_name)
+		else:
+			headers = self.query(table_name + "_headers", "SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME = '%s'" % table_name)
+		headers = tuple(row[0] for row in headers)
+		h = {name: c for c,name in enumerate(headers)}
+		return headers, h
@@ -0,0 +1,394 @@
+#Processing the event log: working out the EventType/UniqueEndProb/newId columns for each row,
+# and pulling out the per-student metrics and timeseries that the analyses use
+from __future__ import division
+from collections import defaultdict, deque
+from itertools import izip, repeat
+from array import array
+import os, re, multiprocessing
+from mathspring import events
+from mathspring.records import AnswerRecord, EmotionRecord
+
+#This just lets just check for a bunch of different pieces of text at once
+# we look for the first string, and put the second in the EventType column
+event_map = {
+	'demo':'Demo',
+	'Collaboration':'Collab',
+	'AskEmotionIntervention-':'EmoReport',
+	'TopicIntro':'TopicIntro',
+	'BeginProblem':'Problem',
+	'Home':'Home',
+	'MyProgressPage':'MPP',
+	'MPPContinueTopic':'MPP',
+}
+
+#These are the columns we generate for each row
+generated_headers = ("EventType", "UniqueEndProb", "newId")
+
+#The generated columns for a whole event log, kept alongside it instead of being added onto each row,
+# so processing doesn't have to build a new row for every one it goes through
+#newId is just the row number, so it isn't stored
+class DerivedColumns(object):
+	def __init__(self, num_rows):
+		self.event_types = [None] * num_rows
+		self.unique_end_probs = array("l", [0]) * num_rows
+
+	def store(self, i, event_type, unique_end_prob):
+		self.event_types[i] = event_type
+		self.unique_end_probs[i] = unique_end_prob
+
+#This just flips the mapping so it's ID -> Category for faster processing later
+def flipTupleDict(tuple_dict):
+	flipped = {}
+	for cat,tup in tuple_dict.items():
+		for val in tup:
+			flipped[val] = cat
+	return flipped
+
+#The learning companion messages that belong to each of the message types
+lc_message_map_inv = dict(
+	Empathy = ('interestHigh','frustrationLow','frustratedCombo2','frustratedCombo1','confidenceHigh','anxiousCombo2','anxiousCombo1'),
+	GrowthMindset = ('noEffortAttribution2','incorrectNoEffort2','incorrectNoEffort1','incorrectEffort2','incorrectEffort1','incorrectAttribution5',
+		'incorrectAttribution3','incorrectAttribution2','incorrectAttribution1','generalAttribution1','generalAttribution2','generalAttribution3',
+		'generalAttribution4','generalAttribution5','correctEffort2','correctEffort1',),
+	SuccessFailure = ('incorrect1','incorrect2','incorrect3','incorrect4','incorrect5','incorrect6', 'correct1', 'correct2', 'correct3', 'correct4',
+		'correct5', 'correct6')
+)
+lc_message_map = flipTupleDict(lc_message_map_inv)
+
+#The event log columns with only a handful of distinct values, which the processing works with as small integer codes
+#(activityName, action, emotion) for each row, so checking a row's action or message type is just a lookup by its code
+categorical_columns = ("activityName", "action", "emotion")
+#The actions the processing looks for, as the kinds their codes resolve to (anything else is 0)
+action_attempt, action_hint, action_end_problem, action_input_response = range(1, 5)
+action_kinds = dict(Attempt=action_attempt, Hint=action_hint, EndProblem=action_end_problem, InputResponse=action_input_response)
+
+#Dictionary-encodes one categorical column: each distinct value gets the next code as it turns up
+#resolve(value) is what the processing wants to know about a value, worked out once for each code
+class CategoryCodes(object):
+	def __init__(self, resolve):
+		self.resolve = resolve
+		self.codes = {}
+		self.values = []
+		self.resolved = []
+
+	def code(self, value):
+		code = self.codes.get(value)
+		if code is None:
+			code = self.codes[value] = len(self.values)
+			self.values.append(value)
+			self.resolved.append(self.resolve(value))
+		return code
+
+#Figure out if the text of this row represents a student finishing a problem
+#(a new session also does, but that's checked separately in updateUniqueEndProb)
+def endsProblem(activity, last_activity, action, last_action):
+	return ("demo" in activity and "demo" not in last_activity) \
+		or "Collaboration" in activity \
+		or "AskEmotionIntervention-" in activity \
+		or ("TopicIntro" in activity and "TopicIntro" not in last_activity) \
+		or ("BeginProblem" in action and "demo" not in activity) \
+		or "EndProblem" in last_action \
+		or "Home" in action \
+		or "MyProgressPage" in action \
+		or "MPPContinueTopic" in action
+
+#Everything the processing loop needs to remember about one student between rows
+#None of this carries over from one student to the next, so a student's rows can be processed on their own,
+# and the state can be saved and picked back up later when more of their rows come in
+class StudentState(object):
+	def __init__(self, studId):
+		self.studId = studId
+		#Used for several different processing steps
+		self.last_activity = ""
+		self.last_action = ""
+		self.session_num = None
+		#Used for tracking between rows
+		#unique_end_prob counts up from 0 for each student; the UniqueEndProb column adds on the counts of the students before
+		self.unique_end_prob = 0
+		self.last_attempt_unique_end_prob = 0
+		self.event_type = None
+		self.seen_attempt = False
+		self.hints_in_problem = set()
+		self.last_three_answers = deque(maxlen=3)
+		self.last_three_hints = deque(maxlen=3)
+		self.incorrect_attempts = deque(maxlen=2)
+		self.last_row = None
+		#Per-student metrics for later analysis
+		self.metrics = defaultdict(int)
+		self.answer_metrics = []
+		self.emotion_metrics = dict(Confidence=[],Frustration=[])
+
+	#The state is saved as a plain dict, so it can be loaded without this module
+	def save(self):
+		saved = dict(vars(self))
+		if saved["last_row"] is not None: #this might be a view into a table that won't be around later
+			saved["last_row"] = list(saved["last_row"])
+		return saved
+
+	#This is also how it gets sent back from a worker process
+	def __getstate__(self):
+		return self.save()
+
+	@classmethod
+	def load(cls, saved):
+		state = cls.__new__(cls)
+		vars(state).update(saved)
+		#states saved before the timeseries were records have dicts instead
+		state.answer_metrics = [AnswerRecord.fromDict(m) if isinstance(m, dict) else m for m in state.answer_metrics]
+		for emotion, emotion_metrics in state.emotion_metrics.items():
+			emotion_metrics[:] = [EmotionRecord.fromDict(m) if isinstance(m, dict) else m for m in emotion_metrics]
+		return state
+
+#Does the row-by-row work for the event log
+#h is the header map for the event log columns, and problem_difficulty maps problem ids to their difficulty
+class EventlogProcessor(object):
+	def __init__(self, h, problem_difficulty):
+		self.h = h
+		self.problem_difficulty = problem_difficulty
+		#Both of these only depend on the activity/action text, so the classifier works them out once per distinct combination
+		self.event_classifier = events.EventClassifier(event_map, endsProblem)
+		#The activity and action come back out of these as the same string object every time, which keeps the classifier's
+		# lookups cheap; the emotion column's codes resolve to the message count (if any) that the row adds to
+		self.activities = CategoryCodes(lambda value: None)
+		self.actions = CategoryCodes(lambda value: action_kinds.get(value, 0))
+		self.emotions = CategoryCodes(lambda value: lc_message_map[value] + " Messages" if value in lc_message_map else None)
+
+	#The codes of a row's categorical columns (see categorical_columns)
+	def encodeRow(self, row):
+		h = self.h
+		return (self.activities.code(row[h["activityName"]] or ""), self.actions.code(row[h["action"]] or ""),
+				self.emotions.code(row[h["emotion"]]))
+
+	#The codes for every row of a columnar table (see columnar.py) at once, as a list for each of categorical_columns
+	#Its columns are already dictionary-encoded, so only its dictionaries have to be read, and its codes are translated
+	# into ours all at once, instead of reading each row's strings back out
+	#Returns None for other rows, which are just encoded as they're processed
+	def encodeColumns(self, rows):
+		h = self.h
+		if not hasattr(rows, "dictionary") or rows.replaced_rows or rows.replaced_values:
+			return None
+		import numpy as np
+		columns = []
+		for name, categories in zip(categorical_columns, (self.activities, self.actions, self.emotions)):
+			c = h[name]
+			empty = "" if name != "emotion" else None
+			translation = np.array([categories.code(value or empty) for value in rows.dictionary(c)] or [0], dtype=np.int32)
+			columns.append(translation[rows.column(c)].tolist())
+		return columns
+
+	#Figure out if this represents a student finishing a problem
+	def updateUniqueEndProb(self, unique_end_prob, session_num, row, ends_problem):
+		updated = False
+		if row[self.h["sessNum"]] != session_num or ends_problem:
+			unique_end_prob += 1
+			updated = True
+		return unique_end_prob, updated
+
+	#Figure out what type of event this row describes
+	def updateEventType(self, event_type, session_num, row, event):
+		h = self.h
+		if session_num is None or row[h['sessNum']] !=  session_num:
+			event_type = "NewSess"
+			session_num = row[h['sessNum']]
+		else:
+			event_type = event or event_type
+		return event_type, session_num
+
+	def updateAnswerMetrics(self, ametrics, state, row):
+		metrics = state.metrics
+		timeOnProblem = float(row[self.h["probElapsed"]])/60000 #convert from ms to min
+		ametrics["TimeOnProblem"] = timeOnProblem
+		state.last_three_hints.append(len(state.hints_in_problem))
+		ametrics["TotalHints"] = metrics["NumHints"]
+		ametrics["HintsInProblem"] = len(state.hints_in_problem)
+		ametrics["HintsLast3"] = sum(state.last_three_hints)/len(state.last_three_hints)
+		ametrics["CurrentHints"] = state.last_three_hints[-1]
+		ametrics["LastHints"] = state.last_three_hints[-2] if len(state.last_three_hints) > 1 else None
+		ametrics["CurrentCorrect"] = state.last_three_answers[-1]
+		ametrics["LastCorrect"] = state.last_three_answers[-2] if len(state.last_three_answers) > 1 else None
+		ametrics["LastIncorrectAttempts"] = state.incorrect_attempts[-2] if len(state.incorrect_attempts) > 1 else 0
+		ametrics["CurrentIncorrectAttempts"] = state.incorrect_attempts[-1]
+
+	#Finishes off a student's last problem if they ended their session without a final EndProblem
+	def finishStudent(self, state):
+		if state.seen_attempt:
+			self.updateAnswerMetrics(state.answer_metrics[-1], state, state.last_row)
+
+	#Works out the EventType and UniqueEndProb for a row, and extracts the student's metrics from it
+	#codes are the row's (activity, action, emotion) codes, if they've already been worked out (see encodeColumns())
+	def processRow(self, state, row, codes=None):
+		h = self.h
+		problem_difficulty = self.problem_difficulty
+		activity_code, action_code, emotion_code = codes or self.encodeRow(row)
+		activity = self.activities.values[activity_code]
+		action = self.actions.values[action_code]
+		action_kind = self.actions.resolved[action_code]
+		ends_problem, event = self.event_classifier.classify(activity, state.last_activity, action, state.last_action)
+		state.unique_end_prob, updated = self.updateUniqueEndProb(state.unique_end_prob, state.session_num, row, ends_problem)
+		state.event_type, state.session_num = self.updateEventType(state.event_type, state.session_num, row, event)
+
+		#Store these for the next row's unique_end_prob check
+		state.last_activity = activity
+		state.last_action = action
+
+		#Extract some per-student metrics from this row
+		studId = state.studId
+		metrics = state.metrics
+		if action_kind == action_end_problem:
+			metrics["TimeInTutor"] += float(row[h["probElapsed"]])/60000 #convert from ms to min
+		elif action_kind == action_attempt:
+			isCorrect = row[h["isCorrect"]]
+			if state.unique_end_prob != state.last_attempt_unique_end_prob:
+				state.last_attempt_unique_end_prob = state.unique_end_prob #mark this problem as attempted
+				metrics["AvgProblemDifficulty"] += problem_difficulty[row[h["problemId"]]]
+				state.last_three_answers.append(isCorrect)
+				metrics["CorrectTotal" if isCorrect == 1 else "IncorrectTotal"] += 1
+				state.incorrect_attempts.append(0)
+			if isCorrect == 0:
+				metrics["TotalIncorrectAttempts"] += 1
+				state.incorrect_attempts[-1] += 1
+		elif action_kind == action_hint:
+			hintId = row[h["hintId"]]
+			if hintId not in state.hints_in_problem:
+				state.hints_in_problem.add(hintId)
+				metrics["NumHints"] += 1
+
+		#Extract some time-series metrics about the student;
+		# a few of these are collected above in the per-student metrics
+		if not state.seen_attempt and action_kind == action_attempt:
+			state.seen_attempt = True
+			ametrics = AnswerRecord()
+			ametrics["studId"] = studId
+			#get the current time used on previous problems plus the time on this current problem
+			timeOnProblem = float(row[h["probElapsed"]])/60000 #convert from ms to min
+			ametrics["TimeInTutor"] = metrics["TimeInTutor"] + timeOnProblem
+			ametrics["TimeToFirst"] = timeOnProblem
+			for metric in ("Total Messages", "Empathy Messages", "GrowthMindset Messages",
+							"SuccessFailure Messages", "CorrectTotal", "IncorrectTotal"):
+				ametrics[metric] = metrics[metric]
+			if len(state.answer_metrics) > 0:
+				last_answer_metrics = state.answer_metrics[-1]
+				for message_type in ("Empathy", "GrowthMindset", "SuccessFailure"):
+					delta = ametrics[message_type + " Messages"] - last_answer_metrics[message_type + " Messages"]
+					ametrics["Last Problem " + message_type] = 1 if delta > 0 else 0
+
+			correctlast3 = 0
+			incorrectlast3 = 0
+			for attempt in state.last_three_answers:
+				if attempt == 1:
+					correctlast3 += 1
+				else:
+					incorrectlast3 += 1
+			ametrics["CorrectLast3"] = correctlast3
+			ametrics["IncorrectLast3"] = incorrectlast3
+			ametrics["ProblemDifficulty"] = problem_difficulty[int(row[h["problemId"]])]
+			state.answer_metrics.append(ametrics)
+		elif state.seen_attempt and action_kind == action_end_problem:
+			state.seen_attempt = False
+			self.updateAnswerMetrics(state.answer_metrics[-1], state, row)
+			state.hints_in_problem = set()
+
+		if action_kind == action_input_response and state.event_type == "EmoReport" and row[h["userInput"]]:
+			userInput = row[h["userInput"]]
+			m = re.search('<emotion name="([^"]*)"\\s*level="([^"]*)"', userInput)
+			if m:
+				emotion = m.group(1)
+				response = int(m.group(2))
+				if response >= 1 and response <= 5:
+					emetrics_list = state.emotion_metrics[emotion]
+					last_emetrics = emetrics_list[-1] if len(emetrics_list) > 0 else EmotionRecord()
+					emetrics = EmotionRecord()
+					emetrics["studId"] = studId
+					emetrics[emotion] = response
+					#For these, find the increase since the last record
+					for metric in ("AvgProblemDifficulty", "CorrectTotal", "IncorrectTotal", "TotalIncorrectAttempts",
+									"Empathy Messages", "GrowthMindset Messages", "SuccessFailure Messages"):
+						emetrics[metric] = metrics[metric] - last_emetrics[metric]
+					#can't average yet, because we need to use the raw value to get the diff for the next entry
+					# emetrics["AvgProblemDifficulty"] /= max(1, emetrics["CorrectTotal"] + emetrics["IncorrectTotal"])
+					emetrics_list.append(emetrics)
+
+		#Delay updating this until after the other metrics are recorded,
+		# because it technically plays after the action we're recording
+		message_metric = self.emotions.resolved[emotion_code]
+		if message_metric is not None:
+			metrics[message_metric] += 1
+			metrics["Total Messages"] += 1
+
+		state.last_row = row
+
+#The rows are sorted by student, so each student's rows are one (studId, start, end) slice of the event log
+def studentSlices(rows, studId_column):
+	start = 0
+	for i in range(1, len(rows) + 1):
+		if i == len(rows) or rows[i][studId_column] != rows[start][studId_column]:
+			yield rows[start][studId_column], start, i
+			start = i
+
+#What the worker processes work from; they're forked, so they see this as it was when the pool was started
+worker_context = None
+
+#Processes one student's slice of the event log, picking up from their saved state if there is one
+def processStudentRows(task):
+	processor, rows, codes, student_states = worker_context
+	studId, start, end = task
+	state = student_states.get(studId) or StudentState(studId)
+	generated = []
+	student_days = set()
+	for i in range(start, end):
+		row = rows[i]
+		student_days.add(row[processor.h["time"]].date())
+		processor.processRow(state, row, (codes[0][i], codes[1][i], codes[2][i]) if codes is not None else None)
+		generated.append((state.event_type, state.unique_end_prob))
+	return state, generated, student_days
+
+#Run through and process the event log
+#student_states has everyone's state so far (by studId), and new students get added to it as they show up,
+# by calling add_student(state) so the caller can keep track of them in order
+#For each row, store_generated(i, row, event_type, unique_end_prob, unique_end_prob_offset) is called with the new columns;
+# unique_end_prob is the student's own count, and unique_end_prob_offset is the number used up by the students before them
+#Rows can be a generator unless processes > 1; returns the number of rows and the set of days they cover
+def processEventlog(processor, rows, student_states, add_student, store_generated, processes=1):
+	global worker_context
+	h = processor.h
+	num_rows = 0
+	days = set() #Metrics for sanity checks
+	unique_end_prob_offset = 0 #the number of UniqueEndProbs used up by the students before this one
+	codes = processor.encodeColumns(rows)
+	if processes > 1 and hasattr(rows, "__len__") and hasattr(os, "fork"):
+		#Nothing carries over between students, so each student's rows can be processed in a separate process
+		#The results come back in order, so the new columns are numbered the same as when it's all done here
+		slices = list(studentSlices(rows, h["studId"]))
+		print "Processing the event log for %d students across %d processes..." % (len(slices), processes)
+		worker_context = (processor, rows, codes, student_states)
+		pool = multiprocessing.Pool(processes)
+		results = pool.imap(processStudentRows, slices, max(1, len(slices) // (processes * 4)))
+		for (studId, start, end), (state, generated, student_days) in izip(slices, results):
+			add_student(state)
+			days |= student_days
+			for j,(event_type, unique_end_prob) in enumerate(generated):
+				store_generated(start + j, rows[start + j], event_type, unique_end_prob, unique_end_prob_offset)
+			unique_end_prob_offset += state.unique_end_prob
+			num_rows += end - start
+		pool.close()
+		pool.join()
+		worker_context = None
+	else:
+		state = None
+		row_codes = izip(*codes) if codes is not None else repeat(None)
+		for i,(row, row_code) in enumerate(izip(rows, row_codes)):
+			num_rows += 1
+
+			#Building some of the metrics to print out for a sanity check
+			days.add(row[h["time"]].date())
+
+			studId = row[h["studId"]]
+			if state is None or studId != state.studId:
+				if state is not None:
+					unique_end_prob_offset += state.unique_end_prob
+				if studId not in student_states:
+					add_student(StudentState(studId))
+				state = student_states[studId]
+			processor.processRow(state, row, row_code)
+			store_generated(i, row, state.event_type, state.unique_end_prob, unique_end_prob_offset)
+	return num_rows, days
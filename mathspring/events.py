@@ -0,0 +1,38 @@
+#Classifies event log rows from their activityName and action text
+#There are only a handful of distinct activity/action strings, so rather than doing every substring check
+# on every row, we do them once for each distinct combination and remember the answer
+class EventClassifier(object):
+	#event_map maps a piece of text to look for onto the nice event name for the EventType column,
+	# and ends_problem(activity, last_activity, action, last_action) says whether a row starts a new UniqueEndProb
+	def __init__(self, event_map, ends_problem, max_patterns=100000):
+		#These get checked in the same order that event_map.items() gives them, so the first match is the same as before
+		self.triggers = tuple(event_map.items())
+		self.ends_problem = ends_problem
+		self.max_patterns = max_patterns #in case the strings aren't as repetitive as we think
+		self.patterns = {}
+		self.hits = 0
+		self.misses = 0
+
+	#Checks if any of the events in event_map occur in the provided raw_event,
+	# which will be pulled from the "activityName" and "action" columns
+	#If so, it returns the corresponding nice event name for the "EventType" column
+	def checkForEvent(self, raw_event):
+		for trigger,event in self.triggers:
+			if trigger in raw_event:
+				return event
+		return None
+
+	#Returns (ends_problem, event) for a row, where event is None if the row doesn't change the EventType
+	#This doesn't include the session check, since that depends on more than the text
+	def classify(self, activity, last_activity, action, last_action):
+		key = (activity, last_activity, action, last_action)
+		result = self.patterns.get(key)
+		if result is not None:
+			self.hits += 1
+			return result
+		self.misses += 1
+		result = (self.ends_problem(activity, last_activity, action, last_action),
+				  self.checkForEvent(activity) or self.checkForEvent(action))
+		if len(self.patterns) < self.max_patterns:
+			self.patterns[key] = result
+		return result
@@ -0,0 +1,162 @@
+#The file formats the study's tables can be written out as
+#Every format is written one row at a time in order, so none of them have to hold a whole table in memory:
+#	xlsx - an Excel workbook with a sheet per table; tables longer than Excel allows carry on in extra sheets
+#	csv, tsv - a folder with a file per table
+#	sqlite - a database file with a (untyped) table per table
+#Each export has addTable(name, headers), which returns a table with writeRow(row, bold=False) (row can be any iterable), and close()
+import csv, os, shutil
+from decimal import Decimal
+
+export_formats = ("xlsx", "csv", "tsv", "sqlite")
+
+#The most rows an Excel sheet can have, including the header row
+excel_max_rows = 1048576
+
+#Where an export in the given format goes, based on the configured output file
+#csv and tsv exports are folders, named like the output file without its extension
+def outputPath(output_file, output_format):
+	base, extension = os.path.splitext(output_file)
+	if extension.lower() not in (".xlsx", ".sqlite", ".csv", ".tsv", ""):
+		base = output_file
+	if output_format in ("csv", "tsv"):
+		return base + "-" + output_format
+	return base + "." + output_format
+
+def openExport(path, output_format, streaming=True):
+	if output_format == "xlsx":
+		return XlsxExport(path, streaming)
+	elif output_format in ("csv", "tsv"):
+		return DelimitedExport(path, "," if output_format == "csv" else "\t")
+	elif output_format == "sqlite":
+		return SqliteExport(path)
+	raise ValueError("Unknown output format: %s (the formats are %s)" % (output_format, ", ".join(export_formats)))
+
+class XlsxExport(object):
+	#When streaming, xlsxwriter's constant_memory mode writes each row out to disk as soon as the next one starts,
+	# instead of keeping every sheet in memory until the workbook is closed
+	def __init__(self, path, streaming=True, max_rows=excel_max_rows):
+		import xlsxwriter #The package we use to write excel files with formatting and multiple sheets
+		self.workbook = xlsxwriter.Workbook(path, {"constant_memory": streaming})
+		self.bold_format = self.workbook.add_format()
+		self.bold_format.set_bold()
+		self.max_rows = max_rows
+
+	def addTable(self, name, headers):
+		return XlsxTable(self, name, headers)
+
+	def close(self):
+		self.workbook.close()
+
+class XlsxTable(object):
+	def __init__(self, export, name, headers):
+		self.export = export
+		self.name = name
+		self.headers = headers
+		self.num_sheets = 0
+		self.startSheet()
+
+	#Once a sheet is full, the table carries on in "name (2)", "name (3)", etc., each with its own header row
+	def startSheet(self):
+		self.num_sheets += 1
+		self.sheet = self.export.workbook.add_worksheet(self.name if self.num_sheets == 1 else "%s (%d)" % (self.name, self.num_sheets))
+		self.sheet.write_row(0, 0, self.headers, self.export.bold_format)
+		self.row_num = 1
+
+	#bold is either True/False for the whole row, or a True/False for each cell
+	def writeRow(self, row, bold=False):
+		if self.row_num == self.export.max_rows:
+			self.startSheet()
+		if bold is True or bold is False:
+			self.sheet.write_row(self.row_num, 0, row, self.export.bold_format if bold else None)
+		else:
+			for c,(value, cell_bold) in enumerate(zip(row, bold)):
+				self.sheet.write(self.row_num, c, value, self.export.bold_format if cell_bold else None)
+		self.row_num += 1
+
+class DelimitedExport(object):
+	def __init__(self, path, delimiter):
+		self.path = path
+		self.delimiter = delimiter
+		self.extension = ".csv" if delimiter == "," else ".tsv"
+		if os.path.exists(path):
+			shutil.rmtree(path)
+		os.makedirs(path)
+		self.files = []
+
+	def addTable(self, name, headers):
+		f = open(os.path.join(self.path, name + self.extension), "wb")
+		self.files.append(f)
+		return DelimitedTable(f, self.delimiter, headers)
+
+	def close(self):
+		for f in self.files:
+			f.close()
+
+#The csv module doesn't take unicode, so that gets written as utf-8, and it would round floats to 12 digits
+def delimitedValue(value):
+	if value is None:
+		return ""
+	elif isinstance(value, unicode):
+		return value.encode("utf-8")
+	elif isinstance(value, float):
+		return repr(value)
+	return value
+
+class DelimitedTable(object):
+	def __init__(self, f, delimiter, headers):
+		self.writer = csv.writer(f, delimiter=delimiter, lineterminator="\n")
+		self.writer.writerow([delimitedValue(header) for header in headers])
+
+	def writeRow(self, row, bold=False):
+		self.writer.writerow([delimitedValue(value) for value in row])
+
+class SqliteExport(object):
+	#Rows are committed in one transaction at the end, which is much faster than committing each insert
+	def __init__(self, path):
+		import sqlite3
+		if os.path.exists(path):
+			os.remove(path)
+		self.connection = sqlite3.connect(path)
+
+	def addTable(self, name, headers):
+		return SqliteTable(self.connection, name, headers)
+
+	def close(self):
+		self.connection.commit()
+		self.connection.close()
+
+def quoteIdentifier(name):
+	return '"' + unicode(name).replace('"', '""') + '"'
+
+#Text from the database is latin1, and sqlite can't store Decimals
+def sqliteValue(value):
+	if isinstance(value, str):
+		return value.decode("latin1")
+	elif isinstance(value, Decimal):
+		return float(value)
+	return value
+
+#types optionally gives each column a declared type (e.g. TIMESTAMP, so sqlite3 can turn it back into a datetime)
+class SqliteTable(object):
+	def __init__(self, connection, name, headers, types=None):
+		self.connection = connection
+		#Column names have to be unique, which the headers of e.g. the pre/post summary aren't
+		columns = []
+		for header in headers:
+			column = unicode(header if header is not None else "")
+			suffix = 1
+			while column in columns:
+				suffix += 1
+				column = u"%s %d" % (header, suffix)
+			columns.append(column)
+		self.num_columns = len(columns)
+		connection.execute("DROP TABLE IF EXISTS " + quoteIdentifier(name))
+		types = types or [None] * len(columns)
+		connection.execute("CREATE TABLE " + quoteIdentifier(name) + " (" + ", ".join(quoteIdentifier(column) + (" " + kind if kind else "")
+			for column, kind in zip(columns, types)) + ")")
+		self.insert = "INSERT INTO " + quoteIdentifier(name) + " VALUES (" + ", ".join("?" for column in columns) + ")"
+
+	def writeRow(self, row, bold=False):
+		values = [sqliteValue(value) for value in row]
+		values += [None] * (self.num_columns - len(values))
+		self.connection.execute(self.insert, values)
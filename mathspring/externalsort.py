@@ -0,0 +1,153 @@
+#Sorting an event log that's bigger than the memory we're allowed to use, like an exported dump that isn't in any order
+#The rows are read into memory until they reach the budget, then that run is sorted and written out to a file, and so on;
+# at the end the runs are merged, which only needs one row from each run in memory at a time
+#If there are more runs than can be open at once, they're merged in groups into longer runs first
+#Rows that sort the same stay in the order they were read, like Python's own sort
+import csv, heapq, os, pickle, shutil, sys, tempfile
+from datetime import datetime
+
+#The kinds of the event log's columns that aren't strings, for reading them back out of a dump
+#(anything not listed here, like userInput, stays a string even if it looks like a number)
+eventlog_int_columns = ("id", "studId", "sessNum", "isCorrect", "elapsedTime", "probElapsed", "problemId", "hintStep", "hintId",
+	"auxId", "curTopicId", "clickTime")
+eventlog_time_columns = ("time",)
+#What a dump can have in place of NULL
+null_values = ("NULL", "\\N")
+
+#Parses a DATETIME/TIMESTAMP as MySQL writes it out ("2016-12-01 09:30:00", optionally with fractional seconds)
+def parseTime(text):
+	microseconds = 0
+	if len(text) > 19:
+		microseconds = int((text[20:] + "000000")[:6])
+	return datetime(int(text[0:4]), int(text[5:7]), int(text[8:10]), int(text[11:13]), int(text[14:16]), int(text[17:19]), microseconds)
+
+def parseInt(text):
+	try:
+		return int(text)
+	except ValueError:
+		return int(float(text))
+
+#Reads an exported event log: a CSV or TSV file (going by its extension) whose first row is the column names,
+# like what SELECT ... INTO OUTFILE or a database tool's export gives
+#Returns the column names and a generator of the rows, with the numbers and times turned back into numbers and times
+def readDump(filename):
+	f = open(filename, 'rb')
+	delimiter = "\t" if os.path.splitext(filename)[1].lower() in (".tsv", ".txt") else ","
+	reader = csv.reader(f, delimiter=delimiter)
+	headers = tuple(name.strip() for name in next(reader))
+	parsers = [parseInt if name in eventlog_int_columns else parseTime if name in eventlog_time_columns else None for name in headers]
+	def rows():
+		with f:
+			for values in reader:
+				row = []
+				for parser, value in zip(parsers, values):
+					value = value.strip()
+					if value in null_values or (value == "" and parser is not None):
+						row.append(None)
+					elif parser is not None:
+						row.append(parser(value))
+					else:
+						row.append(value)
+				yield row
+	return headers, rows()
+
+#The columnar.py kinds of a dump's columns, for saving the sorted rows
+def columnKinds(headers):
+	return ["int" if name in eventlog_int_columns else "datetime" if name in eventlog_time_columns else "object" for name in headers]
+
+#Roughly how much memory a row takes up, counting the list and its values
+def rowSize(row):
+	return sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+
+def writeRun(filename, entries):
+	with open(filename, 'wb') as f:
+		pickler = pickle.Pickler(f, pickle.HIGHEST_PROTOCOL)
+		for entry in entries:
+			pickler.dump(entry)
+			pickler.clear_memo() #otherwise the pickler keeps a reference to every row it has written
+
+def readRun(filename):
+	with open(filename, 'rb') as f:
+		unpickler = pickle.Unpickler(f)
+		while True:
+			try:
+				yield unpickler.load()
+			except EOFError:
+				break
+
+#key(row) gives what to sort a row by; memory_megabytes is roughly how much the rows waiting to be sorted can take up,
+# and max_open_runs is how many run files are merged at once
+#The runs go in a temporary folder inside folder, which is removed once the sorted rows have all been read
+class ExternalSorter(object):
+	def __init__(self, key, memory_megabytes, folder, max_open_runs=64):
+		self.key = key
+		self.memory_bytes = memory_megabytes * 2**20
+		self.max_open_runs = max(2, max_open_runs)
+		if not os.path.exists(folder):
+			os.makedirs(folder)
+		self.folder = tempfile.mkdtemp(prefix="sort-", dir=folder)
+		self.runs = []
+		self.run = []
+		self.run_bytes = 0
+		self.num_rows = 0
+		self.num_run_files = 0
+
+	def add(self, row):
+		#the row number keeps the order of rows with the same key, and means the rows themselves never get compared
+		entry = self.key(row) + (self.num_rows, row)
+		self.num_rows += 1
+		self.run.append(entry)
+		self.run_bytes += rowSize(row) + 100 #plus the entry tuple and the key's values
+		if self.run_bytes >= self.memory_bytes:
+			self.spill()
+
+	def extend(self, rows):
+		for row in rows:
+			self.add(row)
+
+	def newRunFilename(self):
+		self.num_run_files += 1
+		return os.path.join(self.folder, "%d.run" % self.num_run_files)
+
+	#Writes the rows we're holding out as a sorted run
+	def spill(self):
+		if not self.run:
+			return
+		self.run.sort()
+		filename = self.newRunFilename()
+		writeRun(filename, self.run)
+		self.runs.append(filename)
+		self.run = []
+		self.run_bytes = 0
+
+	#The rows, in order
+	#If everything fit in memory, nothing is written out at all
+	def sorted(self):
+		try:
+			if not self.runs:
+				self.run.sort()
+				entries = self.run
+				self.run = []
+			else:
+				self.spill()
+				runs = self.runs
+				while len(runs) > self.max_open_runs:
+					merged = []
+					for i in range(0, len(runs), self.max_open_runs):
+						group = runs[i:i+self.max_open_runs]
+						filename = self.newRunFilename()
+						writeRun(filename, heapq.merge(*[readRun(run) for run in group]))
+						for run in group:
+							os.remove(run)
+						merged.append(filename)
+					runs = merged
+				entries = heapq.merge(*[readRun(run) for run in runs])
+			for entry in entries:
+				yield entry[-1]
+		finally:
+			self.close()
+
+	def close(self):
+		if os.path.exists(self.folder):
+			shutil.rmtree(self.folder)
+		self.runs = []
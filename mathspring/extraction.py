@@ -0,0 +1,163 @@
+#Pulling a big event log in pieces
+#The regular query wraps time in DATE(), which stops the database from using its index on time, and puts every
+# student id into one IN (...) list; the planner here instead:
+#	uses half-open ranges on time itself (time >= start AND time < the day after the end)
+#	splits the students and the time ranges into chunks, which are pulled at the same time on separate connections
+#	pulls each chunk a page at a time, carrying on from the last (studId, time, id) it got (keyset pagination),
+#	 so no page has to skip over the ones before it the way OFFSET does
+#	saves each page as it arrives, so a pull that gets interrupted carries on from where it stopped next time
+#The chunks are put back together in (studId, time, id) order, the same as the regular query's (studId, time) order
+from __future__ import division
+from datetime import datetime, timedelta
+import hashlib, json, os, shutil
+from mathspring import columnar, querypool
+
+#Turns the configured (first day, last day) time ranges into half-open datetime ranges, joining any that overlap
+def halfOpenRanges(time_ranges):
+	ranges = []
+	for start, end in sorted(time_ranges):
+		start = datetime(start.year, start.month, start.day)
+		end = datetime(end.year, end.month, end.day) + timedelta(days=1)
+		if ranges and start <= ranges[-1][1]:
+			ranges[-1] = (ranges[-1][0], max(ranges[-1][1], end))
+		else:
+			ranges.append((start, end))
+	return ranges
+
+def splitList(values, size):
+	return [values[i:i+size] for i in range(0, len(values), size)]
+
+def splitRange(start, end, days):
+	pieces = []
+	while start < end:
+		pieces.append((start, min(start + timedelta(days=days), end)))
+		start = pieces[-1][1]
+	return pieces
+
+def timeLiteral(time):
+	return "'" + str(time) + "'"
+
+#What to pull and how to split it up
+#select is the query up to the WHERE (e.g. "SELECT * FROM eventlog"), and the time ranges are the configured
+# (first day, last day) ones, with none meaning all of the time there is
+class ExtractionPlan(object):
+	def __init__(self, select, student_ids, time_ranges, chunk_students=500, chunk_days=7, page_rows=50000):
+		self.select = select
+		self.student_ids = sorted(student_ids)
+		self.ranges = halfOpenRanges(time_ranges)
+		self.chunk_students = chunk_students
+		self.chunk_days = chunk_days
+		self.page_rows = page_rows
+		#Each chunk is (students, time range or None); they're in (studId, time) order, students first
+		self.student_chunks = splitList(self.student_ids, chunk_students)
+		self.time_chunks = [piece for start, end in self.ranges for piece in splitRange(start, end, chunk_days)] or [None]
+		self.chunks = [(students, time_chunk) for students in self.student_chunks for time_chunk in self.time_chunks]
+
+	#Stands in for the query text when caching the result; the chunk sizes don't change the result, so they're left out
+	def key(self):
+		return "EXTRACT " + self.select + " WHERE studId IN " + str(tuple(self.student_ids)) \
+			+ " AND time IN " + str([(str(start), str(end)) for start, end in self.ranges]) + " ORDER BY studId, time, id"
+
+	#Where the pages of a pull in progress are kept; this does depend on the chunk sizes
+	def progressKey(self):
+		return hashlib.sha1(json.dumps([self.key(), self.chunk_students, self.chunk_days, self.page_rows])).hexdigest()
+
+	#The query for one page of a chunk, after the (studId, time, id) of the last row of the page before (if there was one)
+	def pageQuery(self, chunk, after=None):
+		students, time_chunk = chunk
+		conditions = ["studId IN (" + ", ".join(str(studId) for studId in students) + ")"]
+		if time_chunk is not None:
+			conditions.append("time >= " + timeLiteral(time_chunk[0]) + " AND time < " + timeLiteral(time_chunk[1]))
+		if after is not None:
+			studId, time, row_id = after
+			conditions.append("(studId > %d OR (studId = %d AND (time > %s OR (time = %s AND id > %d))))" % \
+				(studId, studId, timeLiteral(time), timeLiteral(time), row_id))
+		return self.select + " WHERE " + " AND ".join(conditions) + " ORDER BY studId ASC, time ASC, id ASC LIMIT %d" % self.page_rows
+
+#Pulls one chunk into its folder a page at a time, starting after the pages that are already there
+#Each page is a columnar table, which only shows up once it's complete, and a "done" file marks the end of the chunk
+#h maps the column names to their positions
+def pullChunk(db, plan, chunk, folder, h):
+	if not os.path.exists(folder):
+		os.makedirs(folder)
+	done_filename = os.path.join(folder, "done")
+	num_pages = 0
+	after = None
+	while os.path.exists(os.path.join(folder, "%d.columns" % num_pages)):
+		last_page = columnar.ColumnarTable(os.path.join(folder, "%d.columns" % num_pages))
+		num_pages += 1
+		if len(last_page) > 0:
+			last_row = last_page[len(last_page) - 1]
+			after = (last_row[h["studId"]], last_row[h["time"]], last_row[h["id"]])
+	while not os.path.exists(done_filename):
+		rows, names = db.execute(plan.pageQuery(chunk, after))
+		if len(rows) > 0:
+			columnar.writeColumnar(os.path.join(folder, "%d.columns" % num_pages), rows, names)
+			num_pages += 1
+			last_row = rows[-1]
+			after = (last_row[h["studId"]], last_row[h["time"]], last_row[h["id"]])
+		if len(rows) < plan.page_rows:
+			open(done_filename, 'w').close()
+	return num_pages
+
+def readChunk(folder):
+	rows = []
+	num_pages = 0
+	while os.path.exists(os.path.join(folder, "%d.columns" % num_pages)):
+		rows.extend(list(row) for row in columnar.ColumnarTable(os.path.join(folder, "%d.columns" % num_pages)))
+		num_pages += 1
+	return rows
+
+#Where a pull's chunks are kept until its result is safely in the query cache
+def progressFolder(db, plan):
+	return os.path.join(db.query_cache.folder, plan.progressKey() + ".chunks")
+
+#Removes a pull's chunks; only call this once the result has been cached, or a pull that stops in between is lost
+def removeProgress(db, plan):
+	folder = progressFolder(db, plan)
+	if os.path.exists(folder):
+		shutil.rmtree(folder)
+
+#Pulls everything in the plan, with up to num_connections chunks at once, and returns (rows, column names)
+#headers are the names of the columns the select gives (they're needed to find the studId, time and id of each row)
+#The chunks are left where they are (see removeProgress())
+def extract(db, plan, headers, num_connections=1):
+	h = {name: c for c,name in enumerate(headers)}
+	folder = progressFolder(db, plan)
+	folders = [os.path.join(folder, str(i)) for i in range(len(plan.chunks))]
+	num_done = sum(1 for chunk_folder in folders if os.path.exists(os.path.join(chunk_folder, "done")))
+	if num_done > 0:
+		print "Carrying on with an event log pull that was %d/%d chunks done..." % (num_done, len(plan.chunks))
+	print "Pulling the event log in %d chunks (%d groups of students x %d time ranges)..." % \
+		(len(plan.chunks), len(plan.student_chunks), len(plan.time_chunks))
+	if num_connections > 1:
+		scheduler = querypool.QueryScheduler(num_connections)
+		jobs = [scheduler.submit(str(i), lambda chunk=chunk, chunk_folder=chunk_folder: pullChunk(db, plan, chunk, chunk_folder, h))
+				for i,(chunk, chunk_folder) in enumerate(zip(plan.chunks, folders))]
+		for job in jobs:
+			job.result()
+		scheduler.close()
+	else:
+		for chunk, chunk_folder in zip(plan.chunks, folders):
+			pullChunk(db, plan, chunk, chunk_folder, h)
+
+	#Each group of students is in order already once its time chunks are put in order by student;
+	# the sort is stable, so each student's rows stay in time order
+	rows = []
+	num_time_chunks = len(plan.time_chunks)
+	for i in range(0, len(folders), num_time_chunks):
+		group = []
+		for chunk_folder in folders[i:i+num_time_chunks]:
+			group.extend(readChunk(chunk_folder))
+		group.sort(key=lambda row: row[h["studId"]])
+		rows.extend(group)
+	return rows, list(headers)
+
+#The difficulty of each problem in the event log, asked for by id (a few at a time, for big studies)
+#Returns rows of (id, difficulty), like the regular query
+def problemDifficulties(db, problem_ids, chunk_size=1000):
+	rows = []
+	for ids in splitList(sorted(problem_ids), chunk_size):
+		rows.extend(db.query("problem_difficulties", "SELECT id,cachedProbDifficulty FROM problem WHERE id IN (" \
+			+ ", ".join(str(problem_id) for problem_id in ids) + ") ORDER BY id ASC;"))
+	return rows
@@ -0,0 +1,95 @@
+#Keeps an event log that can be topped up with new rows, for studies that are still running
+#The rows are stored as a series of columnar segments: the first one is the initial pull, and each refresh
+# adds a segment with just the rows that came in since the last one
+#For each student we remember the (time, id) of the newest row we have, which is the "high-water mark"
+# used to ask the database for only the rows after it
+#Each segment also stores the columns we derived for its rows, and the processing state is saved after each
+# refresh, so old rows never have to be processed again
+import heapq, os, pickle, shutil
+from mathspring import columnar
+
+class IncrementalEventlog(object):
+	def __init__(self, folder, studId_column, time_column, id_column):
+		self.folder = folder
+		self.studId_column = studId_column
+		self.time_column = time_column
+		self.id_column = id_column
+		self.state_filename = os.path.join(folder, "state.pickle")
+		if not os.path.exists(folder):
+			os.makedirs(folder)
+		self.num_segments = 0
+		self.num_rows = 0
+		self.marks = {} #studId -> (time, id) of the newest row we have for that student
+		self.saved = None #whatever the processing wanted to keep from last time
+		if os.path.exists(self.state_filename):
+			with open(self.state_filename, 'rb') as f:
+				state = pickle.load(f)
+			self.num_segments = state["num_segments"]
+			self.num_rows = state["num_rows"]
+			self.marks = state["marks"]
+			self.saved = state["saved"]
+
+	def segmentPath(self, n):
+		return os.path.join(self.folder, "%d.columns" % n)
+
+	def derivedPath(self, n):
+		return os.path.join(self.folder, "%d.derived.columns" % n)
+
+	#The SQL condition that picks out the rows that might be newer than the ones we have, or None if we don't have any yet
+	#It's just the rows after the lowest of the students' high-water ids, which is one index range however many students
+	# there are; newRows() then drops the ones a student already had
+	#Rows are assumed to show up in (time, id) order for each student, which holds as long as ids are auto-incremented
+	def newRowsCondition(self):
+		if len(self.marks) == 0:
+			return None
+		return "id > %d" % min(row_id for _, row_id in self.marks.values())
+
+	#The rows (from newRowsCondition()'s query) that are newer than the high-water mark of their student
+	def newRows(self, rows):
+		marks = self.marks
+		studId_column, time_column, id_column = self.studId_column, self.time_column, self.id_column
+		return [row for row in rows if row[studId_column] not in marks or (row[time_column], row[id_column]) > marks[row[studId_column]]]
+
+	#Stores new rows (sorted by studId, time) as the next segment and moves the high-water marks up
+	#The returned writer is for the derived columns of those rows, one row of derived values per event log row
+	def addSegment(self, rows, names=None):
+		n = self.num_segments
+		segment_path = self.segmentPath(n)
+		if os.path.exists(segment_path): #left over from a refresh that didn't finish
+			shutil.rmtree(segment_path)
+		if isinstance(rows, columnar.ColumnarTable):
+			shutil.copytree(rows.path, segment_path)
+		else:
+			columnar.writeColumnar(segment_path, rows, names)
+		for row in rows:
+			studId = row[self.studId_column]
+			mark = (row[self.time_column], row[self.id_column])
+			if studId not in self.marks or mark > self.marks[studId]:
+				self.marks[studId] = mark
+		self.num_segments += 1
+		self.num_rows += len(rows)
+		return columnar.ColumnarWriter(self.derivedPath(n), ("object", "int"), ("EventType", "UniqueEndProb"))
+
+	#Saves the high-water marks and segment list along with whatever the processing needs to pick up where it left off
+	#Until this is called, any segments added since the last save are ignored the next time the store is opened
+	def save(self, saved):
+		self.saved = saved
+		partial_filename = self.state_filename + ".partial"
+		with open(partial_filename, 'wb') as f:
+			pickle.dump(dict(num_segments=self.num_segments, num_rows=self.num_rows, marks=self.marks, saved=saved),
+						f, pickle.HIGHEST_PROTOCOL)
+		if os.path.exists(self.state_filename):
+			os.remove(self.state_filename)
+		os.rename(partial_filename, self.state_filename)
+
+	#Goes through every row we have in (studId, time) order, along with its derived columns
+	#Rows for the same student in a later segment always come after the ones in earlier segments
+	def iterMerged(self):
+		def segmentRows(n):
+			rows = columnar.ColumnarTable(self.segmentPath(n))
+			derived = columnar.ColumnarTable(self.derivedPath(n))
+			for i in range(len(rows)):
+				row = rows[i]
+				yield row[self.studId_column], n, i, row, derived[i]
+		for _, _, _, row, derived in heapq.merge(*[segmentRows(n) for n in range(self.num_segments)]):
+			yield row, derived
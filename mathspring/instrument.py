@@ -0,0 +1,123 @@
+#Measuring where a run spends its time and memory, stage by stage
+#For each stage this records the wall clock time, the CPU time (including worker processes that have finished),
+# the peak memory, how many rows went in and came out, and which queries were answered from the cache
+#That's only a few system calls per stage, so it's always on; the sampling profiler is optional, and looks at what the
+# main thread is running every few milliseconds of CPU time, so it doesn't slow the stages down much either
+from __future__ import division
+from collections import defaultdict
+from datetime import datetime
+import json, os, resource, signal, sys, time
+
+#Peak resident memory in MB, of this process and of its largest worker process (ru_maxrss is in KB on Linux, bytes on macOS)
+def peakMemory():
+	scale = 2**20 if sys.platform == "darwin" else 2**10
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+
+#User + system time of this process and of the worker processes that have finished
+def cpuTime():
+	times = os.times()
+	return times[0] + times[1] + times[2] + times[3]
+
+#Counts which functions the main thread is in, every interval seconds of CPU time
+#Only one can run at a time, since there's only one profiling timer
+class SamplingProfiler(object):
+	def __init__(self, interval=0.005):
+		self.interval = interval
+		self.num_samples = 0
+		self.self_counts = defaultdict(int) #the function that was running
+		self.cumulative_counts = defaultdict(int) #every function on the stack at the time
+
+	def sample(self, signum, frame):
+		self.num_samples += 1
+		seen = set()
+		leaf = True
+		while frame is not None:
+			code = frame.f_code
+			function = "%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+			if leaf:
+				self.self_counts[function] += 1
+				leaf = False
+			if function not in seen: #count recursive functions once
+				seen.add(function)
+				self.cumulative_counts[function] += 1
+			frame = frame.f_back
+
+	def start(self):
+		signal.signal(signal.SIGPROF, self.sample)
+		signal.siginterrupt(signal.SIGPROF, False) #so a sample doesn't interrupt a query that's waiting on the database
+		signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+	def stop(self):
+		signal.setitimer(signal.ITIMER_PROF, 0, 0)
+		signal.signal(signal.SIGPROF, signal.SIG_DFL)
+
+	#The functions that came up the most, as [function, share of the samples]
+	def top(self, counts, limit=20):
+		return [[function, count / self.num_samples] for function, count in
+				sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:limit]]
+
+	def summary(self):
+		return dict(samples=self.num_samples, interval_seconds=self.interval,
+			top_self=self.top(self.self_counts), top_cumulative=self.top(self.cumulative_counts))
+
+#The measurements for one run of the pipeline
+#query_cache is the QueryCache whose hits and misses get put down to the stage they happened in
+class Instrumentation(object):
+	def __init__(self, query_cache, profile=False):
+		self.query_cache = query_cache
+		self.profile = profile and hasattr(signal, "setitimer")
+		self.started = datetime.now()
+		self.stages = []
+		self.current = None
+
+	def cacheCounts(self):
+		cache = self.query_cache
+		return len(cache.hits), len(cache.misses), len(cache.refreshed)
+
+	def startStage(self, stage):
+		self.current = dict(stage=stage, wall_start=time.time(), cpu_start=cpuTime(), peak_start=peakMemory()[0],
+			cache_start=self.cacheCounts(), profiler=None)
+		if self.profile:
+			self.current["profiler"] = SamplingProfiler()
+			self.current["profiler"].start()
+
+	#rows_in and rows_out are how many rows the stage took in and put out (None where that doesn't apply),
+	# and checkpoint is whether its saved results were used instead of running it
+	def finishStage(self, rows_in=None, rows_out=None, checkpoint=False):
+		current = self.current
+		self.current = None
+		if current["profiler"] is not None:
+			current["profiler"].stop()
+		peak, peak_workers = peakMemory()
+		cache = self.query_cache
+		hits, misses, refreshed = current["cache_start"]
+		record = dict(stage=current["stage"], wall_seconds=time.time() - current["wall_start"],
+			cpu_seconds=cpuTime() - current["cpu_start"], peak_memory_mb=peak, memory_growth_mb=peak - current["peak_start"],
+			peak_worker_memory_mb=peak_workers, rows_in=rows_in, rows_out=rows_out, checkpoint=checkpoint,
+			cache=dict(hits=cache.hits[hits:], misses=cache.misses[misses:], refreshed=cache.refreshed[refreshed:]))
+		if current["profiler"] is not None:
+			record["profile"] = current["profiler"].summary()
+		self.stages.append(record)
+		return record
+
+	def report(self):
+		return dict(started=self.started.isoformat(), python=sys.version.split()[0], stages=self.stages,
+			total=dict(wall_seconds=sum(record["wall_seconds"] for record in self.stages),
+				cpu_seconds=sum(record["cpu_seconds"] for record in self.stages),
+				peak_memory_mb=max([record["peak_memory_mb"] for record in self.stages] or [0])))
+
+	def save(self, filename):
+		with open(filename, "w") as f:
+			json.dump(self.report(), f, indent=1, sort_keys=True)
+
+	#A short table of the stages for the end of a run
+	def summary(self):
+		def count(value):
+			return "-" if value is None else str(value)
+		lines = ["%-20s %9s %9s %10s %10s %10s %s" % ("Stage", "Wall (s)", "CPU (s)", "Peak (MB)", "Rows in", "Rows out", "Cache hits/misses")]
+		for record in self.stages:
+			lines.append("%-20s %9.2f %9.2f %10.1f %10s %10s %d/%d%s" % (record["stage"], record["wall_seconds"], record["cpu_seconds"],
+				record["peak_memory_mb"], count(record["rows_in"]), count(record["rows_out"]),
+				len(record["cache"]["hits"]), len(record["cache"]["misses"]) + len(record["cache"]["refreshed"]),
+				" (saved results)" if record["checkpoint"] else ""))
+		return "\n".join(lines)
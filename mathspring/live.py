@@ -0,0 +1,169 @@
+#Keeping the per-student numbers up to date while a study is still running
+#A LiveStudy polls the event log for rows with a higher id than the last one it saw (ids are auto-incremented, so new
+# rows always have higher ones), and feeds them into each student's StudentState, the same state machine the enrich stage
+# uses; so each poll only costs as much as the rows that came in, and student_metrics and the timeseries are always current
+#The states are saved every so often (and when it stops), so starting again carries on from the last saved row,
+# and after each poll with new rows a snapshot of everyone's numbers is written out as JSON for local readers (see readSnapshot())
+#synthetic.LiveSimulator can stand in for a running study, by writing made-up rows into a SQLite copy of the tables
+from __future__ import division
+from datetime import datetime
+import json, os, pickle, time
+from mathspring import database, eventlog, pipeline
+from mathspring.prepost import pedagogy_groups, pedagogy_group_order
+
+#A student's numbers so far, as plain data
+#The metrics are finished off the same way as in the prepost stage, but on a copy, since more rows may still come in
+def studentSnapshot(state, pedagogyId):
+	metrics = dict(state.metrics)
+	answered = metrics.get("CorrectTotal", 0) + metrics.get("IncorrectTotal", 0)
+	metrics["AvgProblemDifficulty"] = metrics.get("AvgProblemDifficulty", 0) / max(1, answered)
+	total_messages = metrics.get("Total Messages", 0)
+	for message_type in pedagogy_group_order:
+		metrics["%" + message_type + " Messages"] = metrics.get(message_type + " Messages", 0) / total_messages if total_messages else None
+	emotion_reports = {}
+	for emotion, emotion_metrics in state.emotion_metrics.items():
+		emotion_reports[emotion] = dict(count=len(emotion_metrics), latest=emotion_metrics[-1][emotion] if emotion_metrics else None)
+	return dict(pedagogy=pedagogy_groups.get(pedagogyId), session=state.session_num, problems=state.unique_end_prob,
+		answers=len(state.answer_metrics), emotion_reports=emotion_reports, metrics=metrics)
+
+#Reads the latest snapshot a LiveStudy wrote, or returns None if there isn't one yet
+def readSnapshot(filename):
+	if not os.path.exists(filename):
+		return None
+	with open(filename) as f:
+		return json.load(f)
+
+class LiveStudy(object):
+	#page_rows is how many rows to ask for at once, and save_seconds how often to save the states
+	def __init__(self, config, page_rows=10000, save_seconds=60):
+		self.config = config
+		self.db = database.Database(config)
+		self.page_rows = page_rows
+		self.save_seconds = save_seconds
+		folder = os.path.join(config.data_folder, "live")
+		if not os.path.exists(folder):
+			os.makedirs(folder)
+		self.state_filename = os.path.join(folder, "state.pickle")
+		self.snapshot_filename = os.path.join(folder, "snapshot.json")
+		self.last_id = 0 #the highest event log id we've processed
+		self.num_rows = 0
+		self.days = set()
+		self.problem_difficulty = {}
+		self.student_states = {}
+		if os.path.exists(self.state_filename):
+			with open(self.state_filename, 'rb') as f:
+				saved = pickle.load(f)
+			self.last_id = saved["last_id"]
+			self.num_rows = saved["num_rows"]
+			self.days = saved["days"]
+			self.problem_difficulty = saved["problem_difficulty"]
+			for studId, state in saved["student_states"].items():
+				self.student_states[studId] = eventlog.StudentState.load(state)
+		#These are kept up to date as rows come in, like the enrich stage's
+		self.student_metrics = {studId: state.metrics for studId, state in self.student_states.items()}
+		self.student_timeseries_answer_metrics = {studId: state.answer_metrics for studId, state in self.student_states.items()}
+		self.student_timeseries_emotion_metrics = {studId: state.emotion_metrics for studId, state in self.student_states.items()}
+		self.pedagogies = {}
+		self.student_snapshots = {} #only the students with new rows are worked out again for each snapshot
+		self.changed = set(self.student_states)
+		self.processor = None
+		self.last_save = time.time()
+
+	def connect(self):
+		db = self.db
+		db.connect()
+		if db.pool is None:
+			raise ValueError("Live mode needs the database (a login or db_sqlite_file), since there's nothing new in the cache")
+		headers, h = db.getHeaders("eventlog")
+		self.id_column = h["id"]
+		self.processor = eventlog.EventlogProcessor(h, self.problem_difficulty)
+
+	#Gets the difficulties of any problems in rows that we don't have yet
+	def updateProblems(self, rows):
+		h = self.processor.h
+		problems = set(row[h["problemId"]] for row in rows if row[h["problemId"]] is not None) - set(self.problem_difficulty)
+		if len(problems) > 0:
+			self.problem_difficulty.update(self.db.runQuery("SELECT id,cachedProbDifficulty FROM problem WHERE id IN " +
+				pipeline.sqlList(sorted(problems))))
+
+	def addStudent(self, studId):
+		state = eventlog.StudentState(studId)
+		self.student_states[studId] = state
+		self.student_metrics[studId] = state.metrics
+		self.student_timeseries_answer_metrics[studId] = state.answer_metrics
+		self.student_timeseries_emotion_metrics[studId] = state.emotion_metrics
+		return state
+
+	#Processes the rows that have come in since the last poll, and returns how many there were
+	def poll(self):
+		db = self.db
+		h = self.processor.h
+		#students can join the classes while the study is running
+		self.pedagogies = dict(db.runQuery(pipeline.studentQuery(self.config)))
+		if len(self.pedagogies) == 0:
+			return 0
+		query = "SELECT * FROM eventlog " + pipeline.eventlogConditions(self.config, sorted(self.pedagogies))
+		num_new_rows = 0
+		while True:
+			rows = db.runQuery(query + " AND id > %d ORDER BY id ASC LIMIT %d;" % (self.last_id, self.page_rows))
+			self.updateProblems(rows)
+			for row in rows:
+				studId = row[h["studId"]]
+				state = self.student_states.get(studId) or self.addStudent(studId)
+				self.processor.processRow(state, row)
+				self.days.add(row[h["time"]].date())
+				self.changed.add(studId)
+			if len(rows) > 0:
+				self.last_id = rows[-1][self.id_column]
+			num_new_rows += len(rows)
+			if len(rows) < self.page_rows:
+				break
+		self.num_rows += num_new_rows
+		if num_new_rows > 0 or not os.path.exists(self.snapshot_filename):
+			self.writeSnapshot()
+		if time.time() - self.last_save > self.save_seconds:
+			self.save()
+		return num_new_rows
+
+	#Everyone's numbers so far (see studentSnapshot())
+	def snapshot(self):
+		for studId in self.changed:
+			self.student_snapshots[studId] = studentSnapshot(self.student_states[studId], self.pedagogies.get(studId))
+		self.changed = set()
+		return dict(updated=datetime.now().isoformat(), last_id=self.last_id, eventlog_rows=self.num_rows,
+			days=sorted(str(day) for day in self.days), students={str(studId): snapshot for studId, snapshot in self.student_snapshots.items()})
+
+	#Written to a new file that's then moved into place, so a reader never sees half of one
+	def writeSnapshot(self):
+		partial_filename = self.snapshot_filename + ".partial"
+		with open(partial_filename, "w") as f:
+			json.dump(self.snapshot(), f, sort_keys=True)
+		os.rename(partial_filename, self.snapshot_filename)
+
+	def save(self):
+		partial_filename = self.state_filename + ".partial"
+		with open(partial_filename, 'wb') as f:
+			pickle.dump(dict(last_id=self.last_id, num_rows=self.num_rows, days=self.days, problem_difficulty=self.problem_difficulty,
+				student_states={studId: state.save() for studId, state in self.student_states.items()}), f, pickle.HIGHEST_PROTOCOL)
+		os.rename(partial_filename, self.state_filename)
+		self.last_save = time.time()
+
+	#Polls every interval seconds until it's interrupted (or for max_polls polls), then saves the states
+	def run(self, interval=10, max_polls=None):
+		self.connect()
+		print "Following the event log from id %d (the snapshot is in %s)..." % (self.last_id, self.snapshot_filename)
+		num_polls = 0
+		try:
+			while max_polls is None or num_polls < max_polls:
+				num_new_rows = self.poll()
+				num_polls += 1
+				if num_new_rows > 0:
+					print "%s: %d new event log rows (%d in all) covering %d students, on %d separate days." % \
+						(datetime.now().strftime("%H:%M:%S"), num_new_rows, self.num_rows, len(self.student_states), len(self.days))
+				if max_polls is None or num_polls < max_polls:
+					time.sleep(interval)
+		except KeyboardInterrupt:
+			print "Stopping..."
+		finally:
+			self.save()
+		print "Saved the state up to event log id %d." % self.last_id
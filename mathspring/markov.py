@@ -0,0 +1,255 @@
+#Markov models of the within-tutor emotion self-reports, compared with Likelihood Ratio Tests
+#The self-report sequences are pulled out once into arrays of (previous state, state) transitions,
+# and the counts, probabilities and log-likelihoods for every model are worked out from those all at once
+#This module is only imported by the stages that use it, so numpy and scipy only load when they're needed
+from __future__ import division
+import os, multiprocessing
+import numpy as np
+from scipy.stats.distributions import chi2 #Used for the Likelihood Ratio Test
+from mathspring.records import EmotionRecord
+
+message_types = ("Empathy", "GrowthMindset", "SuccessFailure", "Combined")
+pedagogy_types = message_types[:3]
+emotions = ("Confidence", "Frustration")
+
+#The transitions between consecutive self-reports from the same student, for one emotion
+class EmotionTransitions(object):
+	def __init__(self, prev_states, states, pedagogies, message_flags, students):
+		self.prev_states = prev_states #0 or 1 for the earlier report
+		self.states = states #0 or 1 for the later report
+		self.pedagogies = pedagogies #the index in pedagogy_types of the student's pedagogy
+		self.message_flags = message_flags #a column for each of pedagogy_types, set if they got that type of message in between
+		self.students = students #which student it was, numbered the same way for every emotion
+
+	#An index for each of the 4 kinds of transition, which is where it goes in a flattened 2x2 matrix
+	def cells(self):
+		return self.prev_states * 2 + self.states
+
+#Goes through everyone's self-reports once, and returns emotion -> EmotionTransitions
+def extractTransitions(student_timeseries_emotion_metrics):
+	pedagogy_index = {pedagogy: p for p,pedagogy in enumerate(pedagogy_types)}
+	getMessages = EmotionRecord.getter([message_type + " Messages" for message_type in pedagogy_types])
+	columns = {emotion: ([], [], [], [], []) for emotion in emotions}
+	for student,(_,emotion_metrics) in enumerate(student_timeseries_emotion_metrics.items()):
+		#for each student, get their emotion metrics
+		for emotion, metrics in emotion_metrics.items():
+			prev_states, states, pedagogies, message_flags, students = columns[emotion]
+			#for each of the emotions, do time-series analysis
+			prev_state = None
+			for metric in metrics:
+				amount = getattr(metric, emotion) #figure out what state they were in
+				state = int(amount < 3) #binarize their emotional state
+				if prev_state is not None: #ignore the first row, because we don't have a prev state
+					prev_states.append(prev_state)
+					states.append(state)
+					pedagogies.append(pedagogy_index[metric.Pedagogy])
+					message_flags.append([messages > 0 for messages in getMessages(metric)])
+					students.append(student)
+				prev_state = state
+	transitions = {}
+	for emotion, (prev_states, states, pedagogies, message_flags, students) in columns.items():
+		transitions[emotion] = EmotionTransitions(np.array(prev_states, dtype=np.intp), np.array(states, dtype=np.intp),
+			np.array(pedagogies, dtype=np.intp), np.array(message_flags, dtype=bool).reshape(-1, len(pedagogy_types)),
+			np.array(students, dtype=np.intp))
+	return transitions
+
+#The 2x2 transition counts for each of the groups (group_of_transition gives each transition's group number)
+def countTransitions(transitions, group_of_transition, num_groups):
+	return np.bincount(group_of_transition * 4 + transitions.cells(), minlength=num_groups * 4).reshape(num_groups, 2, 2)
+
+#Turns a stack of 2x2 count matrices into smoothed transition probabilities
+#A state that's never left has no probabilities, so its row is NaN (see emptyRows); the log-likelihoods never use those rows,
+# since they only count the transitions that happened
+def smoothedProbabilities(counts, smoothing):
+	totals = counts.sum(axis=-1)[..., np.newaxis]
+	alpha = totals*smoothing / 2
+	with np.errstate(divide="ignore", invalid="ignore"):
+		return (counts + alpha)/(totals + 2*alpha) #pseudocount
+
+#Which rows (previous states) of a stack of 2x2 count matrices have no transitions at all
+def emptyRows(counts):
+	return counts.sum(axis=-1) == 0
+
+#you can derive this steady-state distribution by hand with the system of equations given by:
+# [A] [a b] = [A B]
+# [B] [c d]
+# and A + B = 1
+#This returns the solution for A for each of a stack of transition matrices
+def stationaryDistributions(probabilities):
+	with np.errstate(divide="ignore", invalid="ignore"):
+		return 1/(1 + (probabilities[..., 0, 1]/(1 - probabilities[..., 1, 1])))
+
+#The log-likelihood of the counted transitions under the given transition probabilities
+def logLikelihood(counts, probabilities):
+	used = counts > 0 #don't take the log of a transition that never happens
+	return np.sum(counts[used] * np.log(probabilities[used]))
+
+#The same for a stack of count matrices, giving a log-likelihood for each one
+def batchLogLikelihoods(counts, probabilities):
+	with np.errstate(divide="ignore", invalid="ignore"):
+		return np.where(counts > 0, counts * np.log(probabilities), 0).sum(axis=(-2, -1))
+
+#Fits the models; models is emotion -> (model name -> 2x2 counts)
+#Returns the same structure with the probabilities, printing everything out along the way
+def fitModels(models, smoothing):
+	fitted = {}
+	#dicts are built the same way as the original lists of lists, so they print out in the same order
+	order = dict(Confidence = {message_type: None for message_type in message_types},
+				 Frustration = {message_type: None for message_type in message_types})
+	for emotion, model_names in order.items():
+		fitted[emotion] = {}
+		for model_name in model_names:
+			counts = models[emotion][model_name]
+			probabilities = smoothedProbabilities(counts, smoothing)
+			steady_emotion = stationaryDistributions(probabilities)
+			empty = emptyRows(counts)
+			print emotion, model_name
+			print "Total number of data cases for each transition: ", counts.tolist()
+			if empty.any():
+				print "No transitions from state %s, so it has no transition probabilities and there's no stationary distribution" % \
+					" or ".join(str(state) for state in np.flatnonzero(empty))
+				print "Transition matrix: ", [None if row_empty else row for row, row_empty in zip(probabilities.tolist(), empty)]
+				print "Stationary distribution: ", None
+			else:
+				print "Transition matrix: ", probabilities.tolist()
+				print "Stationary distribution: ", (float(steady_emotion), 1 - float(steady_emotion))
+			fitted[emotion][model_name] = probabilities
+	return fitted
+
+#Compares one Markov model for everyone against one per pedagogy group
+#With num_permutations, it's also checked with a permutation test; see permutationTest()
+#Returns the chi-square p, and the permutation test p (or None)
+def pedagogyTest(transitions, smoothing, num_permutations=0, seed=None, processes=1, batch_size=500):
+	print "Calculating Markov models for within-tutor emotion self-reports based on pedagogies..."
+
+	models = {}
+	for emotion in emotions:
+		emotion_transitions = transitions[emotion]
+		by_pedagogy = countTransitions(emotion_transitions, emotion_transitions.pedagogies, len(pedagogy_types))
+		models[emotion] = {message_type: counts for message_type, counts in zip(pedagogy_types, by_pedagogy)}
+		models[emotion]["Combined"] = by_pedagogy.sum(axis=0)
+
+	print "Transition probabilities:"
+	fitted = fitModels(models, smoothing)
+
+	#The likelihood of the transitions being produced by either the null model or the alternate models
+	null_loglikelihood = 0
+	alt_loglikelihood = 0
+	for emotion in emotions:
+		null_loglikelihood += logLikelihood(models[emotion]["Combined"], fitted[emotion]["Combined"])
+		for pedagogy in pedagogy_types:
+			alt_loglikelihood += logLikelihood(models[emotion][pedagogy], fitted[emotion][pedagogy])
+
+	likelihood_ratio = 2 * (alt_loglikelihood - null_loglikelihood)
+	# 7 degrees of freedom difference because 2 parameters per model,
+	# and the alt is using an ensemble of 3 condition-specific models vs the generic
+	# Also, the condition-specific models have an extra implicit parameter
+	p = chi2.sf(likelihood_ratio, 7)
+
+	print "For the likelihood ratio test on our condition-based Markov models, we have p = %.3e" % p
+
+	permutation_p = None
+	if num_permutations > 0:
+		permutation_p, num_students = permutationTest(transitions, smoothing, num_permutations, seed, processes, batch_size)
+		print "For the permutation test with %d shuffles of the pedagogies of %d students, we have p = %.3e (chi-square p = %.3e)" % \
+			(num_permutations, num_students, permutation_p, p)
+	return p, permutation_p
+
+#Everything the permutation workers need; they're forked, so they see this as it was when the pool was started
+#This is (student_cell_counts, student_pedagogies, smoothing)
+permutation_context = None
+
+#The pedagogy test's likelihood ratio for each row of pedagogy labels, which have a label for each student
+#student_cell_counts is emotion -> an array of each student's counts of the 4 kinds of transition
+def pedagogyLikelihoodRatios(student_cell_counts, labels, smoothing):
+	groups = (labels[:, :, np.newaxis] == np.arange(len(pedagogy_types))).astype(float) #which group each student is in
+	likelihood_ratios = 0
+	for emotion in emotions:
+		#the counts for each group, for every set of labels at once
+		by_pedagogy = np.einsum("bsg,sc->bgc", groups, student_cell_counts[emotion]).reshape(len(labels), len(pedagogy_types), 2, 2)
+		combined = by_pedagogy.sum(axis=1)
+		alt_loglikelihoods = batchLogLikelihoods(by_pedagogy, smoothedProbabilities(by_pedagogy, smoothing)).sum(axis=1)
+		null_loglikelihoods = batchLogLikelihoods(combined, smoothedProbabilities(combined, smoothing))
+		likelihood_ratios = likelihood_ratios + 2 * (alt_loglikelihoods - null_loglikelihoods)
+	return likelihood_ratios
+
+#Works out the likelihood ratios for one batch of shuffles
+def permutationBatch(task):
+	seed, batch_size = task
+	student_cell_counts, student_pedagogies, smoothing = permutation_context
+	rng = np.random.RandomState(seed)
+	labels = np.array([rng.permutation(student_pedagogies) for b in range(batch_size)])
+	return pedagogyLikelihoodRatios(student_cell_counts, labels, smoothing)
+
+#The chi-square distribution is only right for large samples, so this compares the likelihood ratio with the ratios we get
+# after randomly shuffling the pedagogies between the students (each student keeps all of their own transitions)
+#The shuffles are done in batches, split across processes; each batch has its own seed drawn from seed,
+# so the result only depends on the seed and not on how many processes there are
+#Returns the p-value (counting the actual labels as one of the shuffles, so it's never 0) and the number of students shuffled
+def permutationTest(transitions, smoothing, num_permutations, seed=None, processes=1, batch_size=500):
+	global permutation_context
+	#Only the students with at least one transition make a difference to the models
+	student_pedagogies = {}
+	for emotion in emotions:
+		student_pedagogies.update(zip(transitions[emotion].students.tolist(), transitions[emotion].pedagogies.tolist()))
+	student_numbers = {student: s for s,student in enumerate(sorted(student_pedagogies))}
+	student_cell_counts = {}
+	for emotion in emotions:
+		emotion_transitions = transitions[emotion]
+		students = np.array([student_numbers[student] for student in emotion_transitions.students.tolist()], dtype=np.intp)
+		student_cell_counts[emotion] = np.zeros((len(student_numbers), 4))
+		np.add.at(student_cell_counts[emotion], (students, emotion_transitions.cells()), 1)
+	student_pedagogies = np.array([student_pedagogies[student] for student in sorted(student_pedagogies)], dtype=np.intp)
+	observed = pedagogyLikelihoodRatios(student_cell_counts, student_pedagogies[np.newaxis, :], smoothing)[0]
+
+	rng = np.random.RandomState(seed)
+	tasks = []
+	for start in range(0, num_permutations, batch_size):
+		tasks.append((rng.randint(2**31 - 1), min(batch_size, num_permutations - start)))
+	permutation_context = (student_cell_counts, student_pedagogies, smoothing)
+	if processes > 1 and len(tasks) > 1 and hasattr(os, "fork"):
+		pool = multiprocessing.Pool(processes)
+		results = pool.map(permutationBatch, tasks)
+		pool.close()
+		pool.join()
+	else:
+		results = [permutationBatch(task) for task in tasks]
+	permutation_context = None
+
+	#Allow for rounding, so shuffles that give the same counts as the actual labels are counted as ties
+	num_as_extreme = sum(np.count_nonzero(likelihood_ratios >= observed - 1e-9 * abs(observed)) for likelihood_ratios in results)
+	return (num_as_extreme + 1) / (num_permutations + 1), len(student_pedagogies)
+
+#Compares one Markov model for everyone against one for the transitions after each type of message
+def messageTest(transitions, smoothing):
+	print "Calculating Markov models for within-tutor emotion self-reports based on messages..."
+
+	models = {}
+	for emotion in emotions:
+		emotion_transitions = transitions[emotion]
+		no_groups = np.zeros(len(emotion_transitions.states), dtype=np.intp)
+		models[emotion] = {"Combined": countTransitions(emotion_transitions, no_groups, 1)[0]}
+		#a transition after several types of message counts towards each of them
+		cells = emotion_transitions.cells()
+		for m, message_type in enumerate(pedagogy_types):
+			models[emotion][message_type] = np.bincount(cells[emotion_transitions.message_flags[:, m]], minlength=4).reshape(2, 2)
+
+	print "Transition probabilities:"
+	fitted = fitModels(models, smoothing)
+
+	#For the transitions after each type of message, the likelihood of them being produced by
+	# either the null model or that message type's model
+	null_loglikelihoods = {emotion: {message_type: logLikelihood(models[emotion][message_type], fitted[emotion]["Combined"])
+									 for message_type in pedagogy_types} for emotion in emotions}
+	alt_loglikelihoods = {emotion: {message_type: logLikelihood(models[emotion][message_type], fitted[emotion][message_type])
+									for message_type in pedagogy_types} for emotion in emotions}
+
+	p_values = {}
+	for emotion, message_type_loglikelihoods in null_loglikelihoods.items():
+		for message_type, null_loglikelihood in message_type_loglikelihoods.items():
+			alt_loglikelihood = alt_loglikelihoods[emotion][message_type]
+			likelihood_ratio = 2 * (alt_loglikelihood - null_loglikelihood)
+			p = chi2.sf(likelihood_ratio, 1)
+			p_values[(emotion, message_type)] = p
+			print "For the likelihood ratio test on our Markov models for %s after receiving %s messages, we have p = %.3e" % (emotion, message_type, p)
+	return p_values
@@ -0,0 +1,127 @@
+#Partial correlations between what the students got in the tutor and how they did, straight from the per-student metrics
+#This replaces EDMPartCorr.R: for each outcome and each message percentage (and pedagogy group), the two are regressed
+# on the controls, and the residuals are correlated (with the same t test as R's cor.test on them)
+#The controls are the time in the tutor and the messages per minute, plus the pretest answer for the posttest categories
+#A student is left out of just the outcomes they're missing (e.g. "I don't know" on that survey question), not all of them,
+# and every outcome is worked out at once: the regressions are a stack of small least squares problems, one per outcome,
+# with the missing students given a weight of 0
+from __future__ import division
+import csv
+import numpy as np
+from scipy.stats.distributions import t as t_distribution
+from mathspring.prepost import pedagogy_group_order
+
+#What the outcomes are correlated with: the share of each type of message, then whether the student was in each group
+predictor_labels = tuple("%" + group + " Messages" for group in pedagogy_group_order) + \
+	tuple(group + " Pedagogy" for group in pedagogy_group_order)
+
+def ratio(numerator, denominator):
+	return numerator / denominator if denominator else None
+
+#The outcomes, as (label, metrics -> value, metrics -> the extra control or None)
+#These are the posttest answer for each pre/post category (controlling for the pretest answer), then the ones from the tutor
+#Correctness is the share of answers that were incorrect, the same as EDMPartCorr.R's, so the signs match its results
+def outcomes(prepost_categories_inv, category_order):
+	def prepostOutcome(category):
+		return ("posttest " + category, lambda metrics: metrics.get("posttest " + category),
+			lambda metrics: metrics.get("pretest " + category))
+	def tutorOutcome(label, value):
+		return (label, value, None)
+	categories = [category for category in category_order if category in prepost_categories_inv]
+	return [prepostOutcome(category) for category in categories] + [
+		tutorOutcome("NormalizedLearningGain", lambda metrics: metrics.get("NormalizedLearningGain")),
+		tutorOutcome("Correctness", lambda metrics: ratio(metrics["IncorrectTotal"], metrics["CorrectTotal"] + metrics["IncorrectTotal"])),
+		tutorOutcome("AvgProblemDifficulty", lambda metrics: metrics["AvgProblemDifficulty"]),
+		tutorOutcome("ProblemsSeen", lambda metrics: metrics["CorrectTotal"] + metrics["IncorrectTotal"]),
+		tutorOutcome("TotalIncorrectAttempts", lambda metrics: metrics["TotalIncorrectAttempts"]),
+		tutorOutcome("HintsPerProblem", lambda metrics: ratio(metrics["NumHints"], metrics["CorrectTotal"] + metrics["IncorrectTotal"])),
+		tutorOutcome("LearningEstimation", lambda metrics: metrics.get("LearningEstimation")),
+	]
+
+def column(values):
+	return np.array([np.nan if value is None else value for value in values], dtype=float)
+
+#The partial correlation of each predictor with each outcome, each pair only using the students that have all of its values
+#predictors is (students x a), outcomes is (students x b), and controls is (b x students x k), with NaN for missing values;
+# every outcome has its own controls, but they all have to have the same number of them
+#Returns the correlations and p values (b x a), and how many students each outcome had
+#The pairs that can't be worked out are NaN: all of an outcome's, if it has 2 students or fewer, and any where
+# the predictor or outcome has nothing left over after the controls (e.g. everyone in the pair's students has the same value)
+def partialCorrelations(predictors, outcomes, controls):
+	num_outcomes = outcomes.shape[1]
+	num_predictors = predictors.shape[1]
+	#A student counts for an outcome if they have it, every predictor and all of its controls
+	included = np.isfinite(outcomes.T) & np.all(np.isfinite(predictors), axis=1) & np.all(np.isfinite(controls), axis=2)
+	weights = included.astype(float)
+	z = np.where(included[:, :, np.newaxis], controls, 0)
+	#The predictors and outcome for each outcome's regression, side by side: (b x students x a+1)
+	targets = np.concatenate((np.repeat(predictors[np.newaxis], num_outcomes, axis=0), outcomes.T[:, :, np.newaxis]), axis=2)
+	targets = np.where(included[:, :, np.newaxis], targets, 0)
+	#Least squares on the included students for every outcome at once; pinv copes with too few students
+	gram = np.einsum("bnk,bnl->bkl", z, z)
+	coefficients = np.matmul(np.linalg.pinv(gram), np.einsum("bnk,bnt->bkt", z, targets))
+	residuals = (targets - np.matmul(z, coefficients)) * weights[:, :, np.newaxis]
+	predictor_residuals = residuals[:, :, :num_predictors]
+	outcome_residuals = residuals[:, :, num_predictors:]
+	#The controls include an intercept, so the residuals already have a mean of 0
+	predictor_ss = np.sum(predictor_residuals**2, axis=1)
+	outcome_ss = np.sum(outcome_residuals**2, axis=1)
+	#what's left of a constant is just rounding error, so it's compared with the size of the values themselves
+	scale = np.sum(targets**2, axis=1)
+	counts = weights.sum(axis=1)
+	valid = (counts > 2)[:, np.newaxis] & (predictor_ss > 1e-12 * scale[:, :num_predictors]) & (outcome_ss > 1e-12 * scale[:, num_predictors:])
+	with np.errstate(divide="ignore", invalid="ignore"):
+		correlations = np.sum(predictor_residuals * outcome_residuals, axis=1) / np.sqrt(predictor_ss * outcome_ss)
+		df = np.maximum(counts - 2, 1)[:, np.newaxis]
+		t = correlations * np.sqrt(df / (1 - correlations**2))
+		p = 2 * t_distribution.sf(np.abs(t), df)
+	correlations[~valid] = np.nan
+	p[~valid] = np.nan
+	return correlations, p, counts.astype(int)
+
+#Works out every outcome's partial correlations for the students who did both tests
+#Returns a list of (outcome label, students, [(correlation, p) for each of predictor_labels]), with (None, None) for the pairs
+# that couldn't be worked out
+def studyCorrelations(student_metrics, prepost_categories_inv, category_order):
+	students = [metrics for _,metrics in sorted(student_metrics.items()) if metrics.get("Pedagogy") in pedagogy_group_order]
+	outcome_list = outcomes(prepost_categories_inv, category_order)
+	predictors = np.column_stack([column(metrics["%" + group + " Messages"] for metrics in students) for group in pedagogy_group_order] +
+		[column(1 if metrics["Pedagogy"] == group else 0 for metrics in students) for group in pedagogy_group_order])
+	time = column(metrics["TimeInTutor"] for metrics in students)
+	rate = column(ratio(metrics["Total Messages"], metrics["TimeInTutor"]) for metrics in students)
+	intercept = np.ones(len(students))
+
+	results = [None] * len(outcome_list)
+	#The outcomes with and without a pretest control are done as two stacks, since they have different numbers of controls
+	for with_pretest in (True, False):
+		indices = [i for i,(_, _, control) in enumerate(outcome_list) if (control is not None) == with_pretest]
+		if len(indices) == 0:
+			continue
+		values = np.column_stack([column(outcome_list[i][1](metrics) for metrics in students) for i in indices])
+		controls = np.array([np.column_stack([intercept, time, rate] +
+			([column(outcome_list[i][2](metrics) for metrics in students)] if with_pretest else [])) for i in indices])
+		correlations, p, counts = partialCorrelations(predictors, values, controls)
+		for j,i in enumerate(indices):
+			results[i] = (outcome_list[i][0], counts[j], [(r, p_value) if np.isfinite(r) else (None, None)
+				for r, p_value in zip(correlations[j].tolist(), p[j].tolist())])
+	return results
+
+def printCorrelations(results):
+	print "Partial correlations (controlling for time in the tutor, messages per minute, and the pretest answer for posttest categories):"
+	print "%-30s %8s  %s" % ("Outcome", "Students", "  ".join("%-25s" % label for label in predictor_labels))
+	for label, count, pairs in results:
+		if count <= 2:
+			print "%-30s %8d  too few students (n=%d)" % (label, count, count)
+		elif all(r is None for r, _ in pairs):
+			print "%-30s %8d  no variation left after the controls (n=%d)" % (label, count, count)
+		else:
+			print "%-30s %8d  %s" % (label, count, "  ".join("%-25s" % ("r = %6.3f, p = %.3e" % pair if pair[0] is not None else "-")
+				for pair in pairs))
+
+#Saves the results as a CSV with a correlation and p value column for each predictor, like EDMPartCorr.R's output
+def saveCorrelations(results, filename):
+	with open(filename, "wb") as f:
+		writer = csv.writer(f)
+		writer.writerow(["Variable", "Students"] + [heading for label in predictor_labels for heading in (label + " PartialCorrelation", "p value")])
+		for label, count, pairs in results:
+			writer.writerow([label, count] + [value for pair in pairs for value in pair])
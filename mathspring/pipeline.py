@@ -0,0 +1,717 @@
+#The steps for processing a study's data, which can each be run on their own:
+#	load - pull the student, problem and event log data from the database (or the cache)
+#	enrich - process the event log into the EventType/UniqueEndProb/newId columns and the per-student metrics
+#	prepost - score the pre/post tests and finish off the per-student metrics
+#	workbook - write everything into the Excel workbook (or CSV/TSV files, or a SQLite database)
+#	markov-pedagogy, markov-messages - the Markov model Likelihood Ratio Tests
+#	markov-models - the k-state, order-n Markov models for each emotion and group (see transitionmodels.py)
+#	partial-correlations - the partial correlations of the message percentages and pedagogies with the outcomes (see partialcorr.py)
+#Running a stage runs the stages it needs first, so e.g. "markov-pedagogy" doesn't write the workbook
+#The heavy packages (pymysql, xlsxwriter, scipy) are only imported by the stages that use them
+import argparse, os, sys
+from mathspring import checkpoint, database, eventlog, export, instrument, prepost, querypool, windows
+
+stage_order = ("load", "enrich", "prepost", "workbook", "markov-pedagogy", "markov-messages", "markov-models", "partial-correlations")
+stage_requirements = {
+	"load": (),
+	"enrich": ("load",),
+	"prepost": ("enrich",),
+	"workbook": ("prepost",),
+	"markov-pedagogy": ("prepost",),
+	"markov-messages": ("prepost",),
+	"markov-models": ("prepost",),
+	"partial-correlations": ("prepost",),
+}
+
+#Everything from a script's Configuration Area
+class StudyConfig(object):
+	def __init__(self, **settings):
+		#Database url, username and password
+		self.db_hostname = "rose.cs.umass.edu"
+		self.db_dbname = "wayangoutpostdb"
+		self.db_username = None
+		self.db_password = None
+		self.db_sqlite_file = None
+		self.reload_data = False
+		self.cache_max_megabytes = 4096
+		self.stream_eventlog = False
+		self.incremental_eventlog = False
+		self.eventlog_dump_file = None
+		self.sort_memory_megabytes = 512
+		self.processes = 1
+		self.columnar_cache = True
+		self.project_eventlog = False
+		self.db_connections = 1
+		self.chunked_extraction = False
+		self.extraction_chunk_students = 500
+		self.extraction_chunk_days = 7
+		self.extraction_page_rows = 50000
+		self.output_file = None
+		self.output_format = "xlsx"
+		self.streaming_export = True
+		self.data_folder = None
+		self.time_ranges = ()
+		self.classes = ()
+		self.exclude_student_ids = ()
+		self.prepost_corrections_file = None
+		self.prepost_categories_inv = {}
+		self.category_order = ()
+		self.learning_estimation = {}
+		self.answer_windows = windows.default_windows
+		self.smoothing = 0.01
+		self.permutations = 10000
+		self.permutation_seed = None
+		self.markov_levels = (0, 1, 2, 3, 4)
+		self.markov_order = 1
+		self.partial_correlations_file = None
+		self.profile_stages = False
+		self.checkpoints = True
+		self.instrumentation_file = None
+		for name, value in settings.items():
+			if not hasattr(self, name):
+				raise TypeError("Unknown setting: " + name)
+			setattr(self, name, value)
+
+#A list of values for an IN (...) condition
+#This is just the tuple, except that a one-item tuple's trailing comma isn't valid SQL
+def sqlList(values):
+	values = tuple(values)
+	return "(%s)" % (values[0],) if len(values) == 1 else str(values)
+
+#This is the subquery for getting the student ids relevant to the study
+def studentQuery(config):
+	student_query = "SELECT id,pedagogyId FROM student WHERE " \
+					+ "trialUser = 0 AND userName NOT LIKE '%test%' " \
+					+ " AND classId IN " + sqlList(config.classes)
+	if len(config.exclude_student_ids) > 0:
+		student_query += "AND id NOT IN " + sqlList(config.exclude_student_ids)
+	return student_query
+
+#The conditions to select just the relevant rows from the eventlog
+def eventlogConditions(config, student_ids):
+	eventlog_conditions = "WHERE studId IN " + sqlList(student_ids) + " "
+	#Build the time-constraint part of the query
+	if len(config.time_ranges) > 0: #if any time ranges were specified
+		eventlog_conditions += " AND ("
+	for i,(start,end) in enumerate(config.time_ranges):
+		if i > 0: #if it's not the first time, we need to add an "OR"
+			eventlog_conditions += " OR "
+		eventlog_conditions += "(DATE(time) >= DATE('" + str(start) + "') AND DATE(time) <= DATE('" + str(end) + "'))"
+	if len(config.time_ranges) > 0:
+		eventlog_conditions += ")"
+	return eventlog_conditions
+
+#The same conditions, for event log rows that don't come from the database
+def eventlogFilter(config, student_ids, h):
+	student_ids = set(student_ids)
+	def keep(row):
+		if row[h["studId"]] not in student_ids:
+			return False
+		if len(config.time_ranges) == 0:
+			return True
+		time = row[h["time"]]
+		return time is not None and any(start <= time.date() <= end for start, end in config.time_ranges)
+	return keep
+
+#Adds in the stages that the given ones need, and puts them all in the order they run
+def resolveStages(stages):
+	needed = set()
+	def need(stage):
+		if stage not in stage_requirements:
+			raise ValueError("Unknown stage: %s (the stages are %s)" % (stage, ", ".join(stage_order)))
+		if stage not in needed:
+			needed.add(stage)
+			for requirement in stage_requirements[stage]:
+				need(requirement)
+	for stage in stages:
+		need(stage)
+	return [stage for stage in stage_order if stage in needed]
+
+class Pipeline(object):
+	#db is the Database to use, if it's shared with other pipelines (see batch.py)
+	def __init__(self, config, db=None):
+		self.config = config
+		self.db = db if db is not None else database.Database(config)
+		self.study_workbook = None
+		self.stages_run = []
+		self.stages_planned = ()
+		#With more than one database connection, queries that later stages need are started early (see prefetch())
+		self.scheduler = None
+		self.jobs = {}
+		#The time, memory, rows and cache use of each stage (see instrument.py)
+		self.instrumentation = instrument.Instrumentation(self.db.query_cache, config.profile_stages)
+		self.num_eventlog_rows = None
+		#Each stage's results are saved, and used instead of running it again while its inputs stay the same (see checkpoint.py)
+		self.checkpoints = checkpoint.Checkpoints(os.path.join(config.data_folder, "checkpoints"))
+		self.fingerprints = {}
+		self.checkpoints_pending = [] #stages whose checkpoints have been used, but not loaded yet
+
+	def run(self, stages=stage_order):
+		self.runStages(resolveStages(stages))
+		print "\n----------\n"
+		print self.db.query_cache.report()
+		print
+		print self.instrumentation.summary()
+		if self.config.instrumentation_file is not None:
+			self.instrumentation.save(self.config.instrumentation_file)
+			print "Saved the stage measurements in %s" % self.config.instrumentation_file
+		print "Done."
+
+	#Runs the given stages in order, without adding in the ones they need (e.g. when those have been done some other way)
+	def runStages(self, stages):
+		self.stages_planned = stages
+		if self.config.db_connections > 1:
+			self.scheduler = querypool.QueryScheduler(self.config.db_connections)
+		#A streamed event log goes straight into its sheet, so the workbook has to be ready before it's processed
+		if "workbook" in stages and self.config.stream_eventlog:
+			self.startWorkbook()
+		try:
+			for stage in stages:
+				if stage.startswith("markov") or stage == "partial-correlations":
+					print "\n----------\n"
+				self.instrumentation.startStage(stage)
+				stage_fingerprint = self.stageFingerprint(stage)
+				saved = self.findCheckpoint(stage, stage_fingerprint)
+				if saved is not None:
+					#a stage's results are only loaded once a later stage needs them (or at the end)
+					self.checkpoints_pending.append(stage)
+					sys.stdout.write(saved["output"])
+					self.instrumentation.finishStage(*saved["rows"], checkpoint=True)
+				else:
+					self.restoreCheckpoints()
+					recorder = checkpoint.OutputRecorder(sys.stdout)
+					sys.stdout = recorder
+					try:
+						getattr(self, stage.replace("-", "_"))()
+					except:
+						self.instrumentation.finishStage()
+						raise
+					finally:
+						sys.stdout = recorder.stream
+					rows = self.stageRows(stage)
+					self.instrumentation.finishStage(*rows)
+					if stage == "load":
+						self.fingerprints["load"] = self.loadFingerprint()
+					elif stage_fingerprint is not None:
+						self.checkpoints.save(stage, stage_fingerprint, self, recorder.output(), rows)
+				self.stages_run.append(stage)
+			self.restoreCheckpoints()
+		finally:
+			if self.scheduler is not None:
+				self.scheduler.close()
+				self.scheduler = None
+
+	#The fingerprint of a stage's inputs, or None if it can't be checkpointed
+	#Load's is only known once it's run, from the query results it got (see loadFingerprint())
+	#A streamed or incremental event log isn't kept in the same way, so those don't use checkpoints
+	def stageFingerprint(self, stage):
+		config = self.config
+		if not config.checkpoints or config.stream_eventlog or config.incremental_eventlog or stage == "load":
+			return None
+		requirements = [self.fingerprints.get(required) for required in stage_requirements[stage]]
+		if None in requirements:
+			return None
+		self.fingerprints[stage] = checkpoint.fingerprint(stage, config, requirements, self.resultStamps(stage))
+		return self.fingerprints[stage]
+
+	#The (cache file, modified time) of the query results a stage reads itself (see checkpoint.stage_results)
+	#Those queries are run (or picked up from the cache) first if they haven't been yet, for the stage to fetch() later
+	def resultStamps(self, stage):
+		queries = dict(preposttestdata_headers=self.prepostTestHeaders, preposttestdata=self.prepostTestData,
+			preposttestproblem=self.prepostProblems)
+		names = checkpoint.stage_results.get(stage, ())
+		for name in names:
+			if name in self.jobs:
+				self.jobs[name].result()
+			else:
+				self.pull(name, queries[name])
+		return [stamp for name in names for stamp in self.db.result_stamps.get(name, ())]
+
+	def loadFingerprint(self):
+		config = self.config
+		if not config.checkpoints or config.stream_eventlog or config.incremental_eventlog:
+			return None
+		results = [stamp for name in checkpoint.load_results for stamp in self.db.result_stamps.get(name, ())]
+		return checkpoint.fingerprint("load", config, (), results)
+
+	#What was saved for the stage, if it matches the fingerprint (and for the workbook, if the file's still there)
+	def findCheckpoint(self, stage, stage_fingerprint):
+		if stage_fingerprint is None:
+			return None
+		if stage == "workbook" and not os.path.exists(export.outputPath(self.config.output_file, self.config.output_format)):
+			return None
+		return self.checkpoints.find(stage, stage_fingerprint)
+
+	#Loads the results of the stages whose checkpoints were used
+	def restoreCheckpoints(self):
+		for stage in self.checkpoints_pending:
+			self.checkpoints.restore(stage, self)
+		self.checkpoints_pending = []
+
+	#How many rows a stage that just ran took in and put out, for the instrumentation
+	#These are the event log rows for load/enrich/workbook, and the students and timeseries records for the rest
+	def stageRows(self, stage):
+		if stage == "load":
+			return len(self.student_data), len(self.eventlog) if hasattr(self.eventlog, "__len__") else None
+		elif stage == "enrich":
+			return self.num_eventlog_rows, len(self.student_metrics)
+		elif stage == "prepost":
+			return len(self.preposttestdata), sum(len(answer_metrics) for answer_metrics in self.student_timeseries_answer_metrics.values())
+		elif stage == "workbook":
+			return self.num_eventlog_rows, self.study_workbook.rows_written
+		elif stage == "partial-correlations":
+			return len(self.student_metrics), len(self.partial_correlations)
+		elif stage.startswith("markov"):
+			return sum(len(emotion_metrics) for metrics in self.student_timeseries_emotion_metrics.values()
+					   for emotion_metrics in metrics.values()), None
+		return None, None
+
+	#Starts running function() on another connection, if we have more than one, so fetch() can pick up its result later
+	def prefetch(self, name, function):
+		if self.scheduler is not None and name not in self.jobs:
+			self.jobs[name] = self.scheduler.submit(name, function)
+
+	#Runs function() right away, for fetch() to pick up later (e.g. before the stages that need it are run in another process)
+	def pull(self, name, function):
+		self.jobs[name] = querypool.QueryJob(name, function)
+		self.jobs[name].run()
+
+	#Waits for what prefetch() or pull() started, or just runs function() if nothing was
+	def fetch(self, name, function):
+		job = self.jobs.pop(name, None)
+		return job.result() if job is not None else function()
+
+	def load(self):
+		config = self.config
+		db = self.db
+		db.connect()
+
+		#Everything else only depends on which students there are
+		self.student_data = db.query("student_ids", studentQuery(config))
+		self.student_ids = tuple(i[0] for i in self.student_data)
+
+		def problemDifficulties():
+			return db.query("problem_difficulties", "SELECT id,cachedProbDifficulty FROM problem WHERE id IN"
+				"(SELECT DISTINCT(problemId) FROM eventlog WHERE studId IN " + sqlList(self.student_ids) + ");")
+
+		eventlog_conditions = eventlogConditions(config, self.student_ids)
+
+		#An exported event log can be read instead of the database's (see loadDump())
+		dumped = config.eventlog_dump_file is not None
+		if dumped and (config.project_eventlog or config.incremental_eventlog):
+			raise ValueError("An event log dump can't be used with project_eventlog or incremental_eventlog, which need the database's event log")
+
+		#In projection mode we only pull the columns the processing needs
+		if config.project_eventlog:
+			from mathspring import projection
+			eventlog_select = projection.eventlogSelect()
+			eventlog_query = eventlog_select + " " + eventlog_conditions
+		else:
+			eventlog_select = "SELECT * FROM eventlog"
+			eventlog_query = eventlog_select + " " + eventlog_conditions
+
+		eventlog_where = eventlog_query #kept around so the incremental refresh can add to it
+		eventlog_query += " ORDER BY studId ASC, time ASC;"
+
+		eventlog_name = "eventlog_projected" if config.project_eventlog else "eventlog" #so the full event log's old caches aren't used
+
+		#With chunked extraction, the event log is pulled in index-friendly pieces (see extraction.py),
+		# and the problem difficulties are only asked for once we know which problems are in it
+		#This doesn't apply when streaming, since the problems aren't known until the whole event log has gone by
+		chunked = config.chunked_extraction and not config.stream_eventlog and not dumped
+		def pullEventlog():
+			if not chunked:
+				return db.query(eventlog_name, eventlog_query)
+			from mathspring import extraction
+			plan = extraction.ExtractionPlan(eventlog_select, self.student_ids, config.time_ranges,
+				config.extraction_chunk_students, config.extraction_chunk_days, config.extraction_page_rows)
+			headers = projection.projected_headers if config.project_eventlog else self.eventlog_headers
+			rows = db.query(eventlog_name, plan.key(), lambda: extraction.extract(db, plan, headers, config.db_connections))
+			extraction.removeProgress(db, plan) #the result's in the cache now
+			return rows
+
+		#The chunked pull needs the event log's column names before it starts
+		self.eventlog_headers = None
+		if chunked and not config.project_eventlog:
+			self.eventlog_headers = db.getHeaders("eventlog")[0]
+
+		#Start all of the independent queries at once, biggest first, so the pre/post test ones can carry on
+		# while the event log is processed
+		if not config.incremental_eventlog and not config.stream_eventlog and not dumped:
+			self.prefetch("eventlog", pullEventlog)
+		if not chunked and not dumped:
+			self.prefetch("problem_difficulties", problemDifficulties)
+		if self.eventlog_headers is None and not config.project_eventlog and not dumped:
+			self.prefetch("eventlog_headers", lambda: db.getHeaders("eventlog"))
+		if "prepost" in self.stages_planned:
+			self.prefetch("preposttestdata_headers", self.prepostTestHeaders)
+			self.prefetch("preposttestdata", self.prepostTestData)
+		if "workbook" in self.stages_planned:
+			self.prefetch("preposttestproblem", self.prepostProblems)
+
+		#We also want the names of the columns, pull those now
+		#This has to happen before the event log, since a streaming query ties up the connection until it's done
+		if config.project_eventlog:
+			self.eventlog_headers = projection.projected_headers
+			h = {name: c for c,name in enumerate(self.eventlog_headers)}
+		elif dumped:
+			self.eventlog_headers, self.eventlog, problem_ids = self.loadDump()
+			h = {name: c for c,name in enumerate(self.eventlog_headers)}
+		elif self.eventlog_headers is None:
+			self.eventlog_headers, h = self.fetch("eventlog_headers", lambda: db.getHeaders("eventlog"))
+		else:
+			h = {name: c for c,name in enumerate(self.eventlog_headers)}
+		self.eventlog_h = h
+
+		if not dumped:
+			print "Running the query to get the event log data..."
+
+		#Pull the event log data; when streaming, this is a generator that only gets run by the enrich stage
+		self.eventlog_store = None
+		if config.incremental_eventlog:
+			from mathspring import incremental #Lets us top up the event log with new rows for studies that are still running
+			#The incremental store lives in the query cache next to the regular result, keyed on the same query
+			self.eventlog_store = incremental.IncrementalEventlog(db.query_cache.entryPath(eventlog_query, "incremental"),
+																  h["studId"], h["time"], h["id"])
+			if self.eventlog_store.num_segments == 0: #the first pull is just the regular query, which may already be cached
+				self.eventlog = pullEventlog()
+			elif db.pool is not None:
+				print "Only getting the event log rows that are newer than the %d we already have..." % self.eventlog_store.num_rows
+				self.eventlog = self.eventlog_store.newRows(db.runQuery(eventlog_where + " AND " + self.eventlog_store.newRowsCondition() \
+																		+ " ORDER BY studId ASC, time ASC, id ASC;"))
+			else:
+				self.eventlog = []
+			print "There are %d new event log rows." % len(self.eventlog)
+		elif config.stream_eventlog and not dumped:
+			self.eventlog = db.queryStream(eventlog_name, eventlog_query)
+		elif not dumped: #a dump's rows were already read above
+			self.eventlog = self.fetch("eventlog", pullEventlog)
+
+		self.problem_difficulty = {}
+		if chunked or dumped:
+			from mathspring import extraction
+			if not dumped:
+				problem_ids = set(row[h["problemId"]] for row in self.eventlog if row[h["problemId"]] is not None)
+			problem_difficulty_data = extraction.problemDifficulties(db, problem_ids)
+		else:
+			problem_difficulty_data = self.fetch("problem_difficulties", problemDifficulties)
+		for probId,difficulty in problem_difficulty_data:
+			self.problem_difficulty[probId] = difficulty
+		#The cached difficulties are from the first pull, so a refresh asks for any problems its new rows have that those didn't
+		if config.incremental_eventlog and not chunked and self.eventlog_store.num_segments > 0 and db.pool is not None:
+			from mathspring import extraction
+			new_problems = set(row[h["problemId"]] for row in self.eventlog if row[h["problemId"]] is not None) - set(self.problem_difficulty)
+			for ids in extraction.splitList(sorted(new_problems), 1000):
+				self.problem_difficulty.update(db.runQuery("SELECT id,cachedProbDifficulty FROM problem WHERE id IN " + sqlList(ids)))
+
+	#Reads the event log from config.eventlog_dump_file instead, keeping just the study's rows, and sorts them by (studId, time)
+	# without holding more than about sort_memory_megabytes of them at once (see externalsort.py)
+	#When streaming, the sorted rows are merged as the enrich stage goes through them; otherwise they're saved as a columnar
+	# table in the query cache, under the dump's size and modification time, so it's only sorted again when the dump changes
+	#Returns the dump's column names, the rows and the problem ids in them
+	def loadDump(self):
+		from mathspring import externalsort
+		config = self.config
+		db = self.db
+		filename = config.eventlog_dump_file
+		headers, rows = externalsort.readDump(filename)
+		h = {name: c for c,name in enumerate(headers)}
+		status = os.stat(filename)
+		q = "DUMP %s (%d bytes, modified %d) %s" % (os.path.abspath(filename), status.st_size, int(status.st_mtime),
+			eventlogConditions(config, self.student_ids))
+		cached = db.findCached("eventlog_dump", q) if not config.stream_eventlog and not config.reload_data else None
+		if cached is not None:
+			rows.close()
+			db.noteResult("eventlog_dump", cached[0])
+			table = db.loadCached(*cached)
+			return headers, table, set(problemId for problemId in (row[h["problemId"]] for row in table) if problemId is not None)
+
+		print "Sorting the event log in %s..." % filename
+		if "id" in h: #rows at the same time go in the order they were logged, like the chunked extraction's
+			key = lambda row: (row[h["studId"]], row[h["time"]], row[h["id"]])
+		else:
+			key = lambda row: (row[h["studId"]], row[h["time"]])
+		sorter = externalsort.ExternalSorter(key, config.sort_memory_megabytes, config.data_folder)
+		keep = eventlogFilter(config, self.student_ids, h)
+		problem_ids = set()
+		for row in rows:
+			if keep(row):
+				sorter.add(row)
+				if row[h["problemId"]] is not None:
+					problem_ids.add(row[h["problemId"]])
+		if sorter.runs:
+			print "Kept %d of its rows, which are being sorted in %d runs on disk." % (sorter.num_rows, len(sorter.runs) + (1 if sorter.run else 0))
+		else:
+			print "Kept %d of its rows, which fit in memory to be sorted." % sorter.num_rows
+		if config.stream_eventlog:
+			return headers, sorter.sorted(), problem_ids
+		from mathspring import columnar
+		writer = columnar.ColumnarWriter(db.query_cache.entryPath(q, "columns"), externalsort.columnKinds(headers), headers)
+		writer.extend(sorter.sorted())
+		writer.close()
+		db.addCached("eventlog_dump", q, "columns")
+		return headers, db.loadCached(db.query_cache.entryPath(q, "columns"), "columns"), problem_ids
+
+	def enrich(self):
+		config = self.config
+		print "Cleaning the data a bit..."
+		processor = eventlog.EventlogProcessor(self.eventlog_h, self.problem_difficulty)
+		self.student_states = {}
+		self.student_metrics = {}
+		self.student_timeseries_answer_metrics = {}
+		self.student_timeseries_emotion_metrics = {}
+		def addStudent(state):
+			self.student_states[state.studId] = state
+			self.student_metrics[state.studId] = state.metrics
+			self.student_timeseries_answer_metrics[state.studId] = state.answer_metrics
+			self.student_timeseries_emotion_metrics[state.studId] = state.emotion_metrics
+
+		if self.study_workbook is not None:
+			self.study_workbook.startEventlog(self.eventlog_headers)
+
+		days = set()
+		derived_writer = None
+		eventlog_store = self.eventlog_store
+		if eventlog_store is not None:
+			#pick up where the last refresh left off
+			if eventlog_store.saved is not None:
+				days = eventlog_store.saved["days"]
+				for studId in sorted(eventlog_store.saved["student_states"]):
+					addStudent(eventlog.StudentState.load(eventlog_store.saved["student_states"][studId]))
+			if len(self.eventlog) > 0:
+				derived_writer = eventlog_store.addSegment(self.eventlog, self.eventlog_headers)
+
+		#Keep the new columns for each row
+		#When streaming, we don't keep the rows around after they've been written to the sheet
+		self.derived_columns = None
+		if derived_writer is None and not config.stream_eventlog:
+			self.derived_columns = eventlog.DerivedColumns(len(self.eventlog))
+		def storeGeneratedColumns(i, row, event_type, unique_end_prob, unique_end_prob_offset):
+			if derived_writer is not None:
+				derived_writer.append((event_type, unique_end_prob))
+			elif config.stream_eventlog:
+				if self.study_workbook is not None:
+					self.study_workbook.writeEventlogRow(i, event_type, unique_end_prob_offset + unique_end_prob, row)
+			else:
+				self.derived_columns.store(i, event_type, unique_end_prob_offset + unique_end_prob)
+
+		num_eventlog_rows, new_days = eventlog.processEventlog(processor, self.eventlog, self.student_states, addStudent,
+			storeGeneratedColumns, config.processes)
+		days |= new_days
+
+		if eventlog_store is not None:
+			if derived_writer is not None:
+				derived_writer.close()
+			#Save everyone's state before it gets finished off below, so the next refresh can carry on from here
+			eventlog_store.save(dict(days=days, student_states={studId: student_state.save()
+																for studId,student_state in self.student_states.items()}))
+			num_eventlog_rows = eventlog_store.num_rows
+
+		#The last student in the event log is left as-is, the same as when this was done while switching between students
+		for studId in sorted(self.student_states)[:-1]:
+			processor.finishStudent(self.student_states[studId])
+
+		self.num_eventlog_rows = num_eventlog_rows
+		print "We have %d event log rows covering %d classes, %d students, on %d separate days." % \
+			(num_eventlog_rows, len(config.classes), len(self.student_metrics), len(days))
+
+	def prepost(self):
+		config = self.config
+		prepost_corrections = {}
+		if config.prepost_corrections_file is not None:
+			prepost_corrections = prepost.readCorrections(config.prepost_corrections_file)
+
+		print "Getting pre/post test data..."
+		self.preposttest_headers, h = self.fetch("preposttestdata_headers", self.prepostTestHeaders)
+		self.preposttestdata = self.fetch("preposttestdata", self.prepostTestData)
+		prepost.applyCorrections(self.preposttestdata, h, prepost_corrections)
+
+		print "Extracting the pre/post test comparison..."
+		self.students_prepost = prepost.scoreStudents(self.preposttestdata, h, config.prepost_categories_inv)
+		self.prepost_by_group = prepost.groupStudents(self.student_data, self.students_prepost, config.prepost_categories_inv,
+			self.student_metrics, self.student_timeseries_answer_metrics, self.student_timeseries_emotion_metrics)
+		self.answer_window_columns = prepost.finishMetrics(self.student_metrics, self.student_timeseries_answer_metrics,
+			self.student_timeseries_emotion_metrics, config.learning_estimation, config.answer_windows)
+
+	def startWorkbook(self):
+		from mathspring import workbook
+		self.study_workbook = workbook.StudyWorkbook(self.config.output_file, self.config.output_format, self.config.streaming_export)
+
+	def workbook(self):
+		config = self.config
+		if self.study_workbook is None:
+			self.startWorkbook()
+		workbook = self.study_workbook
+		h = self.eventlog_h
+		if workbook.eventlog_table is None: #the enrich stage starts it, unless the event log was processed some other way
+			workbook.startEventlog(self.eventlog_headers)
+		if self.eventlog_store is not None:
+			print "Putting the event log into a sheet..."
+			#Write in the whole event log, with the UniqueEndProb and newId numbered across all of the students
+			unique_end_prob_offset = 0
+			last_studId = None
+			for i,(row, derived) in enumerate(self.eventlog_store.iterMerged()):
+				studId = row[h["studId"]]
+				if last_studId is not None and studId != last_studId:
+					unique_end_prob_offset += self.student_states[last_studId].unique_end_prob
+				last_studId = studId
+				event_type, unique_end_prob = derived
+				workbook.writeEventlogRow(i, event_type, unique_end_prob_offset + unique_end_prob, row)
+		elif not config.stream_eventlog:
+			print "Putting the event log into a sheet..."
+			#Write in the eventlog, with its new columns
+			event_types = self.derived_columns.event_types
+			unique_end_probs = self.derived_columns.unique_end_probs
+			for i,row in enumerate(self.eventlog):
+				workbook.writeEventlogRow(i, event_types[i], unique_end_probs[i], row)
+
+		print "Putting the pre/post test data into a sheet..."
+		workbook.writeTable("preposttestdata", self.preposttest_headers, self.preposttestdata)
+
+		print "Getting the pre/post test problems..."
+		preposttestproblem_headers, preposttestproblem = self.fetch("preposttestproblem", self.prepostProblems)
+		workbook.writeTable("preposttestproblem", preposttestproblem_headers, preposttestproblem)
+
+		workbook.writePrepostSummary(self.prepost_by_group, prepost.pedagogy_group_order, config.category_order)
+		workbook.writeStudentMetrics(self.student_metrics, config.category_order)
+		workbook.writeAnswerMetrics(self.student_timeseries_answer_metrics, self.answer_window_columns)
+		workbook.writeEmotionMetrics(self.student_timeseries_emotion_metrics)
+		workbook.close()
+
+	#Pull the pre/post test data
+	#Like db.query(), but an incremental refresh always asks the database again, since tests keep being taken while a study runs
+	def studyQuery(self, name, q):
+		if self.config.incremental_eventlog and self.db.pool is not None:
+			return self.db.runQuery(q)
+		return self.db.query(name, q)
+
+	def prepostTestHeaders(self):
+		return self.db.getHeaders("preposttestdata")
+
+	def prepostTestData(self):
+		return self.studyQuery("preposttestdata", "SELECT * FROM preposttestdata WHERE studId IN " + sqlList(self.student_ids) \
+			+ " ORDER BY studId ASC, testType DESC, probId ASC;")
+
+	#Pull the question information so that we can see what various question ids are asking
+	#Returns the headers and the rows
+	def prepostProblems(self):
+		preposttestproblem_headers = ( #we restrict it to just certain columns because some columns have nasty binary data
+			"id", "name", "description", "answer", "ansType", "problemSet",
+			"aChoice", "bChoice", "cChoice", "dChoice", "eChoice", "descriptionId"
+		)
+		preposttestproblem = self.studyQuery("preposttestproblem", "SELECT " + ", ".join(preposttestproblem_headers) \
+				+ " FROM prepostproblem WHERE id IN " \
+				+ "(SELECT DISTINCT(id) FROM prepostproblem WHERE id IN " \
+				+ "(SELECT probId FROM preposttestdata WHERE studId IN " + sqlList(self.student_ids) + ")) " \
+				+ "ORDER BY id ASC;")
+		return preposttestproblem_headers, preposttestproblem
+
+	#Both Markov tests work from the same emotion self-report transitions, so they're only pulled out once
+	def emotionTransitions(self):
+		from mathspring import markov
+		if getattr(self, "emotion_transitions", None) is None:
+			self.emotion_transitions = markov.extractTransitions(self.student_timeseries_emotion_metrics)
+		return self.emotion_transitions
+
+	def markov_pedagogy(self):
+		from mathspring import markov
+		self.pedagogy_p, self.pedagogy_permutation_p = markov.pedagogyTest(self.emotionTransitions(), self.config.smoothing,
+			self.config.permutations, self.config.permutation_seed, self.config.processes)
+
+	def markov_messages(self):
+		from mathspring import markov
+		self.message_p = markov.messageTest(self.emotionTransitions(), self.config.smoothing)
+
+	def markov_models(self):
+		from mathspring import transitionmodels
+		self.transition_models, self.transition_model_p = transitionmodels.fitModels(self.student_timeseries_emotion_metrics,
+			self.config.markov_levels, self.config.markov_order, self.config.smoothing, self.config.processes)
+
+	def partial_correlations(self):
+		from mathspring import partialcorr
+		config = self.config
+		self.partial_correlations = partialcorr.studyCorrelations(self.student_metrics, config.prepost_categories_inv, config.category_order)
+		partialcorr.printCorrelations(self.partial_correlations)
+		if config.partial_correlations_file is not None:
+			partialcorr.saveCorrelations(self.partial_correlations, config.partial_correlations_file)
+			print "Saved the partial correlations in %s" % config.partial_correlations_file
+
+#Runs the pipeline from the command line, with options that override the configuration
+def main(config, argv=None):
+	parser = argparse.ArgumentParser(description="Process the study's Mathspring data.")
+	parser.add_argument("--stages", nargs="+", default=list(stage_order), metavar="STAGE",
+		help="which stages to run (plus the ones they need): " + ", ".join(stage_order))
+	parser.add_argument("--reload", action="store_true", help="re-run queries even if their results are already cached")
+	parser.add_argument("--stream", action="store_true", help="process the event log row-by-row as it arrives")
+	parser.add_argument("--incremental", action="store_true", help="only pull event log rows newer than the ones we already have")
+	parser.add_argument("--processes", type=int, help="how many processes to split the event log processing across")
+	parser.add_argument("--output", help="the workbook file to write")
+	parser.add_argument("--permutations", type=int, help="how many shuffles to do for the pedagogy permutation test (0 to skip it)")
+	parser.add_argument("--seed", type=int, help="the random seed for the permutation test")
+	parser.add_argument("--markov-order", type=int, help="how many earlier self-reports the markov-models stage conditions on")
+	parser.add_argument("--format", choices=export.export_formats, help="what to write the workbook as")
+	parser.add_argument("--connections", type=int, help="how many database queries to run at once")
+	parser.add_argument("--dump", metavar="EVENTLOG_FILE",
+		help="read the event log from an exported CSV/TSV file (in any order) instead of the database, sorting it on disk")
+	parser.add_argument("--sort-memory", type=int, metavar="MB", help="about how much memory sorting an event log dump can use")
+	parser.add_argument("--chunked", action="store_true", help="pull the event log in index-friendly, resumable chunks")
+	parser.add_argument("--project", action="store_true", help="only pull the event log columns the processing needs")
+	parser.add_argument("--verify-projection", metavar="SQLITE_FILE",
+		help="check that projection mode gets the same results, against a SQLite copy of the study's tables (made if it doesn't exist)")
+	parser.add_argument("--profile", action="store_true", help="sample what each stage spends its time on (see instrument.py)")
+	parser.add_argument("--instrumentation", metavar="JSON_FILE", help="save each stage's time, memory, rows and cache use in this file")
+	parser.add_argument("--no-checkpoints", action="store_true", help="run every stage, instead of using saved results whose inputs haven't changed")
+	parser.add_argument("--live", type=float, metavar="SECONDS",
+		help="keep the per-student numbers up to date while the study runs, checking for new event log rows this often (see live.py)")
+	parser.add_argument("--batch", nargs="+", metavar="STUDY_FILE",
+		help="run the stages for each of these study files (see batch.py), pulling and processing their data once")
+	args = parser.parse_args(argv)
+	for stage in args.stages:
+		if stage not in stage_requirements:
+			parser.error("unknown stage %s (the stages are %s)" % (stage, ", ".join(stage_order)))
+	if args.reload:
+		config.reload_data = True
+	if args.stream:
+		config.stream_eventlog = True
+	if args.incremental:
+		config.incremental_eventlog = True
+	if args.processes is not None:
+		config.processes = args.processes
+	if args.output is not None:
+		config.output_file = args.output
+	if args.format is not None:
+		config.output_format = args.format
+	if args.permutations is not None:
+		config.permutations = args.permutations
+	if args.seed is not None:
+		config.permutation_seed = args.seed
+	if args.markov_order is not None:
+		config.markov_order = args.markov_order
+	if args.connections is not None:
+		config.db_connections = args.connections
+	if args.dump is not None:
+		config.eventlog_dump_file = args.dump
+	if args.sort_memory is not None:
+		config.sort_memory_megabytes = args.sort_memory
+	if args.chunked:
+		config.chunked_extraction = True
+	if args.project:
+		config.project_eventlog = True
+	if args.profile:
+		config.profile_stages = True
+	if args.no_checkpoints:
+		config.checkpoints = False
+	if args.instrumentation is not None:
+		config.instrumentation_file = args.instrumentation
+	if args.verify_projection is not None:
+		from mathspring import projection
+		return projection.verify(config, args.verify_projection)
+	if args.live is not None:
+		from mathspring import live
+		return live.LiveStudy(config).run(args.live)
+	if args.batch is not None:
+		from mathspring import batch
+		return batch.runBatch(config, args.batch, args.stages)
+	pipeline = Pipeline(config)
+	pipeline.run(args.stages)
+	return pipeline
@@ -0,0 +1,145 @@
+#Scoring the pre/post tests, and finishing off the per-student metrics that depend on them
+from __future__ import division
+from collections import defaultdict
+from mathspring import windows
+from mathspring.eventlog import flipTupleDict
+
+performance_approach_answers = {189: set((1,3)), 190: set((2,3))}
+
+#Which pedagogyIds belong to which group
+pedagogy_groups_inv = dict(Empathy = (1, 2), GrowthMindset = (3, 4), SuccessFailure = (5, 6))
+pedagogy_group_order = ("Empathy", "GrowthMindset", "SuccessFailure")
+pedagogy_groups = flipTupleDict(pedagogy_groups_inv)
+
+#A file containing tab-based columns of studentId, testType (pretest, posttest), probId, and isCorrect
+#Returns a dict of (studId, testType, probId) -> isCorrect
+def readCorrections(prepost_corrections_file):
+	prepost_corrections = {}
+	print "Reading in the correct grading of pre/post test problems..."
+	with open(prepost_corrections_file) as f:
+		lines = f.readlines()[1:] #strip out the header column
+		for line in lines:
+			line = line.replace("\t\t", "\t")
+			columns = line.split("\t")
+			if len(columns) >= 4:
+				studId = int(columns[0].strip())
+				test_type = columns[1].strip()
+				probId = int(columns[2].strip())
+				isCorrect = int(columns[3].strip())
+				prepost_corrections[(studId, test_type, probId)] = isCorrect
+	return prepost_corrections
+
+#Add in the corrected grading where it exists, so the scores and the preposttestdata sheet both use it
+def applyCorrections(preposttestdata, h, prepost_corrections):
+	for row in preposttestdata:
+		studId = int(row[h["studId"]])
+		test_type = row[h["testType"]]
+		probId = int(row[h["probId"]])
+		key = (studId, test_type, probId)
+		isCorrect = prepost_corrections[key] if key in prepost_corrections else int(row[h["isCorrect"]])
+		row[h["isCorrect"]] = isCorrect
+
+#Go through the pre/post test data and extract the scores in each category per student
+#Returns studId -> (test_type -> (category -> [scores]))
+def scoreStudents(preposttestdata, h, prepost_categories_inv):
+	prepost_categories = flipTupleDict(prepost_categories_inv)
+	students_prepost = {}
+	num_missing_answers = 0
+	for row in preposttestdata:
+		studId = row[h['studId']]
+		test_type = row[h['testType']]
+		if studId not in students_prepost:
+			students_prepost[studId] = {}
+		student = students_prepost[studId]
+		if test_type not in student:
+			student[test_type] = defaultdict(list)
+		test = student[test_type]
+		probId = row[h['probId']]
+		if probId in prepost_categories: #if not, then this isn't a survey question
+			category = prepost_categories[probId]
+			try:
+				if category == "Score":
+					test[category].append(float(row[h['isCorrect']]))
+				elif category == "PerformanceApproach":
+					test[category].append(1 if int(row[h['studentAnswer']][0]) in performance_approach_answers[probId] else 0)
+				else:
+					test[category].append(float(row[h['studentAnswer']][0]))
+			except ValueError: #the studentAnswer didn't have a number at the start
+				num_missing_answers += 1
+				pass #If they don't answer, it will have "I don't know", which we can't use
+
+	print "We were missing answers for %d student-question pairs, which we ignored." % num_missing_answers
+	return students_prepost
+
+#Puts each student's pre/post averages and pedagogy into their metrics, and returns the per-group averages
+#Students who didn't do both tests have their answer timeseries dropped
+def groupStudents(student_data, students_prepost, prepost_categories_inv,
+		student_metrics, student_timeseries_answer_metrics, student_timeseries_emotion_metrics):
+	prepost_by_group = {group: {category: [[], []] for category in prepost_categories_inv}
+								for group in pedagogy_groups_inv}
+	num_prepost_students = 0
+	for studId, pedagogyId in student_data:
+		group = prepost_by_group[pedagogy_groups[pedagogyId]]
+		if studId not in students_prepost: #we didn't have pre/post data from this student
+			continue
+		student = students_prepost[studId]
+		if 'pretest' in student and 'posttest' in student: #exclude students that didn't do both
+			num_prepost_students += 1
+			pedagogy = pedagogy_groups[pedagogyId]
+			student_metrics[studId]["Pedagogy"] = pedagogy
+			student_metrics[studId]["AvgProblemDifficulty"] /= student_metrics[studId]["CorrectTotal"] + student_metrics[studId]["IncorrectTotal"]
+			for answer_metric in student_timeseries_answer_metrics[studId]:
+				answer_metric["Pedagogy"] = pedagogy
+			for emotion, emotion_metrics in student_timeseries_emotion_metrics[studId].items():
+				for emotion_metric in emotion_metrics:
+					emotion_metric["Pedagogy"] = pedagogy
+			for test_type,categories in student.items():
+				for category,answers in categories.items():
+					student_average = None
+					if len(answers) > 0: #discard students who didn't answer
+						student_average = sum(answers)/len(answers)
+						group[category][0 if test_type == "pretest" else 1].append(student_average)
+					student_metrics[studId][str(test_type + " " + category)] = student_average
+			pre_score = student_metrics[studId]['pretest Score']
+			post_score = student_metrics[studId]['posttest Score']
+			learning_gain = post_score - pre_score
+			normalized_learning_gain = learning_gain / (1 - pre_score) if pre_score < 1 else None
+			student_metrics[studId]["LearningGain"] = learning_gain
+			student_metrics[studId]["NormalizedLearningGain"] = normalized_learning_gain
+		else:
+			del student_timeseries_answer_metrics[studId]
+
+	print "We had %d students do both the pretest and posttest." % num_prepost_students
+
+	#Convert the list of per-student averages to per-group averages
+	for group, categories in prepost_by_group.items():
+		for category, tests in categories.items():
+			for i in [0,1]:
+				tests[i] = sum(tests[i]) / len(tests[i])
+			tests.append(tests[1] - tests[0]) #add a pre/post difference
+		#also do normalized learning gain
+		scores = categories["Score"]
+		normalized_learning_gain = (scores[1] - scores[0]) / (1 - scores[0])
+		categories["NormalizedLearningGain"] = ["", "", normalized_learning_gain]
+	return prepost_by_group
+
+#Works out the metrics that need all of a student's data: the learning estimation, the message percentages,
+# the look-ahead answer metrics, and the averaged problem difficulty for each emotion report
+#Returns the answer windows that aren't studentanswermetrics columns, as a list of (label, values)
+def finishMetrics(student_metrics, student_timeseries_answer_metrics, student_timeseries_emotion_metrics, learning_estimation,
+		answer_windows=windows.default_windows):
+	for student,metrics in student_metrics.items():
+		#Add in learning estimation
+		metrics["LearningEstimation"] = learning_estimation[student] if student in learning_estimation else None
+		#Convert message counts to percentages
+		for message_type in ("Empathy", "GrowthMindset", "SuccessFailure"):
+			metrics["%" + message_type + " Messages"] = metrics[message_type + " Messages"] / metrics["Total Messages"]
+
+	#Compute the look-ahead values (and any other windows), filling in the rows where they're undefined
+	extra_columns = windows.computeWindows(student_timeseries_answer_metrics, answer_windows)
+
+	for _,emotion_metrics in student_timeseries_emotion_metrics.items():
+		for emotion in ("Confidence", "Frustration"):
+			for emotion_metric in emotion_metrics[emotion]:
+				emotion_metric["AvgProblemDifficulty"] /= max(1, emotion_metric["CorrectTotal"] + emotion_metric["IncorrectTotal"])
+	return extra_columns
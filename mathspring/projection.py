@@ -0,0 +1,111 @@
+#Projection mode: only pulling the parts of the event log that the processing reads
+#Instead of SELECT * (which drags along wide text columns like userInput for every row), the event log query
+# only asks for the columns the row-by-row processing reads, and userInput only for the InputResponse rows that can be
+# emotion self-reports
+#The per-student totals can't be left to the database instead, since the timeseries record their running values at each answer
+#verify() checks this against the full-scan path, using a local SQLite copy of the study's tables
+from __future__ import division
+import copy, os
+
+#The event log columns that EventlogProcessor (and the incremental store) actually read
+projected_headers = ("id", "studId", "sessNum", "time", "activityName", "action", "isCorrect", "problemId", "hintId",
+	"probElapsed", "emotion", "userInput")
+
+def eventlogSelect():
+	return "SELECT " + ", ".join(header for header in projected_headers if header != "userInput") \
+		+ ", CASE WHEN TRIM(action) = 'InputResponse' THEN userInput ELSE NULL END AS userInput FROM eventlog"
+
+#Writes the tables the stages query into a SQLite database, from a pipeline that has already run them
+#Only the study's rows are copied, and the student table is rebuilt from the study's selection
+# (just the columns the student query uses), since that's all the cached results have
+#The actions are written with spaces around them, like padded values in the real table, which the processing strips
+# but SQL doesn't, so the check covers those too
+def writeSqliteCopy(pipeline, path):
+	import sqlite3
+	from mathspring import export
+	config = pipeline.config
+	print "Copying the study's tables into %s..." % path
+	if os.path.exists(path):
+		os.remove(path)
+	connection = sqlite3.connect(path)
+	def copyTable(name, headers, rows, types=None):
+		table = export.SqliteTable(connection, name, headers, types)
+		for row in rows:
+			table.writeRow(row)
+	copyTable("student", ("id", "pedagogyId", "trialUser", "userName", "classId"),
+		((studId, pedagogyId, 0, "", config.classes[0]) for studId, pedagogyId in pipeline.student_data))
+	copyTable("problem", ("id", "cachedProbDifficulty"), sorted(pipeline.problem_difficulty.items()))
+	action_column = list(pipeline.eventlog_headers).index("action")
+	def padded(row):
+		row = list(row)
+		if row[action_column] is not None:
+			row[action_column] = " " + row[action_column] + " "
+		return row
+	copyTable("eventlog", pipeline.eventlog_headers, (padded(row) for row in pipeline.eventlog),
+		["TIMESTAMP" if header == "time" else None for header in pipeline.eventlog_headers])
+	copyTable("preposttestdata", pipeline.preposttest_headers, pipeline.preposttestdata)
+	copyTable("prepostproblem", *pipeline.prepostProblems()) #so the workbook stage can run against the copy too
+	connection.commit()
+	connection.close()
+
+def valuesDiffer(a, b):
+	if isinstance(a, float) or isinstance(b, float):
+		if a is None or b is None:
+			return a is not b
+		return abs(a - b) > 1e-9 * max(1, abs(a), abs(b))
+	return a != b
+
+#Lists where two pipelines' results differ (floats only have to match to about 9 digits)
+def compareResults(full, projected):
+	from mathspring.records import Record
+	differences = []
+	def compare(path, a, b):
+		if isinstance(a, Record) and isinstance(b, Record):
+			a, b = dict(zip(a.labels, a.getter(a.labels)(a))), dict(zip(b.labels, b.getter(b.labels)(b)))
+		if isinstance(a, dict) and isinstance(b, dict):
+			for key in sorted(set(a) | set(b)):
+				compare(path + [key], a.get(key), b.get(key))
+		elif isinstance(a, (list, tuple)) and isinstance(b, (list, tuple)) and len(a) == len(b):
+			for i, (a_value, b_value) in enumerate(zip(a, b)):
+				compare(path + [i], a_value, b_value)
+		elif valuesDiffer(a, b):
+			differences.append("%s: %r != %r" % (" / ".join(str(key) for key in path), a, b))
+	for name in ("student_metrics", "student_timeseries_answer_metrics", "student_timeseries_emotion_metrics", "prepost_by_group"):
+		compare([name], getattr(full, name), getattr(projected, name))
+	compare(["EventType"], full.derived_columns.event_types, projected.derived_columns.event_types)
+	compare(["UniqueEndProb"], list(full.derived_columns.unique_end_probs), list(projected.derived_columns.unique_end_probs))
+	return differences
+
+#Runs the stages up to prepost the usual way, then again in projection mode against a SQLite copy of the study's tables
+# (made from the first run if sqlite_file doesn't exist yet), and prints anything that doesn't match
+def verify(config, sqlite_file):
+	from mathspring import pipeline
+	config = copy.copy(config)
+	config.project_eventlog = False
+	config.stream_eventlog = False
+	config.incremental_eventlog = False
+	print "Running the full-scan path..."
+	full = pipeline.Pipeline(config)
+	full.run(("prepost",))
+	if not os.path.exists(sqlite_file):
+		writeSqliteCopy(full, sqlite_file)
+
+	projected_config = copy.copy(config)
+	projected_config.project_eventlog = True
+	projected_config.db_sqlite_file = sqlite_file
+	projected_config.reload_data = True
+	projected_config.data_folder = os.path.join(config.data_folder, "projection-check")
+	print "Running the projection path against %s..." % sqlite_file
+	projected = pipeline.Pipeline(projected_config)
+	projected.run(("prepost",))
+
+	differences = compareResults(full, projected)
+	for difference in differences[:50]:
+		print difference
+	if len(differences) > 50:
+		print "...and %d more" % (len(differences) - 50)
+	if len(differences) == 0:
+		print "The projection results match the full-scan ones."
+	else:
+		print "The projection results don't match the full-scan ones (%d differences)." % len(differences)
+	return differences
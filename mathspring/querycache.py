@@ -0,0 +1,112 @@
+#A content-addressed cache for query results
+#Each result is stored under a hash of the query text (plus anything else that changes the result, like which
+# database it came from), so different study configurations can share one data folder without ever
+# picking up each other's results, and a result that's already been pulled never has to be pulled again
+#A manifest keeps track of what's in the cache and when it was last used, so the least recently used
+# results can be thrown out once the cache grows past its size limit
+from __future__ import division
+import hashlib, json, os, shutil, time
+
+class QueryCache(object):
+	def __init__(self, folder, max_bytes=None, params=()):
+		self.folder = folder
+		self.max_bytes = max_bytes
+		self.params = tuple(params)
+		self.manifest_filename = os.path.join(folder, "manifest.json")
+		if not os.path.exists(folder):
+			os.makedirs(folder)
+		self.entries = {}
+		if os.path.exists(self.manifest_filename):
+			with open(self.manifest_filename) as f:
+				self.entries = json.load(f)
+		self.hits = []
+		self.misses = []
+		self.refreshed = []
+		self.legacy = []
+		self.evicted = []
+
+	def key(self, q):
+		return hashlib.sha1(json.dumps([str(param) for param in self.params] + [q])).hexdigest()
+
+	#The file or folder that the result of q should be written to, for the given kind of cache file
+	def entryPath(self, q, kind):
+		return os.path.join(self.folder, self.key(q) + "." + kind)
+
+	#Returns (path, kind) for a cached result of q, or None if we don't have it
+	def find(self, name, q):
+		key = self.key(q)
+		entry = self.entries.get(key)
+		if entry is not None and os.path.exists(os.path.join(self.folder, key + "." + entry["kind"])):
+			self.hits.append(name)
+			entry["last_used"] = time.time()
+			self.saveManifest()
+			return os.path.join(self.folder, key + "." + entry["kind"]), entry["kind"]
+		self.misses.append(name)
+		return None
+
+	#Records a result that was just written to entryPath(q, kind), then evicts old results if we're over the limit
+	def add(self, name, q, kind, refreshed=False):
+		key = self.key(q)
+		old_entry = self.entries.get(key)
+		if old_entry is not None and old_entry["kind"] != kind: #don't leave the other format lying around
+			removePath(os.path.join(self.folder, key + "." + old_entry["kind"]))
+		now = time.time()
+		self.entries[key] = dict(name=name, query=q, kind=kind, created=now, last_used=now,
+								 size=pathSize(os.path.join(self.folder, key + "." + kind)))
+		if refreshed:
+			self.refreshed.append(name)
+		self.evict(keep=key)
+		self.saveManifest()
+
+	#Notes that a result was read from an old name-based cache file, which isn't tied to its query
+	def noteLegacy(self, name):
+		self.legacy.append(name)
+
+	def totalSize(self):
+		return sum(entry["size"] for entry in self.entries.values())
+
+	def evict(self, keep=None):
+		if self.max_bytes is None:
+			return
+		by_age = sorted(self.entries.items(), key=lambda item: item[1]["last_used"])
+		total = self.totalSize()
+		for key, entry in by_age:
+			if total <= self.max_bytes:
+				break
+			if key == keep:
+				continue
+			removePath(os.path.join(self.folder, key + "." + entry["kind"]))
+			del self.entries[key]
+			total -= entry["size"]
+			self.evicted.append(entry["name"])
+
+	def saveManifest(self):
+		partial_filename = self.manifest_filename + ".partial"
+		with open(partial_filename, 'w') as f:
+			json.dump(self.entries, f, indent=1, sort_keys=True)
+		if os.path.exists(self.manifest_filename):
+			os.remove(self.manifest_filename)
+		os.rename(partial_filename, self.manifest_filename)
+
+	#A short summary of how the cache was used during this run
+	def report(self):
+		lines = ["Query cache: %d hits, %d misses, %d refreshed, %d evicted; %.1f MB in %d results" % \
+			(len(self.hits), len(self.misses), len(self.refreshed), len(self.evicted),
+			 self.totalSize() / 2**20, len(self.entries))]
+		for label, names in (("hits", self.hits), ("misses", self.misses), ("refreshed", self.refreshed),
+							 ("evicted", self.evicted), ("read from unkeyed cache files", self.legacy)):
+			if len(names) > 0:
+				lines.append("  %s: %s" % (label, ", ".join(names)))
+		return "\n".join(lines)
+
+def pathSize(path):
+	if os.path.isdir(path):
+		return sum(os.path.getsize(os.path.join(root, filename))
+				   for root, _, filenames in os.walk(path) for filename in filenames)
+	return os.path.getsize(path) if os.path.exists(path) else 0
+
+def removePath(path):
+	if os.path.isdir(path):
+		shutil.rmtree(path)
+	elif os.path.exists(path):
+		os.remove(path)
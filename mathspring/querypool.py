@@ -0,0 +1,88 @@
+#Running independent queries at the same time, each on its own database connection
+#Queries spend nearly all of their time waiting on the database, so threads are enough for this
+# (pymysql and sqlite3 both let go of the GIL while they wait)
+import sys, threading, Queue
+
+#Hands out up to size connections, only opening them as they're needed
+#connect() opens a new connection; anything that's acquired has to be released again
+class ConnectionPool(object):
+	def __init__(self, connect, size):
+		self.connect = connect
+		self.size = max(1, size)
+		self.idle = Queue.LifoQueue()
+		self.num_open = 0
+		self.lock = threading.Lock()
+
+	def acquire(self):
+		with self.lock:
+			open_new = self.idle.empty() and self.num_open < self.size
+			if open_new:
+				self.num_open += 1
+		if open_new:
+			try:
+				return self.connect()
+			except:
+				with self.lock:
+					self.num_open -= 1
+				raise
+		return self.idle.get()
+
+	def release(self, connection):
+		self.idle.put(connection)
+
+	def close(self):
+		while not self.idle.empty():
+			self.idle.get().close()
+			self.num_open -= 1
+
+#A function that's been handed to a QueryScheduler, whose result can be waited on
+class QueryJob(object):
+	def __init__(self, name, function):
+		self.name = name
+		self.function = function
+		self.finished = threading.Event()
+		self.value = None
+		self.exc_info = None
+
+	def run(self):
+		try:
+			self.value = self.function()
+		except BaseException: #including the SystemExit from a missing cache, which has to happen on the main thread
+			self.exc_info = sys.exc_info()
+		self.finished.set()
+
+	#Waits for the job to finish, and returns what it returned (or raises what it raised)
+	def result(self):
+		while not self.finished.wait(0.1): #waiting in short steps keeps Ctrl-C working
+			pass
+		if self.exc_info is not None:
+			raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+		return self.value
+
+#Runs jobs on num_threads threads, in the order they're submitted
+class QueryScheduler(object):
+	def __init__(self, num_threads):
+		self.queue = Queue.Queue()
+		self.threads = [threading.Thread(target=self.work) for i in range(num_threads)]
+		for thread in self.threads:
+			thread.daemon = True
+			thread.start()
+
+	def work(self):
+		while True:
+			job = self.queue.get()
+			if job is None:
+				break
+			job.run()
+
+	def submit(self, name, function):
+		job = QueryJob(name, function)
+		self.queue.put(job)
+		return job
+
+	#Lets the jobs that have been submitted finish, then stops the threads
+	def close(self):
+		for thread in self.threads:
+			self.queue.put(None)
+		for thread in self.threads:
+			thread.join()
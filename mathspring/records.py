@@ -0,0 +1,73 @@
+#Fixed-schema records for the per-answer and per-emotion-report timeseries
+#There's one of these for every problem a student answers, so they use __slots__ instead of a dict for each one
+#They can still be read and written by label like the dicts they replace (e.g. record["Last Problem Empathy"]),
+# and every field starts at 0, like a defaultdict(int)
+from operator import attrgetter
+
+#Labels can have spaces in them, which attribute names can't
+def slotName(label):
+	return label.replace(" ", "_")
+
+class Record(object):
+	__slots__ = ()
+	labels = ()
+
+	def __init__(self):
+		for slot in self.__slots__:
+			setattr(self, slot, 0)
+
+	def __getitem__(self, label):
+		try:
+			return getattr(self, slotName(label))
+		except AttributeError:
+			raise KeyError(label)
+
+	def __setitem__(self, label, value):
+		try:
+			setattr(self, slotName(label), value)
+		except AttributeError:
+			raise KeyError(label)
+
+	#Returns a function that gets the given fields from a record as a tuple, which is much faster than going label by label
+	@classmethod
+	def getter(cls, labels):
+		getter = attrgetter(*[slotName(label) for label in labels])
+		if len(labels) == 1:
+			return lambda record: (getter(record),)
+		return getter
+
+	#Makes a record from one of the dicts these used to be (e.g. in a saved incremental event log)
+	@classmethod
+	def fromDict(cls, d):
+		record = cls()
+		for label, value in d.items():
+			record[label] = value
+		return record
+
+	#Slotted classes can't be pickled without these
+	def __getstate__(self):
+		return tuple(getattr(self, slot) for slot in self.__slots__)
+
+	def __setstate__(self, state):
+		for slot, value in zip(self.__slots__, state):
+			setattr(self, slot, value)
+
+	def __repr__(self):
+		return "%s(%s)" % (type(self).__name__, ", ".join("%s=%r" % (label, self[label]) for label in self.labels))
+
+#One row of the studentanswermetrics sheet, in the order of its columns
+class AnswerRecord(Record):
+	labels = ("studId", "Pedagogy", "ProblemDifficulty",
+		"TimeInTutor", "TimeToFirst", "TimeOnProblem", "LastIncorrectAttempts", "CurrentIncorrectAttempts",
+		"TotalHints", "HintsLast3", "HintsNext3", "HintsInProblem",
+		"Total Messages", "Empathy Messages", "GrowthMindset Messages", "SuccessFailure Messages",
+		"CorrectTotal", "IncorrectTotal", "CorrectLast3", "CorrectNext3", "IncorrectLast3",
+		"LastCorrect", "CurrentCorrect", "LastHints", "CurrentHints",
+		"Last Problem Empathy", "Last Problem GrowthMindset", "Last Problem SuccessFailure")
+	__slots__ = tuple(slotName(label) for label in labels)
+
+#One emotion self-report; only one of Confidence and Frustration is set, depending on which emotion it's for
+class EmotionRecord(Record):
+	labels = ("studId", "Pedagogy", "Confidence", "Frustration", "AvgProblemDifficulty", "CorrectTotal",
+		"IncorrectTotal", "TotalIncorrectAttempts", "Empathy Messages", "GrowthMindset Messages", "SuccessFailure Messages")
+	__slots__ = tuple(slotName(label) for label in labels)
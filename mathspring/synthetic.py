@@ -0,0 +1,280 @@
+#Making up realistic Mathspring data, for trying the processing out at sizes we don't have real data for
+#The tables are written into a SQLite database with the same columns as the real ones (the event log and pre/post test
+# columns are the ones in dec2016-empathy-data's header caches), which db_sqlite_file can then point the pipeline at
+#Each student gets a session on each study day that works through problems (BeginProblem, then Attempts and Hints until
+# they get it right or give up, then EndProblem), with the odd topic intro, demo, progress page visit and emotion
+# self-report (the AskEmotionIntervention XML in userInput), and the learning companion messages of their pedagogy's
+# type in the emotion column of their attempts
+#Everything comes from the seed, so the same settings always make the same data
+#LiveSimulator writes the event log in a bit at a time instead, like a study that's still running (see live.py)
+from __future__ import division
+from datetime import date, datetime, timedelta
+import os, random, time
+
+eventlog_headers = ("id", "studId", "sessNum", "action", "userInput", "isCorrect", "elapsedTime", "probElapsed", "problemId",
+	"hintStep", "hintId", "emotion", "activityName", "auxId", "auxTable", "time", "curTopicId", "testerNote", "clickTime")
+preposttestdata_headers = ("sessionId", "probId", "probName", "isCorrect", "studentAnswer", "studId", "testType", "timeOnProblem",
+	"seqNum", "skipped")
+prepostproblem_headers = ("id", "name", "description", "answer", "ansType", "problemSet",
+	"aChoice", "bChoice", "cChoice", "dChoice", "eChoice", "descriptionId")
+
+#The pre/post test problems, the same as in the Dec 2016 study
+survey_problems = tuple(range(176, 191))
+score_problems = tuple(range(262, 267))
+other_problems = tuple(range(210, 215))
+#The survey categories for them (what prepost_categories_inv should be set to for this data)
+prepost_categories_inv = dict(
+	Interest				= (176,),
+	Confusion				= (177,),
+	Frustration 			= (178,188),
+	Excitement				= (179,),
+	PerformanceAvoidance	= (180,186),
+	LearningOrientation		= (181,183),
+	MathValue				= (185,),
+	MathLiking				= (187,),
+	PerformanceApproach		= (189, 190),
+	Score					= score_problems
+)
+category_order = ("Interest", "Excitement", "Confusion", "Frustration",
+					"PerformanceAvoidance", "PerformanceApproach", "LearningOrientation",
+					"MathValue", "MathLiking", "Score", "NormalizedLearningGain")
+survey_levels = ("1 - Not at all", "2 - A little", "3 - Somewhat", "4 - Quite a bit", "5 - Extremely")
+approach_answers = ("1. Problems that are easy, so I don't make mistakes", "2. Problems that show I'm smart",
+	"3. Problems that I am pretty good at, so I can show that I'm smart", "4. Problems where I learn something new")
+
+#The learning companion messages each pedagogy group's students get (see eventlog.lc_message_map_inv and prepost.pedagogy_groups_inv)
+group_messages = {
+	1: ('interestHigh', 'frustrationLow', 'confidenceHigh', 'anxiousCombo1'),
+	2: ('frustratedCombo1', 'frustratedCombo2', 'anxiousCombo2', 'interestHigh'),
+	3: ('incorrectEffort1', 'incorrectAttribution2', 'generalAttribution1', 'correctEffort1'),
+	4: ('noEffortAttribution2', 'incorrectNoEffort1', 'generalAttribution4', 'correctEffort2'),
+	5: ('incorrect1', 'incorrect4', 'correct2', 'correct5'),
+	6: ('incorrect2', 'incorrect6', 'correct1', 'correct6'),
+}
+
+default_classes = (1284, 1285, 1286)
+default_days = (date(2016, 12, 1), date(2016, 12, 2), date(2016, 12, 8), date(2016, 12, 9))
+
+#The time ranges that cover the given days (what time_ranges should be set to for this data)
+def timeRanges(days=default_days):
+	return tuple((day, day) for day in days)
+
+emotions = ("Confidence", "Frustration")
+
+def emotionInput(emotion, level):
+	return '<interventionInput class="AskEmotionIntervention"><emotion name="%s" level="%d" ><![CDATA[]]></emotion></interventionInput>' \
+		% (emotion, level)
+
+#Makes up students' event log rows, from the (id, difficulty) problems
+class StudentGenerator(object):
+	def __init__(self, rand, problems):
+		self.rand = rand
+		self.problems = problems
+
+	#One student's rows, in time order; next_id and next_session are where the row and session ids carry on from
+	#Only students who did both pre/post tests get asked about their emotions, since the Markov models group the
+	# self-reports by the pedagogy that only those students get assigned
+	#They're asked about both emotions when they start and when they finish as well, so each of them has transitions out of
+	# the moods they started in; mood is what those are instead of random ones
+	#Returns the rows and the next row id
+	def generate(self, studId, pedagogyId, class_num, days, next_id, next_session, problems_per_session, self_reports=True, mood=None):
+		rand = self.rand
+		rows = []
+		ability = rand.gauss(0.6, 0.15)
+		mood = dict(mood or dict(Confidence=rand.randint(2, 4), Frustration=rand.randint(2, 4)))
+		messages = group_messages[pedagogyId]
+		state = dict(id=next_id, time=None, messaged=False)
+		def add(session, action, activity, isCorrect=None, probElapsed=0, problemId=None, hintStep=None, hintId=None,
+				emotion=None, userInput=None):
+			state["time"] += timedelta(seconds=rand.randint(2, 40))
+			rows.append([state["id"], studId, session, action, userInput, isCorrect, rand.randint(0, 5000), probElapsed, problemId,
+				hintStep, hintId, emotion, activity, None, None, state["time"], rand.randint(1, 40), None, 0])
+			state["id"] += 1
+		def askEmotion(session, emotion, answered=True):
+			add(session, "BeginIntervention", "AskEmotionIntervention-" + emotion)
+			add(session, "InputResponse", "AskEmotionIntervention-" + emotion,
+				userInput=emotionInput(emotion, mood[emotion] if answered else -1))
+		for day_num, day in enumerate(days):
+			session = next_session + day_num
+			state["time"] = datetime(day.year, day.month, day.day, 8 + class_num, rand.randint(0, 20), rand.randint(0, 59))
+			add(session, "Home", "")
+			if self_reports and day_num == 0:
+				for emotion in emotions:
+					askEmotion(session, emotion)
+			for problem_num in range(max(1, int(rand.gauss(problems_per_session, problems_per_session / 4)))):
+				problemId, difficulty = rand.choice(self.problems)
+				if rand.random() < 0.1:
+					add(session, "BeginProblem", "TopicIntro", problemId=problemId)
+					add(session, "EndProblem", "TopicIntro", problemId=problemId)
+				activity = "demo" if problem_num > 0 and rand.random() < 0.05 else "practice"
+				add(session, "BeginProblem", activity, problemId=problemId)
+				elapsed = 0
+				correct = False
+				num_incorrect = 0
+				num_hints = 0
+				#the first problem of the session always gets an answer, so everyone has something to average
+				while activity != "demo" and not correct and num_incorrect < 4 and (problem_num == 0 or rand.random() < 0.95):
+					elapsed += rand.randint(2000, 40000)
+					if rand.random() < 0.15 + 0.3 * difficulty and num_hints < 5:
+						num_hints += 1
+						add(session, "Hint", activity, probElapsed=elapsed, problemId=problemId, hintStep=num_hints,
+							hintId=problemId * 10 + num_hints)
+						continue
+					correct = rand.random() < ability + 0.25 - 0.5 * difficulty + 0.1 * num_hints
+					#the companion talks after about a third of the answers (always the first, so everyone gets a message)
+					emotion = rand.choice(messages) if not state["messaged"] or rand.random() < 0.35 else None
+					state["messaged"] = True
+					add(session, "Attempt", activity, isCorrect=int(correct), probElapsed=elapsed, problemId=problemId, emotion=emotion)
+					if not correct:
+						num_incorrect += 1
+				elapsed += rand.randint(500, 5000)
+				add(session, "EndProblem", activity, probElapsed=elapsed, problemId=problemId)
+				#Moods drift with how the problem went, so the self-reports have some structure to them
+				if correct:
+					mood["Confidence"] = min(5, mood["Confidence"] + (rand.random() < 0.4))
+					mood["Frustration"] = max(1, mood["Frustration"] - (rand.random() < 0.4))
+				elif activity != "demo":
+					mood["Confidence"] = max(1, mood["Confidence"] - (rand.random() < 0.4))
+					mood["Frustration"] = min(5, mood["Frustration"] + (rand.random() < 0.4))
+				if self_reports and rand.random() < 0.2:
+					askEmotion(session, rand.choice(emotions), rand.random() < 0.95)
+				if rand.random() < 0.05:
+					add(session, "MyProgressPage", "")
+					add(session, "MPPContinueTopic", "")
+			if self_reports and day_num == len(days) - 1:
+				for emotion in emotions:
+					askEmotion(session, emotion)
+		return rows, state["id"]
+
+#Makes up a student's pre/post test answers; ability is how likely they are to get the score problems right
+def prepostRows(rand, studId, test_type, session_id, ability):
+	rows = []
+	problems = list(survey_problems + other_problems + score_problems)
+	for seq_num, probId in enumerate(problems):
+		isCorrect = 1
+		if probId in score_problems:
+			isCorrect = int(rand.random() < ability)
+			answer = "42" if isCorrect else "24"
+		elif probId in (189, 190):
+			answer = rand.choice(approach_answers)
+		elif rand.random() < 0.02:
+			answer = "I don't know"
+		else:
+			answer = rand.choice(survey_levels)
+		skipped = int(rand.random() < 0.01)
+		rows.append([session_id, probId, "", isCorrect, answer, studId, test_type, rand.randint(3, 150), seq_num, skipped])
+	return rows
+
+#Writes a made-up study of num_students students into a SQLite database at path
+#Returns the number of rows in each table
+def generate(path, num_students, seed=1, classes=default_classes, days=default_days, num_problems=200, problems_per_session=12):
+	import sqlite3
+	from mathspring import export
+	rand = random.Random(seed)
+	print "Making up a study of %d students over %d days in %s..." % (num_students, len(days), path)
+	if os.path.exists(path):
+		os.remove(path)
+	connection = sqlite3.connect(path)
+	def table(name, headers, types=None):
+		return export.SqliteTable(connection, name, headers, types)
+
+	problems = [(1000 + i, round(rand.betavariate(2, 3), 6)) for i in range(num_problems)]
+	problem_table = table("problem", ("id", "cachedProbDifficulty"))
+	for row in problems:
+		problem_table.writeRow(row)
+
+	student_table = table("student", ("id", "pedagogyId", "trialUser", "userName", "classId"))
+	eventlog_table = table("eventlog", eventlog_headers, ["TIMESTAMP" if header == "time" else None for header in eventlog_headers])
+	preposttest_table = table("preposttestdata", preposttestdata_headers)
+	generator = StudentGenerator(rand, problems)
+	first_studId = 40000
+	#the first few in each pedagogy group start out confident and not frustrated, or the other way round, so every group
+	# has transitions out of both states of both emotions for the Markov models
+	opening_moods = (dict(Confidence=4, Frustration=2), dict(Confidence=2, Frustration=4))
+	next_id = 1
+	num_rows = dict(student=0, eventlog=0, preposttestdata=0, problem=len(problems))
+	for i in range(num_students):
+		studId = first_studId + i
+		pedagogyId = 1 + i % 6
+		class_num = i % len(classes)
+		#a few test accounts and trial users, which the student query leaves out
+		userName = "test%d" % i if i >= 12 and rand.random() < 0.01 else "student%d" % i
+		student_table.writeRow((studId, pedagogyId, int(i >= 12 and rand.random() < 0.01), userName, classes[class_num]))
+		ability = min(0.95, max(0.05, rand.gauss(0.5, 0.2)))
+		#the first few in each pedagogy group always do both tests, so every group has someone to average
+		took_pretest = i < 12 or rand.random() < 0.85
+		took_posttest = took_pretest and (i < 12 or rand.random() < 0.85)
+		rows, next_id = generator.generate(studId, pedagogyId, class_num, days, next_id, studId * 100, problems_per_session,
+			took_posttest, opening_moods[i // 6] if i < 12 else None)
+		connection.executemany(eventlog_table.insert, rows)
+		prepost = []
+		if took_pretest:
+			prepost += prepostRows(rand, studId, "pretest", 2 * studId, ability)
+		if took_posttest:
+			prepost += prepostRows(rand, studId, "posttest", 2 * studId + 1, min(0.95, ability + rand.gauss(0.05, 0.1)))
+		connection.executemany(preposttest_table.insert, prepost)
+		num_rows["student"] += 1
+		num_rows["eventlog"] += len(rows)
+		num_rows["preposttestdata"] += len(prepost)
+
+	prepostproblem_table = table("prepostproblem", prepostproblem_headers)
+	for probId in survey_problems + other_problems + score_problems:
+		choices = list(survey_levels) if probId in survey_problems else ["", "", "", "", ""]
+		prepostproblem_table.writeRow([probId, "PP-%d" % probId, "Pre/post test problem %d" % probId, None, 1, 0] + choices + [probId])
+	num_rows["prepostproblem"] = len(survey_problems + other_problems + score_problems)
+
+	#The pipeline asks for the event log by student and time
+	connection.execute("CREATE INDEX eventlog_studId_time ON eventlog (studId, time)")
+	connection.execute("CREATE INDEX preposttestdata_studId ON preposttestdata (studId)")
+	connection.commit()
+	connection.close()
+	print "Made %d event log rows and %d pre/post test answers." % (num_rows["eventlog"], num_rows["preposttestdata"])
+	return num_rows
+
+#Makes up a study like generate(), but holds its event log back, and writes it in a few rows at a time in time order
+#The rows get new ids in the order they're written, the same as the database's auto-incremented ones would be
+class LiveSimulator(object):
+	def __init__(self, path, num_students, seed=1, **settings):
+		import sqlite3
+		generate(path, num_students, seed, **settings)
+		self.connection = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES)
+		rows = self.connection.execute("SELECT * FROM eventlog").fetchall()
+		self.connection.execute("DELETE FROM eventlog")
+		self.connection.execute("CREATE INDEX eventlog_id ON eventlog (id)") #the real id column is the primary key
+		self.connection.commit()
+		id_column = eventlog_headers.index("id")
+		time_column = eventlog_headers.index("time")
+		self.pending = sorted(rows, key=lambda row: (row[time_column], row[id_column]))
+		self.num_written = 0
+		self.insert = "INSERT INTO eventlog VALUES (%s)" % ",".join("?" * len(eventlog_headers))
+
+	def finished(self):
+		return self.num_written == len(self.pending)
+
+	#Writes the next num_rows rows, and returns how many were written
+	def step(self, num_rows):
+		rows = self.pending[self.num_written:self.num_written + num_rows]
+		self.connection.executemany(self.insert, ([self.num_written + i + 1] + list(row[1:]) for i,row in enumerate(rows)))
+		self.connection.commit()
+		self.num_written += len(rows)
+		return len(rows)
+
+	#Writes rows_per_step rows every interval seconds until they've all been written
+	def run(self, rows_per_step=100, interval=1):
+		while not self.finished():
+			self.step(rows_per_step)
+			print "Written %d of %d event log rows." % (self.num_written, len(self.pending))
+			time.sleep(interval)
+
+	def close(self):
+		self.connection.close()
+
+#The settings for running the pipeline on a study made by generate()
+#Anything in settings is passed on to the StudyConfig
+def studyConfig(path, classes=default_classes, days=default_days, **settings):
+	from mathspring import pipeline
+	folder = os.path.splitext(path)[0]
+	defaults = dict(db_sqlite_file=path, data_folder=folder + "-data", output_file=folder + ".xlsx", time_ranges=timeRanges(days),
+		classes=tuple(classes), prepost_categories_inv=prepost_categories_inv, category_order=category_order)
+	defaults.update(settings)
+	return pipeline.StudyConfig(**defaults)
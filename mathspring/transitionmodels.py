@@ -0,0 +1,169 @@
+#Markov models of the emotion self-reports with any number of states and any order, fit for each emotion and group
+#The binary first-order models in markov.py throw away the 1-5 levels, so these keep as much of them as we want:
+# levels maps each self-report level (1-5) to a state, e.g. (0, 1, 2, 3, 4) for all 5 levels,
+# or (1, 1, 0, 0, 0) for the same low/not low states markov.py uses
+#An order-n model predicts each report from the n before it, so its counts are kept as a sparse (k^n histories x k states) matrix
+from __future__ import division
+import os, multiprocessing
+import numpy as np
+from scipy import sparse
+from scipy.stats.distributions import chi2
+from mathspring.markov import emotions, pedagogy_types
+from mathspring.records import EmotionRecord
+
+#The transitions for one emotion: each report after the first order ones, with the order reports before it as a history
+class HistoryTransitions(object):
+	def __init__(self, histories, states, pedagogies, message_flags):
+		self.histories = histories #the earlier states, as a number in base k with the oldest state first
+		self.states = states
+		self.pedagogies = pedagogies #the index in pedagogy_types of the student's pedagogy
+		self.message_flags = message_flags #a column for each of pedagogy_types, set if they got that type of message since the last report
+
+#Goes through everyone's self-reports once, and returns emotion -> HistoryTransitions
+def extractHistories(student_timeseries_emotion_metrics, levels, order):
+	num_states = max(levels) + 1
+	pedagogy_index = {pedagogy: p for p,pedagogy in enumerate(pedagogy_types)}
+	getMessages = EmotionRecord.getter([message_type + " Messages" for message_type in pedagogy_types])
+	columns = {emotion: ([], [], [], []) for emotion in emotions}
+	for _,emotion_metrics in student_timeseries_emotion_metrics.items():
+		for emotion, metrics in emotion_metrics.items():
+			histories, states, pedagogies, message_flags = columns[emotion]
+			sequence = [levels[getattr(metric, emotion) - 1] for metric in metrics]
+			for t in range(order, len(metrics)):
+				history = 0
+				for state in sequence[t-order:t]:
+					history = history * num_states + state
+				histories.append(history)
+				states.append(sequence[t])
+				pedagogies.append(pedagogy_index[metrics[t].Pedagogy])
+				message_flags.append([messages > 0 for messages in getMessages(metrics[t])])
+	return {emotion: HistoryTransitions(np.array(histories, dtype=np.intp), np.array(states, dtype=np.intp),
+				np.array(pedagogies, dtype=np.intp), np.array(message_flags, dtype=bool).reshape(-1, len(pedagogy_types)))
+			for emotion, (histories, states, pedagogies, message_flags) in columns.items()}
+
+#A fitted model; only the counts are stored, and the smoothed probabilities are worked out from them when needed
+class TransitionModel(object):
+	def __init__(self, counts, num_states, order, smoothing):
+		self.counts = counts #sparse (histories x states)
+		self.num_states = num_states
+		self.order = order
+		self.smoothing = smoothing
+		self.totals = np.asarray(counts.sum(axis=1)).ravel()
+
+	def numTransitions(self):
+		return int(self.totals.sum())
+
+	#The smoothed probability of each (history, state) pair; histories we never saw are equally likely to go anywhere
+	#This is the same pseudocount as markov.py, with alpha = total*smoothing/k added to each of the k counts
+	def probabilities(self, histories, states):
+		counts = np.asarray(self.counts[histories, states]).ravel()
+		totals = self.totals[histories]
+		alpha = totals*self.smoothing / self.num_states
+		seen = totals > 0
+		probabilities = np.full(len(histories), 1 / self.num_states)
+		probabilities[seen] = (counts[seen] + alpha[seen])/(totals[seen] + self.num_states*alpha[seen])
+		return probabilities
+
+	#The log-likelihood of the given (sparse) counts under this model
+	def logLikelihood(self, counts):
+		counts = counts.tocoo()
+		return np.sum(counts.data * np.log(self.probabilities(counts.row, counts.col)))
+
+	#The long-run share of reports in each state
+	#An order-n model is a first-order chain over the histories, so this finds that chain's stationary distribution
+	# by power iteration (on the lazy chain, which has the same stationary distribution but can't oscillate)
+	# and then adds up the histories by their latest state
+	def stationaryDistribution(self, tolerance=1e-12, max_iterations=100000):
+		num_histories = self.num_states ** self.order
+		histories = np.repeat(np.arange(num_histories), self.num_states)
+		states = np.tile(np.arange(self.num_states), num_histories)
+		next_histories = (histories * self.num_states + states) % num_histories
+		chain = sparse.csr_matrix((self.probabilities(histories, states), (histories, next_histories)),
+								  shape=(num_histories, num_histories))
+		distribution = np.full(num_histories, 1 / num_histories)
+		for i in range(max_iterations):
+			next_distribution = (distribution + chain.T.dot(distribution)) / 2
+			if np.abs(next_distribution - distribution).sum() < tolerance:
+				distribution = next_distribution
+				break
+			distribution = next_distribution
+		return np.bincount(np.arange(num_histories) % self.num_states, weights=distribution, minlength=self.num_states)
+
+def countHistories(transitions, selected, num_states, order):
+	return sparse.coo_matrix((np.ones(np.count_nonzero(selected)), (transitions.histories[selected], transitions.states[selected])),
+							 shape=(num_states ** order, num_states)).tocsr()
+
+#What the worker processes fit from; they're forked, so they see this as it was when the pool was started
+#This is (transitions, num_states, order, smoothing)
+fit_context = None
+
+#Which of an emotion's transitions go into a group's model
+def groupSelection(transitions, group):
+	if group == "Combined":
+		return np.ones(len(transitions.states), dtype=bool)
+	kind, name = group
+	if kind == "pedagogy":
+		return transitions.pedagogies == pedagogy_types.index(name)
+	return transitions.message_flags[:, pedagogy_types.index(name)]
+
+#Fits one (emotion, group) model, and returns it with its stationary distribution
+def fitGroup(task):
+	transitions, num_states, order, smoothing = fit_context
+	emotion, group = task
+	model = TransitionModel(countHistories(transitions[emotion], groupSelection(transitions[emotion], group), num_states, order),
+							num_states, order, smoothing)
+	return model, model.stationaryDistribution()
+
+def groupName(group):
+	return group if group == "Combined" else "%s %s" % group
+
+#Fits a model for each emotion for everyone combined, each pedagogy group, and the transitions after each type of message,
+# and compares the group models with the combined one using Likelihood Ratio Tests
+#Returns emotion -> (group -> (model, stationary distribution)), and the p-values
+def fitModels(student_timeseries_emotion_metrics, levels, order, smoothing, processes=1):
+	global fit_context
+	num_states = max(levels) + 1
+	print "Fitting %d-state, order %d Markov models for within-tutor emotion self-reports..." % (num_states, order)
+	transitions = extractHistories(student_timeseries_emotion_metrics, levels, order)
+	groups = ["Combined"] + [("pedagogy", pedagogy) for pedagogy in pedagogy_types] + [("message", message_type) for message_type in pedagogy_types]
+	tasks = [(emotion, group) for emotion in emotions for group in groups]
+	fit_context = (transitions, num_states, order, smoothing)
+	if processes > 1 and hasattr(os, "fork"):
+		pool = multiprocessing.Pool(min(processes, len(tasks)))
+		results = pool.map(fitGroup, tasks)
+		pool.close()
+		pool.join()
+	else:
+		results = [fitGroup(task) for task in tasks]
+	fit_context = None
+	fitted = {emotion: {} for emotion in emotions}
+	for (emotion, group), result in zip(tasks, results):
+		fitted[emotion][group] = result
+
+	for emotion in emotions:
+		for group in groups:
+			model, stationary = fitted[emotion][group]
+			print "%s %s: %d transitions, stationary distribution: %s" % (emotion, groupName(group), model.numTransitions(),
+				"(" + ", ".join("%.3f" % share for share in stationary) + ")")
+
+	#Each model has k-1 free probabilities for each of its k^n histories
+	parameters = num_states ** order * (num_states - 1)
+	p_values = {}
+	for emotion in emotions:
+		combined = fitted[emotion]["Combined"][0]
+		#everyone's transitions, with one model per pedagogy group against one model for all of them
+		null_loglikelihood = combined.logLikelihood(combined.counts)
+		alt_loglikelihood = sum(fitted[emotion][("pedagogy", pedagogy)][0].logLikelihood(fitted[emotion][("pedagogy", pedagogy)][0].counts)
+								for pedagogy in pedagogy_types)
+		p = chi2.sf(2 * (alt_loglikelihood - null_loglikelihood), (len(pedagogy_types) - 1) * parameters)
+		p_values[(emotion, "pedagogy")] = p
+		print "For the likelihood ratio test on our %d-state, order %d Markov models for %s by pedagogy, we have p = %.3e" % \
+			(num_states, order, emotion, p)
+		#the transitions after each type of message, with their own model against the combined one
+		for message_type in pedagogy_types:
+			model = fitted[emotion][("message", message_type)][0]
+			p = chi2.sf(2 * (model.logLikelihood(model.counts) - combined.logLikelihood(model.counts)), parameters)
+			p_values[(emotion, message_type)] = p
+			print "For the likelihood ratio test on our %d-state, order %d Markov models for %s after receiving %s messages, we have p = %.3e" % \
+				(num_states, order, emotion, message_type, p)
+	return fitted, p_values
@@ -0,0 +1,118 @@
+#Rolling look-back and look-ahead features over each student's answer timeseries (e.g. HintsNext3)
+#All the students' answers are put end to end in arrays, and every window is worked out for all of them at once
+#The edge cases are filled in the same way as they always have been:
+#	a look-ahead window that runs off the end of a student's answers just covers the answers that are left
+#	their last answer (which has nothing left to look ahead to) gets the average of their other look-ahead values
+#	a look-ahead window's look-back counterpart (if it has one) gets that same average for the student's first answer
+#	the first answer's LastIncorrectAttempts is the student's average LastIncorrectAttempts (over one fewer answer)
+#numpy is only imported when the windows are actually worked out
+from __future__ import division
+from mathspring.records import AnswerRecord
+
+#A window over each answer's neighbours, reduced with "sum" or "mean"
+#A look-back window covers the answer itself and the width-1 before it, and a look-ahead window covers the width after it
+#back_label is a look-back column of the same width (e.g. HintsLast3 for HintsNext3): a full look-ahead window is then
+# just that column from width answers later, which is how the built-in ones have always been worked out
+class Window(object):
+	def __init__(self, label, source, width, reduce="sum", ahead=True, back_label=None):
+		if reduce not in ("sum", "mean"):
+			raise ValueError("A window can only be reduced with sum or mean, not " + reduce)
+		self.label = label
+		self.source = source
+		self.width = width
+		self.reduce = reduce
+		self.ahead = ahead
+		self.back_label = back_label
+
+#The look-ahead windows we've always had
+default_windows = (
+	Window("HintsNext3", "CurrentHints", 3, "mean", back_label="HintsLast3"),
+	Window("CorrectNext3", "CurrentCorrect", 3, "sum", back_label="CorrectLast3"),
+)
+
+#Works out each window for every answer
+#Windows for AnswerRecord fields are stored in the records; the rest are returned as a list of (label, values),
+# with the values in the same order as going through student_timeseries_answer_metrics
+def computeWindows(student_timeseries_answer_metrics, windows=default_windows):
+	import numpy as np
+	records = [answer_metric for _,answer_metrics in student_timeseries_answer_metrics.items() for answer_metric in answer_metrics]
+	lengths = np.array([len(answer_metrics) for _,answer_metrics in student_timeseries_answer_metrics.items()], dtype=np.intp)
+	lengths = lengths[lengths > 0]
+	if len(records) == 0:
+		return [(window.label, []) for window in windows if window.label not in AnswerRecord.labels]
+	starts = np.cumsum(lengths) - lengths #where each student's answers start
+	ends = starts + lengths - 1 #where they end (inclusive)
+	student = np.repeat(np.arange(len(lengths)), lengths) #which student each answer is from
+	index = np.arange(len(records))
+
+	#Each column is kept as the original values, and as a float array to work with
+	originals = {}
+	def column(label):
+		if label not in columns:
+			originals[label] = [record[label] for record in records]
+			columns[label] = np.array(originals[label], dtype=float)
+		return columns[label]
+	columns = {}
+	def integral(label):
+		column(label)
+		return all(isinstance(value, (int, long)) for value in originals[label])
+	changed = {} #label -> the new values, as Python values
+
+	#These are added up one by one in plain Python, so they come out exactly as they always have
+	def studentAverages(values):
+		return [sum(values[start:end + 1]) / max(length - 1, 1) for start, end, length in zip(starts.tolist(), ends.tolist(), lengths.tolist())]
+
+	#Look-back windows first, since look-ahead windows can use them
+	for window in sorted(windows, key=lambda window: window.ahead):
+		values = column(window.source)
+		prefix = np.concatenate(([0], np.cumsum(values)))
+		if window.ahead:
+			low = index + 1
+			high = np.minimum(index + window.width, ends[student])
+		else:
+			low = np.maximum(index - (window.width - 1), starts[student])
+			high = index
+		sums = prefix[high + 1] - prefix[low]
+		counts = high + 1 - low
+		with np.errstate(divide="ignore", invalid="ignore"):
+			result = sums / counts if window.reduce == "mean" else sums
+		#Sums of whole numbers stay whole numbers, and so does the mean of just one
+		new_values = result.tolist()
+		if integral(window.source):
+			for i in np.flatnonzero((counts == 1) if window.reduce == "mean" else (counts > 0)).tolist():
+				new_values[i] = int(new_values[i])
+		if window.ahead:
+			if window.back_label is not None:
+				full = np.flatnonzero(counts == window.width)
+				result[full] = column(window.back_label)[full + window.width]
+				back_values = changed.get(window.back_label, originals[window.back_label])
+				for i in full.tolist():
+					new_values[i] = back_values[i + window.width]
+			#Fill in each student's last answer with the average of the rest
+			for i in ends.tolist():
+				new_values[i] = 0
+			averages = studentAverages(new_values)
+			result[ends] = averages
+			for i, average in zip(ends.tolist(), averages):
+				new_values[i] = average
+			if window.back_label is not None:
+				back_values = list(changed.get(window.back_label, originals[window.back_label]))
+				for i, average in zip(starts.tolist(), averages):
+					back_values[i] = average
+				changed[window.back_label] = back_values
+		columns[window.label] = result
+		changed[window.label] = new_values
+
+	#The first answer's LastIncorrectAttempts is filled in too
+	column("LastIncorrectAttempts")
+	last_incorrect_attempts = list(originals["LastIncorrectAttempts"])
+	averages = studentAverages(last_incorrect_attempts)
+	for i, average in zip(starts.tolist(), averages):
+		last_incorrect_attempts[i] = average
+	changed["LastIncorrectAttempts"] = last_incorrect_attempts
+
+	for label, new_values in changed.items():
+		if label in AnswerRecord.labels:
+			for record, value in zip(records, new_values):
+				record[label] = value
+	return [(window.label, changed[window.label]) for window in windows if window.label not in AnswerRecord.labels]
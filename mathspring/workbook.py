@@ -0,0 +1,79 @@
+#Writing everything out as an Excel workbook, or as CSV/TSV files or a SQLite database (see export.py)
+#xlsxwriter is only imported once an Excel workbook is actually created
+from itertools import chain, izip
+from mathspring import export
+from mathspring.eventlog import generated_headers
+from mathspring.records import AnswerRecord, EmotionRecord
+
+class StudyWorkbook(object):
+	def __init__(self, output_file, output_format="xlsx", streaming=True):
+		self.output_file = export.outputPath(output_file, output_format)
+		self.export = export.openExport(self.output_file, output_format, streaming)
+		self.eventlog_table = None
+		self.rows_written = 0 #for the instrumentation
+
+	#The eventlog table has to be the first one, and a streamed event log gets written into it while it's processed
+	def startEventlog(self, eventlog_headers):
+		self.eventlog_table = self.export.addTable("eventlog", generated_headers + tuple(eventlog_headers))
+
+	#Row i of the event log, with its generated columns put in front of it as it's written; rows have to be written in order
+	def writeEventlogRow(self, i, event_type, unique_end_prob, row):
+		self.eventlog_table.writeRow(chain((event_type, unique_end_prob, i), row))
+		self.rows_written += 1
+
+	def writeTable(self, name, headers, rows):
+		table = self.export.addTable(name, headers)
+		for row in rows:
+			table.writeRow(row)
+			self.rows_written += 1
+
+	#This one is laid out with a column per group and test, so it's written as the rows of that
+	def writePrepostSummary(self, prepost_by_group, pedagogy_group_order, category_order):
+		test_labels = ("pretest", "posttest", "difference")
+		groups = [group for group in pedagogy_group_order for i in range(3)]
+		table = self.export.addTable("prepostsummary", ["Group"] + groups)
+		table.writeRow(["Test"] + [test_labels[i] for group in pedagogy_group_order for i in range(3)], True)
+		for category in category_order:
+			table.writeRow([category] + [prepost_by_group[group][category][i] for group in pedagogy_group_order for i in range(3)],
+				[True] + [i == 2 for group in pedagogy_group_order for i in range(3)])
+		self.rows_written += 1 + len(category_order)
+
+	def writeStudentMetrics(self, student_metrics, category_order):
+		student_metric_labels = ["Pedagogy",
+			"Total Messages", "Empathy Messages", "GrowthMindset Messages", "SuccessFailure Messages"]
+		for message_type in ("Empathy", "GrowthMindset", "SuccessFailure"):
+			student_metric_labels.append("%" + message_type + " Messages")
+		student_metric_labels += ["TimeInTutor", "CorrectTotal", "IncorrectTotal", "NumHints", "AvgProblemDifficulty", "TotalIncorrectAttempts"]
+		exclude_prepost = set(("NormalizedLearningGain", "LearningGain"))
+		for category in category_order:
+			if category not in exclude_prepost:
+				for test_type in ("pretest", "posttest"):
+					student_metric_labels.append(str(test_type + " " + category))
+		student_metric_labels.append("LearningGain")
+		student_metric_labels.append("NormalizedLearningGain")
+		student_metric_labels.append("LearningEstimation")
+
+		#Missing metrics are written as 0, without adding them to the (defaultdict) metrics, which later stages still read
+		self.writeTable("studentmetrics", ["StudentId"] + student_metric_labels,
+			([student] + [metrics.get(label, 0) for label in student_metric_labels] for student,metrics in student_metrics.items()))
+
+	#extra_columns are any more (label, values) columns to add on the end, e.g. from answer windows
+	def writeAnswerMetrics(self, student_timeseries_answer_metrics, extra_columns=()):
+		getRow = AnswerRecord.getter(AnswerRecord.labels)
+		rows = (getRow(answer_metric) for _,answer_metrics in student_timeseries_answer_metrics.items() for answer_metric in answer_metrics)
+		if extra_columns:
+			rows = (row + extra for row, extra in izip(rows, izip(*[values for _,values in extra_columns])))
+		self.writeTable("studentanswermetrics", AnswerRecord.labels + tuple(label for label,_ in extra_columns), rows)
+
+	def writeEmotionMetrics(self, student_timeseries_emotion_metrics):
+		for emotion in ("Confidence", "Frustration"):
+			student_emotion_metric_labels = ["studId", "Pedagogy", emotion, "AvgProblemDifficulty", "CorrectTotal",
+				"IncorrectTotal", "Empathy Messages", "GrowthMindset Messages", "SuccessFailure Messages"]
+			getRow = EmotionRecord.getter(student_emotion_metric_labels)
+			self.writeTable("student" + emotion.lower() + "metrics", student_emotion_metric_labels,
+				(getRow(emotion_metric) for _,emotion_metrics in student_timeseries_emotion_metrics.items() for emotion_metric in emotion_metrics[emotion]))
+
+	#Save what we've written
+	def close(self):
+		print "Writing " + self.output_file + "..."
+		self.export.close()
@@ -0,0 +1,19 @@
+import os, sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mathspring import synthetic
+
+#A small made-up study in a SQLite database (see synthetic.py), shared by the tests that need one
+@pytest.fixture(scope="session")
+def study_path(tmpdir_factory):
+	path = str(tmpdir_factory.mktemp("study").join("study.sqlite"))
+	synthetic.generate(path, 20, seed=4)
+	return path
+
+#The study's settings, with its cache in a folder of its own for each test
+@pytest.fixture
+def study_config(study_path, tmpdir):
+	return synthetic.studyConfig(study_path, data_folder=str(tmpdir.join("data")), output_file=str(tmpdir.join("study.xlsx")),
+		checkpoints=False, permutations=0)
@@ -0,0 +1,36 @@
+import os, random
+from mathspring import externalsort
+
+def rowsToSort(num_rows, seed):
+	rand = random.Random(seed)
+	return [[rand.randint(0, 20), "row %d" % i] for i in range(num_rows)]
+
+def key(row):
+	return (row[0],)
+
+#Rows with the same key come out in the order they went in, like sorted()
+def test_spilled_runs_merge_in_order(tmpdir):
+	rows = rowsToSort(500, 1)
+	sorter = externalsort.ExternalSorter(key, 0.01, str(tmpdir))
+	sorter.extend(rows)
+	assert len(sorter.runs) > 1
+	assert list(sorter.sorted()) == sorted(rows, key=key)
+	assert not os.path.exists(sorter.folder)
+
+def test_runs_past_max_open_runs_are_merged_in_groups_first(tmpdir):
+	rows = rowsToSort(2000, 2)
+	sorter = externalsort.ExternalSorter(key, 0.005, str(tmpdir), max_open_runs=3)
+	sorter.extend(rows)
+	sorter.spill()
+	num_runs = len(sorter.runs)
+	assert num_runs > 9 #enough for two rounds of merging
+	assert list(sorter.sorted()) == sorted(rows, key=key)
+	assert sorter.num_run_files > num_runs
+	assert os.listdir(str(tmpdir)) == []
+
+def test_nothing_is_written_if_it_fits_in_memory(tmpdir):
+	rows = rowsToSort(50, 3)
+	sorter = externalsort.ExternalSorter(key, 16, str(tmpdir))
+	sorter.extend(rows)
+	assert list(sorter.sorted()) == sorted(rows, key=key)
+	assert sorter.num_run_files == 0
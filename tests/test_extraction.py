@@ -0,0 +1,67 @@
+import os
+import pytest
+from mathspring import database, extraction, pipeline
+
+class Interrupted(Exception):
+	pass
+
+def connect(config):
+	db = database.Database(config)
+	db.connect()
+	student_ids = [row[0] for row in db.runQuery(pipeline.studentQuery(config))]
+	return db, student_ids
+
+#The same plan the load stage makes for the config
+def makePlan(config, student_ids):
+	return extraction.ExtractionPlan("SELECT * FROM eventlog", student_ids, config.time_ranges, config.extraction_chunk_students,
+		config.extraction_chunk_days, config.extraction_page_rows)
+
+@pytest.fixture
+def chunked_config(study_config):
+	study_config.chunked_extraction = True
+	study_config.extraction_chunk_students = 5
+	study_config.extraction_chunk_days = 1
+	return study_config
+
+#Counts the queries db runs, and stops it with Interrupted once it's run stop_after of them
+def countQueries(db, stop_after=None):
+	execute = db.execute
+	queries = []
+	def counted(q):
+		if stop_after is not None and len(queries) == stop_after:
+			raise Interrupted()
+		queries.append(q)
+		return execute(q)
+	db.execute = counted
+	return queries
+
+def test_interrupted_pull_only_fetches_the_rest(chunked_config):
+	db, student_ids = connect(chunked_config)
+	headers = db.getHeaders("eventlog")[0]
+	plan = makePlan(chunked_config, student_ids)
+	expected = db.runQuery("SELECT * FROM eventlog " + pipeline.eventlogConditions(chunked_config, student_ids) + " ORDER BY studId, time, id")
+	num_chunks = len(plan.chunks)
+	assert num_chunks > 3
+
+	num_before = 3
+	countQueries(db, stop_after=num_before)
+	with pytest.raises(Interrupted):
+		extraction.extract(db, plan, headers)
+
+	db, student_ids = connect(chunked_config)
+	queries = countQueries(db)
+	rows, names = extraction.extract(db, plan, headers)
+	assert len(queries) == num_chunks - num_before #one page for each chunk that wasn't done
+	assert [list(row) for row in rows] == [list(row) for row in expected]
+	assert names == list(headers)
+	#the chunks are kept until the result is cached
+	assert os.path.exists(extraction.progressFolder(db, plan))
+
+def test_load_removes_the_chunks_once_cached(chunked_config):
+	loaded = pipeline.Pipeline(chunked_config)
+	loaded.run(["load"])
+	db, student_ids = connect(chunked_config)
+	plan = makePlan(chunked_config, student_ids)
+	assert not os.path.exists(extraction.progressFolder(db, plan))
+	assert db.findCached("eventlog", plan.key()) is not None
+	assert len(loaded.eventlog) > 0
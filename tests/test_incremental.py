@@ -0,0 +1,62 @@
+import shutil, sqlite3
+from datetime import datetime, timedelta
+from mathspring import incremental, pipeline, synthetic
+
+#Adds a practice problem (on a problem the first pull never saw) after the newest event log row, and a posttest answer
+def addRows(path):
+	connection = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES)
+	cursor = connection.execute("SELECT * FROM eventlog ORDER BY id DESC LIMIT 1")
+	h = {column[0]: c for c,column in enumerate(cursor.description)}
+	last = cursor.fetchone()
+	connection.execute("INSERT INTO problem VALUES (9999, 0.5)")
+	for k, action in enumerate(("BeginProblem", "Attempt", "EndProblem")):
+		row = list(last)
+		row[h["id"]] += 1 + k
+		row[h["time"]] += timedelta(seconds=10 * (k + 1))
+		row[h["action"]], row[h["activityName"]], row[h["problemId"]] = action, "practice", 9999
+		row[h["isCorrect"]] = 1 if action == "Attempt" else None
+		row[h["emotion"]] = row[h["userInput"]] = None
+		connection.execute("INSERT INTO eventlog VALUES (%s)" % ",".join("?" * len(row)), row)
+	cursor = connection.execute("SELECT * FROM preposttestdata WHERE studId = ? LIMIT 1", (last[h["studId"]],))
+	names = [column[0] for column in cursor.description]
+	row = list(cursor.fetchone())
+	row[names.index("probId")], row[names.index("testType")], row[names.index("seqNum")] = 176, "posttest", 99
+	connection.execute("INSERT INTO preposttestdata VALUES (%s)" % ",".join("?" * len(row)), row)
+	connection.commit()
+	connection.close()
+
+def test_refresh_gets_new_problems_and_prepost_rows(study_path, tmpdir):
+	path = str(tmpdir.join("study.sqlite"))
+	shutil.copy(study_path, path)
+	config = synthetic.studyConfig(path, data_folder=str(tmpdir.join("data")), output_file=str(tmpdir.join("study.xlsx")),
+		incremental_eventlog=True, checkpoints=False, permutations=0)
+	first = pipeline.Pipeline(config)
+	first.run(["workbook"])
+	assert 9999 not in first.problem_difficulty
+
+	addRows(path)
+	refresh = pipeline.Pipeline(config)
+	refresh.run(["load"])
+	#just the added rows, and none of the ones the other students already had after the lowest high-water id
+	assert [row[refresh.eventlog_h["problemId"]] for row in refresh.eventlog] == [9999, 9999, 9999]
+	assert refresh.problem_difficulty[9999] == 0.5
+	refresh.run(["workbook"])
+	assert refresh.eventlog_store.num_rows == first.eventlog_store.num_rows + 3
+	assert len(refresh.preposttestdata) == len(first.preposttestdata) + 1
+
+#A later segment's rows for a student come after the ones that student already had, and everything is in studId order
+def test_segments_merge_by_student(tmpdir):
+	store = incremental.IncrementalEventlog(str(tmpdir.join("store")), 0, 1, 2)
+	def addRows(rows):
+		derived = store.addSegment(rows, ("studId", "time", "id"))
+		for row in rows:
+			derived.append(("Event %d" % row[2], row[2]))
+		derived.close()
+	addRows([[1, datetime(2016, 12, 1, 9), 1], [1, datetime(2016, 12, 1, 10), 3], [3, datetime(2016, 12, 1, 9), 2]])
+	addRows([[1, datetime(2016, 12, 1, 11), 5], [2, datetime(2016, 12, 1, 11), 4], [3, datetime(2016, 12, 1, 11), 6]])
+	assert store.marks[1] == (datetime(2016, 12, 1, 11), 5)
+	merged = [(row[2], tuple(derived)) for row, derived in store.iterMerged()]
+	assert merged == [(i, ("Event %d" % i, i)) for i in (1, 3, 5, 4, 2, 6)]
+	assert store.newRowsCondition() == "id > 4"
+	assert store.newRows([[1, datetime(2016, 12, 1, 11), 5], [1, datetime(2016, 12, 1, 12), 7], [4, datetime(2016, 12, 1, 9), 8]]) \
+		== [[1, datetime(2016, 12, 1, 12), 7], [4, datetime(2016, 12, 1, 9), 8]]
@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+from mathspring import markov, pipeline, synthetic
+
+def test_empty_rows_are_reported_not_nan(capsys):
+	counts = np.array([[5, 3], [0, 0]])
+	models = {emotion: {model_name: counts for model_name in markov.message_types} for emotion in markov.emotions}
+	markov.fitModels(models, 0.01)
+	output = capsys.readouterr()[0]
+	assert "No transitions from state 1" in output
+	assert "nan" not in output.lower()
+	assert markov.emptyRows(counts).tolist() == [False, True]
+	#the log-likelihood only uses the transitions that happened
+	assert np.isfinite(markov.logLikelihood(counts, markov.smoothedProbabilities(counts, 0.01)))
+
+#Every pedagogy group has transitions out of both states of both emotions, even in the seeds that used to leave some out
+@pytest.mark.parametrize("seed", [3, 5, 7])
+def test_synthetic_studies_have_every_transition(seed, tmpdir):
+	path = str(tmpdir.join("study.sqlite"))
+	synthetic.generate(path, 60, seed)
+	study = pipeline.Pipeline(synthetic.studyConfig(path, checkpoints=False))
+	study.run(("load", "enrich", "prepost"))
+	for emotion, transitions in study.emotionTransitions().items():
+		by_pedagogy = markov.countTransitions(transitions, transitions.pedagogies, len(markov.pedagogy_types))
+		assert not markov.emptyRows(by_pedagogy).any(), emotion
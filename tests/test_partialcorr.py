@@ -0,0 +1,30 @@
+import numpy as np
+from mathspring import partialcorr
+
+def controlsFor(num_outcomes, num_students, rand):
+	return np.array([np.column_stack([np.ones(num_students), rand.rand(num_students)]) for _ in range(num_outcomes)])
+
+def test_matches_correlating_the_residuals():
+	rand = np.random.RandomState(1)
+	predictors = rand.rand(30, 2)
+	outcomes = rand.rand(30, 1)
+	controls = controlsFor(1, 30, rand)
+	correlations, p, counts = partialcorr.partialCorrelations(predictors, outcomes, controls)
+	z = controls[0]
+	def residuals(y):
+		return y - z.dot(np.linalg.lstsq(z, y, rcond=None)[0])
+	for a in range(2):
+		expected = np.corrcoef(residuals(predictors[:, a]), residuals(outcomes[:, 0]))[0, 1]
+		assert abs(correlations[0, a] - expected) < 1e-9
+	assert counts[0] == 30
+
+def test_too_few_students_or_no_variation_is_nan():
+	rand = np.random.RandomState(2)
+	predictors = rand.rand(10, 2)
+	predictors[:, 1] = 1 #nothing left of this one after the intercept
+	outcomes = rand.rand(10, 2)
+	outcomes[2:, 0] = np.nan #only 2 students have the first outcome
+	correlations, p, counts = partialcorr.partialCorrelations(predictors, outcomes, controlsFor(2, 10, rand))
+	assert counts.tolist() == [2, 10]
+	assert np.all(np.isnan(correlations[0])) and np.all(np.isnan(p[0]))
+	assert np.isfinite(correlations[1, 0]) and np.isnan(correlations[1, 1])
@@ -0,0 +1,34 @@
+from mathspring import querycache
+
+#Writes a result of the given size for q, and adds it to the cache at the given time
+def addResult(cache, monkeypatch, name, q, size, now):
+	monkeypatch.setattr(querycache.time, "time", lambda: now)
+	with open(cache.entryPath(q, "pickle"), 'wb') as f:
+		f.write("x" * size)
+	cache.add(name, q, "pickle")
+
+def test_least_recently_used_results_are_evicted(tmpdir, monkeypatch):
+	cache = querycache.QueryCache(str(tmpdir), max_bytes=250)
+	addResult(cache, monkeypatch, "a", "SELECT a", 100, 1)
+	addResult(cache, monkeypatch, "b", "SELECT b", 100, 2)
+	monkeypatch.setattr(querycache.time, "time", lambda: 3)
+	assert cache.find("a", "SELECT a") is not None #a is now newer than b
+	addResult(cache, monkeypatch, "c", "SELECT c", 100, 4)
+	assert cache.evicted == ["b"]
+	assert cache.find("b", "SELECT b") is None
+	assert cache.totalSize() == 200
+	#the manifest is what the next run sees
+	assert sorted(entry["name"] for entry in querycache.QueryCache(str(tmpdir)).entries.values()) == ["a", "c"]
+
+def test_the_result_just_added_is_kept_even_over_the_limit(tmpdir, monkeypatch):
+	cache = querycache.QueryCache(str(tmpdir), max_bytes=150)
+	addResult(cache, monkeypatch, "a", "SELECT a", 100, 1)
+	addResult(cache, monkeypatch, "big", "SELECT big", 300, 2)
+	assert cache.evicted == ["a"]
+	assert cache.find("big", "SELECT big") is not None
+
+def test_params_keep_results_apart(tmpdir):
+	one = querycache.QueryCache(str(tmpdir), params=("db1",))
+	other = querycache.QueryCache(str(tmpdir), params=("db2",))
+	assert one.key("SELECT a") != other.key("SELECT a")
+	assert one.key("SELECT a") == querycache.QueryCache(str(tmpdir), params=("db1",)).key("SELECT a")
@@ -0,0 +1,23 @@
+import pickle
+import pytest
+from mathspring.records import AnswerRecord, EmotionRecord
+
+#Every field starts at 0 like the defaultdict(int)s these replace, but a label that isn't a field is a KeyError
+def test_fields_start_at_zero():
+	record = AnswerRecord()
+	assert record["Last Problem Empathy"] == 0
+	assert all(record[label] == 0 for label in AnswerRecord.labels)
+
+def test_unknown_labels_are_key_errors():
+	record = EmotionRecord()
+	with pytest.raises(KeyError):
+		record["Last Problem Empathy"]
+	with pytest.raises(KeyError):
+		record["Confusion"] = 3
+
+def test_getter_and_pickling():
+	record = EmotionRecord.fromDict({"studId": 40001, "Pedagogy": "Empathy", "Confidence": 4, "Empathy Messages": 2})
+	assert EmotionRecord.getter(["Confidence", "Empathy Messages"])(record) == (4, 2)
+	assert EmotionRecord.getter(["Frustration"])(record) == (0,)
+	copy = pickle.loads(pickle.dumps(record, pickle.HIGHEST_PROTOCOL))
+	assert [copy[label] for label in EmotionRecord.labels] == [record[label] for label in EmotionRecord.labels]
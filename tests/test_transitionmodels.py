@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+from scipy.stats.distributions import chi2
+from mathspring import transitionmodels
+from mathspring.markov import emotions, pedagogy_types
+from mathspring.records import EmotionRecord
+
+#Made-up self-reports: student -> emotion -> their reports in order
+def emotionMetrics(num_students, num_reports, seed):
+	rand = np.random.RandomState(seed)
+	metrics = {}
+	for studId in range(num_students):
+		pedagogy = pedagogy_types[studId % len(pedagogy_types)]
+		metrics[studId] = {emotion: [EmotionRecord.fromDict({"studId": studId, "Pedagogy": pedagogy, emotion: rand.randint(1, 6)})
+									 for _ in range(num_reports)] for emotion in emotions}
+	return metrics
+
+#Each model has k-1 free probabilities for each of its k^n histories, so the pedagogy test has 2 extra models' worth
+# and each message test has one
+@pytest.mark.parametrize("levels,order", [((1, 1, 0, 0, 0), 1), ((0, 1, 2, 3, 4), 1), ((0, 0, 1, 2, 2), 2)])
+def test_likelihood_ratio_degrees_of_freedom(levels, order):
+	fitted, p_values = transitionmodels.fitModels(emotionMetrics(30, 12, 1), levels, order, 0.01)
+	num_states = max(levels) + 1
+	parameters = num_states ** order * (num_states - 1)
+	for emotion in emotions:
+		combined = fitted[emotion]["Combined"][0]
+		by_pedagogy = [fitted[emotion][("pedagogy", pedagogy)][0] for pedagogy in pedagogy_types]
+		likelihood_ratio = 2 * (sum(model.logLikelihood(model.counts) for model in by_pedagogy) - combined.logLikelihood(combined.counts))
+		assert abs(p_values[(emotion, "pedagogy")] - chi2.sf(likelihood_ratio, 2 * parameters)) < 1e-12
+		for message_type in pedagogy_types:
+			model = fitted[emotion][("message", message_type)][0]
+			likelihood_ratio = 2 * (model.logLikelihood(model.counts) - combined.logLikelihood(model.counts))
+			assert abs(p_values[(emotion, message_type)] - chi2.sf(likelihood_ratio, parameters)) < 1e-12